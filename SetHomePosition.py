@@ -1,6 +1,8 @@
 from pymavlink import mavutil
 import time
 
+from stream_scheduler import stream_scheduler
+
 
 # Константы
 
@@ -92,9 +94,12 @@ def set_home_position_to_fc(master, lat, lon, alt):
     print(f"Домашняя позиция отправлена в FC: Lat: {lat}, Lon: {lon}, Alt: {alt}м")
 
 
-def set_home_position_to_gps(master, lat, lon, alt):
-    """Дополнительно: отправляем GPS координаты для контекста"""
-    for i in range(10):
+def set_home_position_to_gps(master, lat, lon, alt, rate_hz=10, count=10):
+    """
+    Дополнительно: отправляем GPS координаты для контекста.
+    Отправка идёт в фоне потоком планировщика; вернуть Stream, чтобы при желании дождаться: stream.wait()
+    """
+    def send_gps():
         master.mav.gps_raw_int_send(
             int(time.time() * 1000000), # time_usec
             3,                          # fix_type: 3=3D fix
@@ -107,8 +112,9 @@ def set_home_position_to_gps(master, lat, lon, alt):
             0,                          # cog
             10                          # satellites_visible
         )
-        time.sleep(0.1)
-        print(f"Домашняя позиция отправлена в GPS: Lat: {lat}, Lon: {lon}, Alt: {alt}м")
+    stream = stream_scheduler.add(send_gps, rate_hz, count=count, owner=master, name="GPS_RAW_INT")
+    print(f"Домашняя позиция отправляется в GPS: Lat: {lat}, Lon: {lon}, Alt: {alt}м")
+    return stream
 
 
 def connect_to_autopilot(connection_string):
@@ -151,7 +157,7 @@ def main(connection_string, home_position):
     #set_home_position_to_fc(master, **home_position)
 
     # Дополнительно: отправляем GPS координаты для контекста
-    #set_home_position_to_gps(master, **home_position)
+    #set_home_position_to_gps(master, **home_position).wait()
     '''
     try:
         while True:
@@ -0,0 +1,327 @@
+# async_control.py
+
+import asyncio
+from typing import List, Optional
+
+from pymavlink import mavutil
+
+from drone_state import DroneState, TelemetryStore
+from flight_control import (
+    TARGET_SYSTEM, TARGET_COMPONENT, start_gcs_heartbeat, start_gps_injection, start_home_announcements
+)
+from mavlink_reader import ALL_TYPES, MessageTypes, normalize_types, find_reader, get_reader
+from mission_control import MissionItem
+from mission_sync import VehicleMissionState, mission_sync
+from mission_transfer import MissionDownloader, MissionUploader, MissionTransferError, TransferStats
+from stream_scheduler import stream_scheduler
+from tlog_replay import open_connection
+
+
+class AsyncSubscription:
+    """
+    Подписка на сообщения заданных типов для asyncio.
+    Аналог mavlink_reader.Subscription, но get() - корутина.
+    """
+
+    def __init__(self, link: "AsyncMavlink", types: MessageTypes):
+        self.link = link
+        self.types = normalize_types(types)
+        self.queue = asyncio.Queue()
+
+    async def get(self, timeout: Optional[float] = None, condition=None):
+        """
+        Ждёт следующее сообщение, для которого condition(msg) истинно.
+        Возвращает None по таймауту.
+        """
+        loop = asyncio.get_running_loop()
+        end_time = None if timeout is None else loop.time() + timeout
+        while True:
+            remaining = None
+            if end_time is not None:
+                remaining = end_time - loop.time()
+                if remaining <= 0:
+                    return None
+            try:
+                msg = await asyncio.wait_for(self.queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            if condition is None or condition(msg):
+                return msg
+
+    def close(self) -> None:
+        self.link.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncMavlink:
+    """
+    Asyncio-транспорт поверх pymavlink соединения.
+    Если у соединения есть файловый дескриптор (TCP/UDP/Serial в Linux),
+    сокет читается прямо в цикле событий через loop.add_reader() - без потоков.
+    Иначе (Windows Proactor, уже запущенный MavlinkReader) сообщения берутся
+    из потока чтения и передаются в цикл через call_soon_threadsafe().
+    """
+
+    def __init__(self, master: mavutil.mavlink_connection):
+        self.master = master
+        self._loop = None
+        self._subscriptions = {}
+        self._fd = None
+        self._thread_reader = None
+        # Телеметрия заполняется здесь же, в цикле событий, без отдельных callback потока чтения
+        self.telemetry = TelemetryStore(master)
+
+    @property
+    def state(self) -> DroneState:
+        return self.telemetry.state
+
+    @property
+    def mav(self):
+        return self.master.mav
+
+    @property
+    def target_system(self):
+        return self.master.target_system
+
+    @property
+    def target_component(self):
+        return self.master.target_component
+
+    def start(self) -> None:
+        """Подключает соединение к текущему циклу событий"""
+        self._loop = asyncio.get_running_loop()
+
+        # Сокет может читать только кто-то один: если поток чтения уже есть, работаем через него
+        thread_reader = find_reader(self.master)
+        if thread_reader is None and self.master.fd is not None:
+            try:
+                self._loop.add_reader(self.master.fd, self._on_readable)
+                self._fd = self.master.fd
+                return
+            except (NotImplementedError, ValueError, OSError):
+                pass
+
+        self._thread_reader = thread_reader or get_reader(self.master)
+        self._thread_reader.add_callback(self._on_thread_message)
+
+    def close(self) -> None:
+        """Отключает соединение от цикла событий (сам сокет не закрывается)"""
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._fd = None
+        if self._thread_reader is not None:
+            self._thread_reader.remove_callback(self._on_thread_message)
+            self._thread_reader = None
+
+    def subscribe(self, types: MessageTypes = ALL_TYPES) -> AsyncSubscription:
+        subscription = AsyncSubscription(self, types)
+        for key in subscription.types:
+            self._subscriptions.setdefault(key, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: AsyncSubscription) -> None:
+        for key in subscription.types:
+            subs = self._subscriptions.get(key, [])
+            if subscription in subs:
+                subs.remove(subscription)
+
+    def dispatch(self, msg) -> None:
+        msg_type = msg.get_type()
+        if msg_type == 'BAD_DATA':
+            return
+        self.telemetry.handle(msg)
+        for subscription in self._subscriptions.get(msg_type, []) + self._subscriptions.get(ALL_TYPES, []):
+            subscription.queue.put_nowait(msg)
+
+    def _on_readable(self) -> None:
+        # Вычитываем всё, что уже пришло: в буфере может быть несколько пакетов
+        while True:
+            try:
+                msg = self.master.recv_msg()
+            except Exception as e:
+                print(f"Ошибка чтения MAVLink: {e}")
+                return
+            if msg is None:
+                return
+            self.dispatch(msg)
+
+    def _on_thread_message(self, msg) -> None:
+        self._loop.call_soon_threadsafe(self.dispatch, msg)
+
+
+async def connect_to_ardupilot(connection_string, target_system=TARGET_SYSTEM, target_component=TARGET_COMPONENT,
+                               timeout: float = 1.0) -> Optional[AsyncMavlink]:
+    """Подключение к ArduPilot (asyncio)"""
+    print(f"Подключаемся к ArduPilot по адресу: {connection_string} ...")
+
+    # Само создание TCP соединения блокирующее (с повторами), поэтому выносим его из цикла событий
+    loop = asyncio.get_running_loop()
+    master = await loop.run_in_executor(
+        None, lambda: open_connection(connection_string, source_system=target_system, source_component=target_component))
+
+    link = AsyncMavlink(master)
+    link.start()
+
+    # Ждем ответа
+    with link.subscribe('HEARTBEAT') as heartbeats:
+        result = await heartbeats.get(timeout=timeout, condition=master.probably_vehicle_heartbeat)
+    if result is None:  # None будет в случае таймаута
+        print("Ошибка подключения к ArduPilot!")
+        link.close()
+        master.close()
+        return None
+    print(f"Подключились к ArduPilot системе {master.target_system}, компонент {master.target_component}")
+    start_gcs_heartbeat(master)
+
+    return link
+
+
+async def disconnect_from_ardupilot(link: AsyncMavlink) -> None:
+    stream_scheduler.cancel_owner(link.master)
+    link.close()
+    link.master.close()
+
+
+async def send_command_long(link: AsyncMavlink, command: int, *params: float, timeout: float = 5.0) -> Optional[int]:
+    """
+    Отправляет COMMAND_LONG и ждёт COMMAND_ACK на эту команду.
+    Возвращает MAV_RESULT или None, если ACK не пришёл.
+    """
+    params = (list(params) + [0] * 7)[:7]
+    with link.subscribe('COMMAND_ACK') as acks:
+        link.mav.command_long_send(link.target_system, link.target_component, command, 0, *params)
+        msg = await acks.get(timeout=timeout, condition=lambda m: m.command == command)
+    return None if msg is None else msg.result
+
+
+async def set_home(link: AsyncMavlink, lat, lon, alt, timeout=5) -> bool:
+    result = False
+    print(f"Устанавливаем новые координаты Home.")
+    # Команда установки home (param1=0 для specific location)
+    ack = await send_command_long(link, mavutil.mavlink.MAV_CMD_DO_SET_HOME,
+                                  0, 0, 0, 0, lat, lon, alt, timeout=timeout)
+    if ack is None:
+        print("Нет ответа ACK!")
+    elif ack == mavutil.mavlink.MAV_RESULT_ACCEPTED:
+        print("Новые координаты Home установились успешно!")
+        result = True
+    else:
+        print(f"Ошибка при установки Home = {ack}")
+
+    # Дополнительно: HOME_POSITION и GPS координаты отправляет поток планировщика
+    start_home_announcements(link.master, lat, lon, alt)
+    start_gps_injection(link.master, lat, lon, alt)
+
+    return result
+
+
+async def set_mode(link: AsyncMavlink, mode_name: str, timeout: float = 5.0) -> bool:
+    """
+    Смена режима полёта через SET_MODE (asyncio).
+    Возвращает True, если HEARTBEAT автопилота подтвердил новый режим.
+    """
+    mode_mapping = link.master.mode_mapping()
+    if mode_mapping is None or mode_name not in mode_mapping:
+        raise ValueError(f"Режим {mode_name} недоступен в mode_mapping()")
+
+    mode_id = mode_mapping[mode_name]
+
+    with link.subscribe('HEARTBEAT') as heartbeats:
+        link.mav.set_mode_send(
+            link.target_system,
+            mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED,
+            mode_id
+        )
+        msg = await heartbeats.get(timeout=timeout,
+                                   condition=lambda m: m.get_srcSystem() == link.target_system
+                                                       and m.custom_mode == mode_id)
+    if msg is None:
+        print(f"Автопилот не подтвердил режим {mode_name}!")
+        return False
+    return True
+
+
+async def set_mode_guided(link: AsyncMavlink) -> bool:
+    return await set_mode(link, "GUIDED")
+
+
+async def set_mode_auto(link: AsyncMavlink) -> bool:
+    return await set_mode(link, "AUTO")
+
+
+async def send_command_arm(link: AsyncMavlink, force: bool = False, timeout: float = 5.0) -> Optional[int]:
+    """ARM двигателей, возвращает MAV_RESULT из COMMAND_ACK"""
+    return await send_command_long(link, mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+                                   1, 0 if not force else 21196, timeout=timeout)
+
+
+async def send_command_disarm(link: AsyncMavlink, force: bool = False, timeout: float = 5.0) -> Optional[int]:
+    """DISARM двигателей, возвращает MAV_RESULT из COMMAND_ACK"""
+    return await send_command_long(link, mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM,
+                                   0, 0 if not force else 21196, timeout=timeout)
+
+
+async def send_command_takeoff(link: AsyncMavlink, alt_m: float, timeout: float = 5.0) -> Optional[int]:
+    """Взлёт до alt_m (Copter уже в GUIDED и ARM), возвращает MAV_RESULT из COMMAND_ACK"""
+    return await send_command_long(link, mavutil.mavlink.MAV_CMD_NAV_TAKEOFF,
+                                   0, 0, 0, 0, 0, 0, alt_m, timeout=timeout)
+
+
+async def send_command_land(link: AsyncMavlink, timeout: float = 5.0) -> Optional[int]:
+    """Посадка в текущей точке, возвращает MAV_RESULT из COMMAND_ACK"""
+    return await send_command_long(link, mavutil.mavlink.MAV_CMD_NAV_LAND, timeout=timeout)
+
+
+async def run_transfer(link: AsyncMavlink, engine) -> TransferStats:
+    """Asyncio-драйвер конечного автомата передачи миссии (см. mission_transfer.run_transfer)"""
+    with link.subscribe(engine.REPLY_TYPES) as replies:
+        engine.start()
+        while not engine.finished:
+            msg = await replies.get(timeout=engine.time_to_deadline())
+            if msg is not None:
+                engine.handle(msg)
+            engine.poll()
+
+    if engine.error:
+        raise MissionTransferError(engine.error, engine.stats)
+    return engine.stats
+
+
+async def upload_mission(link: AsyncMavlink, items: List[MissionItem],
+                         max_duration: Optional[float] = None) -> TransferStats:
+    """
+    Загрузка миссии по протоколу Mission Protocol (asyncio):
+    MISSION_COUNT -> MISSION_REQUEST_INT/MISSION_ITEM_INT -> MISSION_ACK
+    При неудаче бросает MissionTransferError.
+    """
+    if len(items) == 0:
+        return TransferStats()
+    uploader = MissionUploader(link.master, items, max_duration=max_duration)
+    try:
+        stats = await run_transfer(link, uploader)
+    except MissionTransferError:
+        mission_sync.forget(link.master)
+        raise
+    mission_sync.confirm(link.master, items, uploader.opaque_id)
+    return stats
+
+
+async def download_mission(link: AsyncMavlink, max_duration: Optional[float] = None) -> List[MissionItem]:
+    """
+    Чтение миссии по протоколу Mission Protocol (asyncio):
+    MISSION_REQUEST_LIST -> MISSION_COUNT -> MISSION_REQUEST_INT/MISSION_ITEM_INT -> MISSION_ACK
+    При неудаче бросает MissionTransferError.
+    """
+    def cached(count, opaque_id):
+        return mission_sync.cached_download(link.master, VehicleMissionState(count, opaque_id))
+
+    downloader = MissionDownloader(link.master, max_duration=max_duration,
+                                   item_factory=MissionItem.from_message, cached=cached)
+    await run_transfer(link, downloader)
+    mission_sync.confirm(link.master, downloader.items, downloader.opaque_id)
+    return downloader.items
@@ -0,0 +1,143 @@
+# command_executor.py
+
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Optional
+
+EXECUTOR_WORKERS = 4        # Сколько операций может выполняться одновременно
+RESULT_POLL_MS = 50         # Период опроса очереди результатов из потока Tkinter (мс)
+
+# Тип статуса для StatusBar.set_status, пока операция выполняется
+STATUS_BUSY = "loading"
+
+
+class CommandExecutor:
+    """
+    Выполнение долгих MAVLink операций (кнопки главного окна) в рабочих потоках.
+
+    Потоки не трогают Tkinter: результаты и сообщения о ходе работы складываются
+    в очередь, а поток Tkinter забирает их по after() и передаёт в status_callback
+    (обычно StatusBar.set_status). Кнопка операции блокируется только на время
+    её собственного выполнения, остальные кнопки и карта продолжают работать.
+    """
+
+    def __init__(self, root, status_callback: Callable, max_workers: int = EXECUTOR_WORKERS,
+                 poll_ms: int = RESULT_POLL_MS):
+        self.root = root
+        self.status_callback = status_callback
+        self.poll_ms = poll_ms
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="Command")
+        self._events = queue.Queue()
+        self._running = {}          # имя операции -> Future
+        self._poll_id = None
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._running)
+
+    def is_running(self, name: str) -> bool:
+        return name in self._running
+
+    def submit(self, name: str, func: Callable, *args,
+               button=None, busy_text: Optional[str] = None,
+               success_text: Optional[str] = None, error_text: Optional[str] = None,
+               on_done: Optional[Callable] = None, **kwargs) -> Future:
+        """
+        Запускает func(*args, **kwargs) в рабочем потоке. Вызывать только из потока Tkinter.
+
+        name         - имя операции; пока она выполняется, повторный submit возвращает тот же Future
+        button       - кнопка, которая блокируется на время операции
+        busy_text    - текст статуса при запуске
+        success_text - текст статуса, если func вернула истинное значение (или None)
+        error_text   - текст статуса, если func вернула False или бросила исключение
+        on_done      - on_done(result, error) в потоке Tkinter после завершения
+        """
+        future = self._running.get(name)
+        if future is not None:
+            return future
+
+        if button is not None:
+            button.configure(state="disabled")
+        if busy_text:
+            self.status_callback(busy_text, STATUS_BUSY)
+
+        future = self._pool.submit(func, *args, **kwargs)
+        self._running[name] = future
+        future.add_done_callback(
+            lambda f: self._events.put(("done", name, f, button, success_text, error_text, on_done))
+        )
+        self._schedule_poll()
+        return future
+
+    def report(self, text: str, status_type: str = STATUS_BUSY) -> None:
+        """Сообщение о ходе операции. Можно вызывать из любого потока."""
+        self._events.put(("status", text, status_type))
+        # Из рабочего потока after() не вызываем: опрос уже идёт, пока есть операции
+
+    def wait(self, names: Iterable[str], timeout: float) -> bool:
+        """
+        Ждёт завершения перечисленных операций не дольше timeout секунд.
+        Ещё не начатые операции отменяются. Возвращает True, если все они завершились.
+        """
+        # Отменённый Future считается завершённым только когда до него дойдёт рабочий поток,
+        # поэтому ждём лишь те, что отменить не удалось (уже выполняются)
+        futures = [self._running[name] for name in names if name in self._running]
+        started = [future for future in futures if not future.cancel()]
+        _, not_done = wait(started, timeout=timeout)
+        return not not_done
+
+    def shutdown(self) -> None:
+        """Останавливает опрос очереди; начатые операции дорабатывают в фоне"""
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- поток Tkinter ---
+
+    def _schedule_poll(self) -> None:
+        if self._poll_id is None:
+            self._poll_id = self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self) -> None:
+        self._poll_id = None
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if event[0] == "status":
+                self.status_callback(event[1], event[2])
+            else:
+                self._finish(*event[1:])
+
+        # Опрашиваем очередь только пока есть незавершённые операции
+        if self._running:
+            self._schedule_poll()
+
+    def _finish(self, name, future, button, success_text, error_text, on_done) -> None:
+        self._running.pop(name, None)
+        if button is not None:
+            button.configure(state="normal")
+
+        result = None
+        error = None
+        if future.cancelled():
+            error = "операция отменена"
+        elif future.exception() is not None:
+            error = str(future.exception()) or type(future.exception()).__name__
+            print(f"Ошибка операции {name}: {error}")
+        else:
+            result = future.result()
+
+        if error is not None:
+            if error_text:
+                self.status_callback(f"{error_text}: {error}", "error")
+        elif result is False:
+            if error_text:
+                self.status_callback(error_text, "error")
+        elif success_text:
+            self.status_callback(success_text, "success")
+
+        if on_done is not None:
+            on_done(result, error)
@@ -0,0 +1,296 @@
+# drone_state.py
+
+import threading
+import weakref
+from array import array
+from typing import Optional, Sequence
+
+from pymavlink import mavutil
+
+from mavlink_reader import get_reader
+
+HISTORY_SIZE = 3000     # Сколько последних замеров хранить на каждый тип сообщения (~5 минут при 10 Гц)
+
+SCALE_DEG = 1e7
+SCALE_ALT = 1000
+
+# Поля истории по типам сообщений (всё хранится как float64)
+HISTORY_FIELDS = {
+    'GLOBAL_POSITION_INT': ('lat', 'lon', 'alt', 'relative_alt', 'vx', 'vy', 'vz', 'heading'),
+    'ATTITUDE': ('roll', 'pitch', 'yaw', 'rollspeed', 'pitchspeed', 'yawspeed'),
+    'VFR_HUD': ('airspeed', 'groundspeed', 'climb', 'throttle'),
+    'SYS_STATUS': ('voltage', 'current', 'battery_remaining'),
+}
+
+
+class RingBuffer:
+    """
+    Кольцевой буфер чисел фиксированного размера поверх array.array.
+    Память выделяется один раз, append() не создаёт объектов.
+    """
+
+    __slots__ = ('capacity', '_data', '_next', '_size')
+
+    def __init__(self, capacity: int, typecode: str = 'd'):
+        self.capacity = capacity
+        self._data = array(typecode, bytes(array(typecode).itemsize * capacity))
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, value) -> None:
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def latest(self):
+        if self._size == 0:
+            return None
+        return self._data[self._next - 1]
+
+    def last(self, n: Optional[int] = None) -> array:
+        """Последние n значений (все, если n не задано) от старых к новым"""
+        n = self._size if n is None else min(n, self._size)
+        start = self._next - n
+        if start >= 0:
+            return self._data[start:self._next]
+        return self._data[start:] + self._data[:self._next]
+
+    def clear(self) -> None:
+        self._next = 0
+        self._size = 0
+
+
+class Series:
+    """История одного типа сообщений: время приёма и значения полей с общим индексом"""
+
+    def __init__(self, fields: Sequence[str], capacity: int = HISTORY_SIZE):
+        self.fields = tuple(fields)
+        self.times = RingBuffer(capacity)
+        self._buffers = tuple(RingBuffer(capacity) for _ in self.fields)
+        self._by_name = dict(zip(self.fields, self._buffers))
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, timestamp: float, values: Sequence[float]) -> None:
+        self.times.append(timestamp)
+        for buffer, value in zip(self._buffers, values):
+            buffer.append(value)
+
+    def values(self, field: str, n: Optional[int] = None) -> array:
+        return self._by_name[field].last(n)
+
+    def latest(self, field: str):
+        return self._by_name[field].latest()
+
+    def clear(self) -> None:
+        self.times.clear()
+        for buffer in self._buffers:
+            buffer.clear()
+
+
+class DroneState:
+    """
+    Последнее известное состояние аппарата в удобных единицах.
+    Обновляется на месте из потока чтения, читать можно из любого потока.
+    """
+
+    __slots__ = (
+        'lat', 'lon', 'alt', 'relative_alt', 'vx', 'vy', 'vz', 'heading',
+        'roll', 'pitch', 'yaw',
+        'airspeed', 'groundspeed', 'climb', 'throttle',
+        'voltage', 'current', 'battery_remaining',
+        'armed', 'custom_mode', 'mode', 'system_status',
+        'last_heartbeat', 'last_position', 'updates',
+    )
+
+    def __init__(self):
+        self.lat = None             # градусы
+        self.lon = None             # градусы
+        self.alt = None             # м AMSL
+        self.relative_alt = None    # м над Home
+        self.vx = self.vy = self.vz = None  # м/с (NED)
+        self.heading = None         # градусы 0..360
+        self.roll = self.pitch = self.yaw = None  # радианы
+        self.airspeed = None        # м/с
+        self.groundspeed = None     # м/с
+        self.climb = None           # м/с
+        self.throttle = None        # %
+        self.voltage = None         # В
+        self.current = None         # А
+        self.battery_remaining = None  # %
+        self.armed = False
+        self.custom_mode = None
+        self.mode = None            # имя режима ("GUIDED", "AUTO", ...)
+        self.system_status = None
+        self.last_heartbeat = None  # время приёма (time.time())
+        self.last_position = None
+        self.updates = 0            # Счётчик изменений (для проверки "что-то поменялось")
+
+    @property
+    def has_position(self) -> bool:
+        return self.lat is not None
+
+    def snapshot(self) -> dict:
+        """Копия всех полей (для отображения или логов)"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class TelemetryStore:
+    """
+    Телеметрия одного аппарата: текущее состояние (DroneState)
+    и ограниченная история полей (Series на каждый тип сообщения).
+    Заполняется callback-функциями потока чтения (mavlink_reader).
+    """
+
+    MESSAGE_TYPES = ('HEARTBEAT',) + tuple(HISTORY_FIELDS)
+
+    def __init__(self, master: mavutil.mavlink_connection, capacity: int = HISTORY_SIZE):
+        self.master = master
+        self.state = DroneState()
+        self.history = {msg_type: Series(fields, capacity) for msg_type, fields in HISTORY_FIELDS.items()}
+        self._lock = threading.Lock()   # Только между записью истории и чтением срезов
+        self._handlers = {
+            'HEARTBEAT': self._on_heartbeat,
+            'GLOBAL_POSITION_INT': self._on_global_position_int,
+            'ATTITUDE': self._on_attitude,
+            'VFR_HUD': self._on_vfr_hud,
+            'SYS_STATUS': self._on_sys_status,
+        }
+        self._attached = False
+
+    def attach(self) -> None:
+        if not self._attached:
+            get_reader(self.master).add_callback(self.handle, self.MESSAGE_TYPES)
+            self._attached = True
+
+    def detach(self) -> None:
+        if self._attached:
+            get_reader(self.master).remove_callback(self.handle, self.MESSAGE_TYPES)
+            self._attached = False
+
+    def handle(self, msg) -> None:
+        # Только сообщения автопилота, а не других GCS в том же канале
+        if msg.get_srcSystem() != self.master.target_system:
+            return
+        handler = self._handlers.get(msg.get_type())
+        if handler is not None:
+            handler(msg)
+            self.state.updates += 1
+
+    def series(self, msg_type: str) -> Series:
+        return self.history[msg_type]
+
+    def values(self, msg_type: str, field: str, n: Optional[int] = None) -> array:
+        """Последние n значений поля (копия, можно читать из любого потока)"""
+        with self._lock:
+            return self.history[msg_type].values(field, n)
+
+    def times(self, msg_type: str, n: Optional[int] = None) -> array:
+        with self._lock:
+            return self.history[msg_type].times.last(n)
+
+    def clear(self) -> None:
+        with self._lock:
+            for series in self.history.values():
+                series.clear()
+
+    # --- обработчики (поток чтения) ---
+
+    def _append(self, msg_type: str, timestamp: float, values: Sequence[float]) -> None:
+        with self._lock:
+            self.history[msg_type].append(timestamp, values)
+
+    def _on_heartbeat(self, msg) -> None:
+        # HEARTBEAT подвеса, камеры и т.п. с тем же system id режим не описывает
+        if not self.master.probably_vehicle_heartbeat(msg):
+            return
+        state = self.state
+        state.armed = bool(msg.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED)
+        if msg.custom_mode != state.custom_mode or state.mode is None:
+            state.custom_mode = msg.custom_mode
+            state.mode = mavutil.mode_string_v10(msg)
+        state.system_status = msg.system_status
+        state.last_heartbeat = msg._timestamp
+
+    def _on_global_position_int(self, msg) -> None:
+        state = self.state
+        state.lat = msg.lat / SCALE_DEG
+        state.lon = msg.lon / SCALE_DEG
+        state.alt = msg.alt / SCALE_ALT
+        state.relative_alt = msg.relative_alt / SCALE_ALT
+        state.vx = msg.vx / 100
+        state.vy = msg.vy / 100
+        state.vz = msg.vz / 100
+        state.heading = msg.hdg / 100 if msg.hdg != 65535 else state.heading
+        state.last_position = msg._timestamp
+        self._append('GLOBAL_POSITION_INT', msg._timestamp, (
+            state.lat, state.lon, state.alt, state.relative_alt,
+            state.vx, state.vy, state.vz, state.heading if state.heading is not None else float('nan')
+        ))
+
+    def _on_attitude(self, msg) -> None:
+        state = self.state
+        state.roll = msg.roll
+        state.pitch = msg.pitch
+        state.yaw = msg.yaw
+        self._append('ATTITUDE', msg._timestamp, (
+            msg.roll, msg.pitch, msg.yaw, msg.rollspeed, msg.pitchspeed, msg.yawspeed
+        ))
+
+    def _on_vfr_hud(self, msg) -> None:
+        state = self.state
+        state.airspeed = msg.airspeed
+        state.groundspeed = msg.groundspeed
+        state.climb = msg.climb
+        state.throttle = msg.throttle
+        self._append('VFR_HUD', msg._timestamp, (msg.airspeed, msg.groundspeed, msg.climb, msg.throttle))
+
+    def _on_sys_status(self, msg) -> None:
+        state = self.state
+        # -1 в MAVLink означает "не измеряется"
+        state.voltage = msg.voltage_battery / 1000 if msg.voltage_battery != 65535 else None
+        state.current = msg.current_battery / 100 if msg.current_battery != -1 else None
+        state.battery_remaining = msg.battery_remaining if msg.battery_remaining != -1 else None
+        self._append('SYS_STATUS', msg._timestamp, (
+            state.voltage if state.voltage is not None else float('nan'),
+            state.current if state.current is not None else float('nan'),
+            state.battery_remaining if state.battery_remaining is not None else float('nan'),
+        ))
+
+
+# Одно хранилище телеметрии на соединение
+_stores = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def attach_telemetry(master: mavutil.mavlink_connection, capacity: int = HISTORY_SIZE) -> TelemetryStore:
+    """Создаёт (или возвращает уже подключённое) хранилище телеметрии соединения"""
+    with _stores_lock:
+        store = _stores.get(master)
+        if store is None:
+            store = TelemetryStore(master, capacity)
+            _stores[master] = store
+        store.attach()
+        return store
+
+
+def find_telemetry(master: mavutil.mavlink_connection) -> Optional[TelemetryStore]:
+    return _stores.get(master)
+
+
+def get_drone_state(master: mavutil.mavlink_connection) -> Optional[DroneState]:
+    """Текущее состояние аппарата (O(1)) или None, если телеметрия не подключена"""
+    store = _stores.get(master)
+    return store.state if store is not None else None
+
+
+def detach_telemetry(master: mavutil.mavlink_connection) -> None:
+    with _stores_lock:
+        store = _stores.pop(master, None)
+    if store is not None:
+        store.detach()
@@ -1,6 +1,31 @@
+import io
+import os
+import threading
+import time
 from typing import Any
 
+from PIL import Image, ImageTk
 from tkintermapview import TkinterMapView
+from tkintermapview.utility_functions import decimal_to_osm
+
+from marker_layer import MarkerLayer
+from route_layer import RouteLayer
+from spatial_index import GridIndex
+from tile_cache import TILE_CACHE_BYTES, TileCache
+from tile_prefetch import TilePrefetcher
+from tile_store import open_tile_store
+
+# Тег canvas для собственных слоёв поверх маркеров (аппарат и т.п.)
+OVERLAY_TAG = "overlay"
+
+# Объекты дальше этого запаса за краем экрана не перерисовываются (пиксели)
+VIEW_MARGIN_PX = 64
+
+# Координаты мыши отдаются не чаще раза в столько миллисекунд
+MOUSE_THROTTLE_MS = 50
+
+# Пауза потока загрузки тайлов, когда очередь пуста (секунды, как в базовом классе)
+LOAD_IDLE_SLEEP = 0.01
 
 
 class ExtendedMapView(TkinterMapView):
@@ -8,34 +33,315 @@ class ExtendedMapView(TkinterMapView):
         self.zoom_callback = kwargs.pop('zoom_callback', None)
         self.mouse_callback = kwargs.pop('mouse_callback', None)
 
+        # Декодированные тайлы с ограничением по памяти: повторный просмотр области - без SQLite и PIL
+        self.tile_cache = TileCache(kwargs.pop('tile_cache_bytes', TILE_CACHE_BYTES))
+
+        # Офлайн-тайлы читаются через TileStore (mmap, соединение на поток, MBTiles),
+        # а не через sqlite3.connect() базового класса с настройками по умолчанию.
+        # Карта базу только читает: файл открывается read-only и не переводится в WAL.
+        # Если файла ещё нет (его создаст загрузчик), он откроется при первом запросе тайла после появления
+        self.tile_store = kwargs.pop('tile_store', None)
+        database_path = kwargs.pop('database_path', None)
+        self._tile_store_path = database_path if self.tile_store is None else None
+        self._tile_store_lock = threading.Lock()
+        prefetch = kwargs.pop('prefetch', True)
+        self.tile_prefetcher = None
+
+        # Индекс маркеров, путей и полигонов карты: рисуем только то, что рядом с экраном.
+        # Создаётся до конструктора базового класса - он уже вызывает отрисовку
+        self._object_index = GridIndex()
+        self._indexed_objects = {}      # id(объекта) -> (объект, признак изменения)
+        self._drawn_shapes = set()      # id путей и полигонов, нарисованных в прошлом кадре
+
         super().__init__(*args, **kwargs)
 
+        # Предзагрузка тайлов по направлению сдвига, зума и курсу аппарата - в кэш, до того как их покажут
+        if prefetch:
+            self.tile_prefetcher = TilePrefetcher(self)
+
         # Троттлинг для мыши
         self._mouse_timer = None
         self._last_mouse_coords = None
 
+        # Собственные слои: перерисовываются вместе с маркерами при сдвиге и зуме
+        self._overlays = []
+
         if self.mouse_callback:
             # ПРИВЯЗЫВАЕМ К CANVAS, А НЕ К САМОМУ ВИДЖЕТУ!
             self.canvas.bind("<Motion>", self._on_mouse_move)  # ← ИЗМЕНИЛ ЭТУ СТРОКУ
 
     def set_zoom(self, zoom: int, relative_pointer_x: float = 0.5, relative_pointer_y: float = 0.5):
+        prefetcher = getattr(self, 'tile_prefetcher', None)
+        if prefetcher is not None:
+            prefetcher.note_zoom(zoom - self.zoom, relative_pointer_x, relative_pointer_y)
         super().set_zoom(zoom, relative_pointer_x, relative_pointer_y)
+        if prefetcher is not None:
+            prefetcher.update()
         if self.zoom_callback:
             self.zoom_callback(zoom)
 
+    def set_vehicle_hint(self, lat: float, lon: float, heading=None, speed=None) -> None:
+        """Положение и курс аппарата для предзагрузки тайлов впереди по курсу"""
+        if self.tile_prefetcher is not None:
+            self.tile_prefetcher.set_vehicle(lat, lon, heading, speed)
+
+    def destroy(self):
+        if self.tile_prefetcher is not None:
+            self.tile_prefetcher.stop()
+        super().destroy()
+
+    def add_overlay(self, overlay) -> None:
+        """Слой с методом draw(), который карта вызывает после своих маркеров и путей"""
+        if overlay not in self._overlays:
+            self._overlays.append(overlay)
+
+    def remove_overlay(self, overlay) -> None:
+        if overlay in self._overlays:
+            self._overlays.remove(overlay)
+
+    def set_route(self, positions=(), **kwargs) -> RouteLayer:
+        """
+        Маршрут с пошаговым редактированием (append/insert/remove/move),
+        вместо пересоздания пути через delete_all_path() + set_path()
+        """
+        route = RouteLayer(self, positions, **kwargs)
+        self.add_overlay(route)
+        return route
+
+    def set_markers_bulk(self, positions, texts=None, command=None, **kwargs) -> MarkerLayer:
+        """
+        Много маркеров одним слоем (импорт съёмки, скачанная миссия).
+        При мелком зуме маркеры объединяются в кластеры, число элементов canvas ограничено экраном.
+        command(index) вызывается при клике по отдельному маркеру.
+        """
+        layer = MarkerLayer(self, positions, texts=texts, command=command, **kwargs)
+        self.add_overlay(layer)
+        return layer
+
+    def view_transform(self):
+        """
+        Преобразование нормированных координат Меркатора (0..1, decimal_to_osm(..., 0))
+        в пиксели canvas: x = wx * scale_x + offset_x, y = wy * scale_y + offset_y.
+        Возвращает (scale_x, scale_y, offset_x, offset_y) или None, пока карта не размещена.
+        """
+        tile_width = self.lower_right_tile_pos[0] - self.upper_left_tile_pos[0]
+        tile_height = self.lower_right_tile_pos[1] - self.upper_left_tile_pos[1]
+        if tile_width <= 0 or tile_height <= 0:
+            return None
+        tiles = 2 ** round(self.zoom)
+        return (tiles * self.width / tile_width,
+                tiles * self.height / tile_height,
+                -self.upper_left_tile_pos[0] * self.width / tile_width,
+                -self.upper_left_tile_pos[1] * self.height / tile_height)
+
+    def canvas_coords(self, lat: float, lon: float) -> tuple:
+        """Координаты точки на canvas (как CanvasPositionMarker.get_canvas_pos)"""
+        tile_x, tile_y = decimal_to_osm(lat, lon, round(self.zoom))
+        widget_tile_width = self.lower_right_tile_pos[0] - self.upper_left_tile_pos[0]
+        widget_tile_height = self.lower_right_tile_pos[1] - self.upper_left_tile_pos[1]
+        x = (tile_x - self.upper_left_tile_pos[0]) / widget_tile_width * self.width
+        y = (tile_y - self.upper_left_tile_pos[1]) / widget_tile_height * self.height
+        return x, y
+
+    def viewport_world(self, margin_px: float = VIEW_MARGIN_PX):
+        """Видимая область с запасом в нормированном Меркаторе: (min_x, min_y, max_x, max_y) или None"""
+        view = self.view_transform()
+        if view is None:
+            return None
+        scale_x, scale_y, offset_x, offset_y = view
+        return ((-margin_px - offset_x) / scale_x, (-margin_px - offset_y) / scale_y,
+                (self.width + margin_px - offset_x) / scale_x, (self.height + margin_px - offset_y) / scale_y)
+
+    def _sync_object_index(self):
+        """
+        Обновляет индекс по спискам объектов базового класса.
+        Перестраиваются только новые и изменившиеся объекты (сравнение позиции - без работы с canvas).
+        """
+        indexed = self._indexed_objects
+        seen = set()
+        for obj in self.canvas_marker_list:
+            key = id(obj)
+            seen.add(key)
+            entry = indexed.get(key)
+            if entry is None or entry[0] is not obj or entry[1] != obj.position:
+                x, y = decimal_to_osm(*obj.position, 0)
+                self._object_index.insert(key, x, y)
+                indexed[key] = (obj, obj.position)
+        for obj in self.canvas_path_list + self.canvas_polygon_list:
+            key = id(obj)
+            seen.add(key)
+            signature = (id(obj.position_list), len(obj.position_list))
+            entry = indexed.get(key)
+            if entry is None or entry[0] is not obj or entry[1] != signature:
+                points = [decimal_to_osm(*position, 0) for position in obj.position_list]
+                if points:
+                    xs = [x for x, _ in points]
+                    ys = [y for _, y in points]
+                    self._object_index.insert(key, min(xs), min(ys), max(xs), max(ys))
+                else:
+                    self._object_index.remove(key)
+                indexed[key] = (obj, signature)
+        for key in [key for key in indexed if key not in seen]:
+            self._object_index.remove(key)
+            del indexed[key]
+
+    @staticmethod
+    def _marker_on_canvas(marker) -> bool:
+        return (marker.polygon is not None or marker.canvas_icon is not None
+                or marker.canvas_text is not None or marker.canvas_image is not None)
+
+    def _draw_visible_objects(self, draw, cull_shapes: bool):
+        """
+        Вызывает отрисовку базового класса только для объектов рядом с экраном:
+        списки объектов на время вызова подменяются отфильтрованными.
+        Маркеры, которые были на экране, рисуются ещё раз, чтобы убрать свои элементы canvas;
+        пути и полигоны при сдвиге двигаются относительно прошлого кадра, поэтому при зуме рисуются все.
+        """
+        viewport = self.viewport_world() if hasattr(self, '_object_index') else None
+        if viewport is None:
+            draw()
+            return
+        self._sync_object_index()
+        visible = self._object_index.query(*viewport)
+
+        markers, paths, polygons = self.canvas_marker_list, self.canvas_path_list, self.canvas_polygon_list
+        self.canvas_marker_list = [m for m in markers if id(m) in visible or self._marker_on_canvas(m)]
+        if cull_shapes:
+            self.canvas_path_list = [p for p in paths if id(p) in visible or id(p) in self._drawn_shapes]
+            self.canvas_polygon_list = [p for p in polygons if id(p) in visible or id(p) in self._drawn_shapes]
+        try:
+            draw()
+        finally:
+            self.canvas_marker_list, self.canvas_path_list, self.canvas_polygon_list = markers, paths, polygons
+        self._drawn_shapes = {id(shape) for shape in paths + polygons if id(shape) in visible}
+
+    def get_tile_image_from_cache(self, zoom: int, x: int, y: int):
+        # Единственное место, где считаются попадания и промахи: один раз на тайл, который рисуется
+        image = self.tile_cache.get((self.tile_server, zoom, x, y))
+        return image if image is not None else False
+
+    def load_images_background(self):
+        """
+        Поток загрузки видимых тайлов базового класса, но без повторной проверки кэша:
+        промах уже учтён при отрисовке, а request_image сам заглянет в кэш.
+        """
+        while self.running:
+            if len(self.image_load_queue_tasks) > 0:
+                # Задача: ((zoom, x, y), тайл canvas)
+                task = self.image_load_queue_tasks.pop()
+                (zoom, x, y), canvas_tile = task
+                image = self.request_image(zoom, x, y)
+                if image is None:
+                    self.image_load_queue_tasks.append(task)
+                    continue
+                self.image_load_queue_results.append(((zoom, x, y), canvas_tile, image))
+            else:
+                time.sleep(LOAD_IDLE_SLEEP)
+
+    def pre_cache(self):
+        """
+        Предзагрузка базового класса отключена: её заменяет TilePrefetcher.
+        Базовый класс проверяет tile_image_cache, который request_image опустошает,
+        и на каждом сдвиге заново запрашивал бы все тайлы в радиусе 8.
+        """
+        return
+
+    def request_image(self, zoom: int, x: int, y: int, db_cursor=None):
+        """
+        Тайл из кэша, иначе - из TileStore, иначе - с сервера (базовый класс).
+        Базовый класс складывает тайлы в неограниченный словарь tile_image_cache -
+        забираем их оттуда в TileCache. Ошибки сети базовый класс не кэширует, и мы тоже.
+        """
+        key = (self.tile_server, zoom, x, y)
+        image = self.tile_cache.peek(key)
+        if image is not None:
+            return image
+
+        tile_store = self._open_tile_store()
+        if tile_store is not None:
+            try:
+                data = tile_store.get(self.tile_server, zoom, x, y)
+            except Exception:
+                data = None
+            if data is not None:
+                if not self.running:
+                    return self.empty_tile_image
+                try:
+                    image = ImageTk.PhotoImage(Image.open(io.BytesIO(data)))
+                except Exception:
+                    return self.empty_tile_image
+                self.tile_cache.put(key, image)
+                return image
+            if self.use_database_only:
+                return self.empty_tile_image
+
+        image = super().request_image(zoom, x, y, db_cursor=db_cursor)
+        loaded = self.tile_image_cache.pop(f"{zoom}{x}{y}", None)
+        if loaded is not None:
+            # Пустой тайл (нет на сервере) общий для всех - памяти не занимает
+            self.tile_cache.put(key, loaded, 0 if loaded is self.empty_tile_image else None)
+        return image
+
+    def _open_tile_store(self):
+        if self.tile_store is None and self._tile_store_path is not None and os.path.exists(self._tile_store_path):
+            with self._tile_store_lock:
+                if self.tile_store is None:
+                    self.tile_store = open_tile_store(self._tile_store_path, read_only=True)
+        return self.tile_store
+
+    def _update_tile_focus(self):
+        # Центр экрана в номерах тайлов: от него TileCache считает, какие тайлы далеко
+        self.tile_cache.set_focus(round(self.zoom),
+                                  (self.upper_left_tile_pos[0] + self.lower_right_tile_pos[0]) / 2,
+                                  (self.upper_left_tile_pos[1] + self.lower_right_tile_pos[1]) / 2)
+        # draw_move вызывается из конструктора базового класса, до создания предзагрузчика
+        prefetcher = getattr(self, 'tile_prefetcher', None)
+        if prefetcher is not None:
+            prefetcher.update()
+
+    def draw_initial_array(self):
+        self._update_tile_focus()
+        self._draw_visible_objects(super().draw_initial_array, cull_shapes=False)
+        self._draw_overlays()
+
+    def draw_move(self, called_after_zoom: bool = False):
+        self._update_tile_focus()
+        self._draw_visible_objects(lambda: super(ExtendedMapView, self).draw_move(called_after_zoom),
+                                   cull_shapes=not called_after_zoom)
+        self._draw_overlays()
+
+    def manage_z_order(self):
+        super().manage_z_order()
+        self.canvas.lift(OVERLAY_TAG)
+        self.canvas.lift("corner")
+        self.canvas.lift("button")
+
+    def _draw_overlays(self):
+        # draw_move вызывается из конструктора базового класса, до нашей инициализации
+        for overlay in getattr(self, '_overlays', ()):
+            overlay.draw()
+
     def _on_mouse_move(self, event):
-        """Движение мыши с троттлингом"""
-        # Сохраняем координаты
+        """
+        Движение мыши с троттлингом по переднему фронту: первое событие обрабатывается сразу,
+        следующие - не чаще MOUSE_THROTTLE_MS, последнее положение не теряется.
+        Координаты обновляются и во время непрерывного движения, а не только после остановки.
+        """
         self._last_mouse_coords = (event.x, event.y)
+        if self._mouse_timer is None:
+            self._process_mouse_move()
+            self._mouse_timer = self.after(MOUSE_THROTTLE_MS, self._on_mouse_timer)
 
-        if self._mouse_timer:
-            self.after_cancel(self._mouse_timer)
-
-        # Ставим таймер
-        self._mouse_timer = self.after(50, self._process_mouse_move)
+    def _on_mouse_timer(self):
+        # За время паузы мышь двигалась - отдаём последнее положение и держим паузу дальше
+        if self._last_mouse_coords:
+            self._process_mouse_move()
+            self._mouse_timer = self.after(MOUSE_THROTTLE_MS, self._on_mouse_timer)
+        else:
+            self._mouse_timer = None
 
     def _process_mouse_move(self):
-        """Обработка движения мыши после задержки"""
+        """Пересчёт положения мыши в координаты и вызов mouse_callback"""
         if self._last_mouse_coords:
             x, y = self._last_mouse_coords
             try:
@@ -48,8 +354,7 @@ class ExtendedMapView(TkinterMapView):
                 #print(f"Ошибка конвертации: {e}")
                 if self.mouse_callback:
                     self.mouse_callback(None, None)
-
-        self._mouse_timer = None
+            self._last_mouse_coords = None
 
 
 '''
@@ -1,18 +1,32 @@
 import time
 from pymavlink import mavutil
 
+from drone_state import attach_telemetry, detach_telemetry
+from mavlink_reader import start_reader, stop_reader, subscribe
+from stream_scheduler import Stream, stream_scheduler
+from tlog_recorder import start_recording, stop_recording
+from tlog_replay import TlogReplay, open_connection
+
 TARGET_SYSTEM  = 200    # ID дрона
 TARGET_COMPONENT = 1    # ID автопилота
 
 SCALE_DEG = 1e7     # Коэффициент для преобразования географических координат в целое
 SCALE_ALT = 1000    # Коэффициент для преобразования высоты в метрах в миллиметры
 
+GCS_HEARTBEAT_RATE_HZ = 1       # HEARTBEAT наземной станции
+GPS_INJECT_RATE_HZ = 10         # Подмешивание GPS_RAW_INT после установки Home
+GPS_INJECT_DURATION = 1.0       # ... в течение стольких секунд
+HOME_ANNOUNCE_RATE_HZ = 1       # Повтор HOME_POSITION для планировщиков (Mission Planner)
+HOME_ANNOUNCE_COUNT = 3
+
+TLOG_RECORD = True      # Писать всё, что идёт по каналу, в logs/*.tlog
+
 def connect_to_ardupilot(connection_string, target_system=TARGET_SYSTEM, target_component=TARGET_COMPONENT):
     """Подключение к ArduPilot"""
     print(f"Подключаемся к ArduPilot по адресу: {connection_string} ...")
 
-    master = mavutil.mavlink_connection(connection_string,
-                                        source_system=target_system, source_component=target_component)
+    # Кроме обычных адресов - replay:лог.tlog[@скорость] (воспроизведение записи вместо аппарата)
+    master = open_connection(connection_string, source_system=target_system, source_component=target_component)
 
     # Ждем ответа
     result = master.wait_heartbeat(timeout=1)
@@ -21,28 +35,81 @@ def connect_to_ardupilot(connection_string, target_system=TARGET_SYSTEM, target_
         return None
     print(f"Подключились к ArduPilot системе {master.target_system}, компонент {master.target_component}")
 
+    # Дальше сокет читает только фоновый поток, остальные ждут сообщения в своих очередях
+    start_reader(master)
+    if TLOG_RECORD and not isinstance(master, TlogReplay):
+        start_recording(master)
+    attach_telemetry(master)
+    start_gcs_heartbeat(master)
+
     return master
 
 
 def disconnect_from_ardupilot(master):
-    pass
+    """Останавливает периодические отправки, поток чтения и закрывает соединение"""
+    stream_scheduler.cancel_owner(master)
+    detach_telemetry(master)
+    stop_recording(master)
+    stop_reader(master)
+    master.close()
+
+
+def start_gcs_heartbeat(master: mavutil.mavlink_connection, rate_hz: float = GCS_HEARTBEAT_RATE_HZ) -> Stream:
+    """HEARTBEAT наземной станции, пока соединение открыто"""
+    return stream_scheduler.add(
+        lambda: master.mav.heartbeat_send(mavutil.mavlink.MAV_TYPE_GCS, mavutil.mavlink.MAV_AUTOPILOT_INVALID,
+                                          0, 0, 0),
+        rate_hz, owner=master, name="GCS HEARTBEAT"
+    )
+
+
+def start_gps_injection(master: mavutil.mavlink_connection, lat, lon, alt,
+                        rate_hz: float = GPS_INJECT_RATE_HZ, duration: float = GPS_INJECT_DURATION) -> Stream:
+    """Периодическая отправка GPS_RAW_INT с заданными координатами (в фоне, без sleep)"""
+    def send_gps():
+        master.mav.gps_raw_int_send(
+            int(time.time() * 1000000), # time_usec
+            3,                          # fix_type: 3=3D fix
+            int(lat * SCALE_DEG),       # lat
+            int(lon * SCALE_DEG),       # lon
+            int(alt * SCALE_ALT),       # alt
+            65535,                      # eph
+            65535,                      # epv
+            0,                          # vel
+            0,                          # cog
+            10                          # satellites_visible
+        )
+    return stream_scheduler.add(send_gps, rate_hz, duration=duration, owner=master, name="GPS_RAW_INT")
+
+
+def start_home_announcements(master: mavutil.mavlink_connection, lat, lon, alt,
+                             rate_hz: float = HOME_ANNOUNCE_RATE_HZ, count: int = HOME_ANNOUNCE_COUNT) -> Stream:
+    """Несколько повторов HOME_POSITION для синхронизации с planner"""
+    def send_home():
+        master.mav.send(master.mav.home_position_encode(
+            int(lat*SCALE_DEG), int(lon*SCALE_DEG), int(alt*SCALE_ALT), 0, 0, 0, [1,0,0,0], 0, 0, 0, 0
+        ))
+    return stream_scheduler.add(send_home, rate_hz, count=count, owner=master, name="HOME_POSITION")
 
 
 def set_home(master: mavutil.mavlink_connection, lat, lon, alt, timeout=5):
     result = False
     print(f"Устанавливаем новые координаты Home.")
-    # Команда установки home (param1=0 для specific location)
-    master.mav.command_long_send(
-        master.target_system, master.target_component,
-        mavutil.mavlink.MAV_CMD_DO_SET_HOME, 0,
-        0,  # param1: 1=use current location, 0=use specified location
-        0, 0, 0,
-        lat, lon, alt  # float degrees, float degrees, float meters AMSL
-    )
-    print(f"Домашняя позиция отправлена в GPS: Lat: {lat}, Lon: {lon}, Alt: {alt}м")
+    # Подписываемся на ACK до отправки команды, чтобы ответ не потерялся
+    with subscribe(master, 'COMMAND_ACK') as acks:
+        # Команда установки home (param1=0 для specific location)
+        master.mav.command_long_send(
+            master.target_system, master.target_component,
+            mavutil.mavlink.MAV_CMD_DO_SET_HOME, 0,
+            0,  # param1: 1=use current location, 0=use specified location
+            0, 0, 0,
+            lat, lon, alt  # float degrees, float degrees, float meters AMSL
+        )
+        print(f"Домашняя позиция отправлена в GPS: Lat: {lat}, Lon: {lon}, Alt: {alt}м")
 
-    # Ждём ACK
-    msg = master.recv_match(type='COMMAND_ACK', blocking=True, timeout=timeout)
+        # Ждём ACK именно на нашу команду
+        msg = acks.get(timeout=timeout,
+                       condition=lambda m: m.command == mavutil.mavlink.MAV_CMD_DO_SET_HOME)
     if msg and msg.command == mavutil.mavlink.MAV_CMD_DO_SET_HOME:
         if msg.result == mavutil.mavlink.MAV_RESULT_ACCEPTED:
             print("Новые координаты Home установились успешно!")
@@ -53,36 +120,21 @@ def set_home(master: mavutil.mavlink_connection, lat, lon, alt, timeout=5):
         print("Нет ответа ACK!")
 
 
-    # Дополнительно: отправьте home_position_encode для синхронизации с planner
-    master.mav.send(master.mav.home_position_encode(
-        int(lat*SCALE_DEG), int(lon*SCALE_DEG), int(alt*SCALE_ALT), 0, 0, 0, [1,0,0,0], 0, 0, 0, 0
-    ))
-
-    #Дополнительно: отправляем GPS координаты для контекста
-    for i in range(10):
-        master.mav.gps_raw_int_send(
-            int(time.time() * 1000000), # time_usec
-            3,                          # fix_type: 3=3D fix
-            int(lat * SCALE_DEG),       # lat
-            int(lon * SCALE_DEG),       # lon
-            int(alt * SCALE_ALT),       # alt
-            65535,                      # eph
-            65535,                      # epv
-            0,                          # vel
-            0,                          # cog
-            10                          # satellites_visible
-        )
-        time.sleep(0.1)
+    # Дополнительно: HOME_POSITION для синхронизации с planner и GPS координаты для контекста.
+    # Отправляются потоком планировщика, set_home их не ждёт
+    start_home_announcements(master, lat, lon, alt)
+    start_gps_injection(master, lat, lon, alt)
 
     return result
 
 
-def set_mode(master: mavutil.mavlink_connection, mode_name: str, timeout: float = 5.0) -> None:
+def set_mode(master: mavutil.mavlink_connection, mode_name: str, timeout: float = 5.0) -> bool:
     """
     Универсальная функция смены режима полёта через SET_MODE
     - mode_name: строковое имя режима, например "GUIDED" или "AUTO".
     - mode_mapping() берётся из самого автопилота (через pymavlink), так что
       код не привязан к жёстко зашитым номерам custom_mode
+    Возвращает True, если HEARTBEAT автопилота подтвердил новый режим.
     """
     mode_mapping = master.mode_mapping()
     if mode_mapping is None or mode_name not in mode_mapping:
@@ -90,36 +142,37 @@ def set_mode(master: mavutil.mavlink_connection, mode_name: str, timeout: float
 
     mode_id = mode_mapping[mode_name]
 
-    # Отправляем SET_MODE с флагом MAV_MODE_FLAG_CUSTOM_MODE_ENABLED
-    # и номером режима в custom_mode (flightmode number)
-    master.mav.set_mode_send(
-        master.target_system,
-        mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED,
-        mode_id
-    )
+    with subscribe(master, 'HEARTBEAT') as heartbeats:
+        # Отправляем SET_MODE с флагом MAV_MODE_FLAG_CUSTOM_MODE_ENABLED
+        # и номером режима в custom_mode (flightmode number)
+        master.mav.set_mode_send(
+            master.target_system,
+            mavutil.mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED,
+            mode_id
+        )
 
-    # Небольшая пауза, чтобы автопилот успел сменить режим и прислать новый HEARTBEAT
-    end_time = time.time() + timeout
-    while time.time() < end_time:
-        msg = master.recv_match(type='HEARTBEAT', blocking=True, timeout=0.5)
-        if msg is None:
-            continue
-        # можно реализовать проверку, что режим действительно сменился
-        break
+        # Ждём HEARTBEAT автопилота (а не GCS из MAVLink Mirror) уже с новым режимом
+        msg = heartbeats.get(timeout=timeout,
+                             condition=lambda m: m.get_srcSystem() == master.target_system
+                                                 and m.custom_mode == mode_id)
+    if msg is None:
+        print(f"Автопилот не подтвердил режим {mode_name}!")
+        return False
+    return True
 
 
-def set_mode_guided(master: mavutil.mavlink_connection) -> None:
+def set_mode_guided(master: mavutil.mavlink_connection) -> bool:
     """
     Переводит Copter в режим GUIDED (управление с компьютера/скрипта)
     """
-    set_mode(master, "GUIDED")
+    return set_mode(master, "GUIDED")
 
 
-def set_mode_auto(master: mavutil.mavlink_connection) -> None:
+def set_mode_auto(master: mavutil.mavlink_connection) -> bool:
     """
     Переводит Copter в режим AUTO для выполнения загруженной миссии
     """
-    set_mode(master, "AUTO")
+    return set_mode(master, "AUTO")
 
 
 def send_command_arm(master: mavutil.mavlink_connection, force: bool = False) -> None:
@@ -167,7 +220,7 @@ def send_command_takeoff(master: mavutil.mavlink_connection, alt_m: float) -> No
         0,           # param6: lon
         alt_m        # param7: высота (MAV_FRAME_GLOBAL_RELATIVE_ALT)
     )
-    # Ждать фактическую высоту будет основная программа по данным DroneState
+    # Фактическую высоту основная программа берёт из get_drone_state(master).relative_alt
 
 
 def send_command_land(master: mavutil.mavlink_connection) -> None:
@@ -182,4 +235,4 @@ def send_command_land(master: mavutil.mavlink_connection) -> None:
         0, 0, 0, 0,  # параметры для Copter, 0 = посадка в текущей точке
         0, 0, 0
     )
-    # Фактическое «приземлился и дизармился» также может проверяться через DroneState
+    # Фактическое «приземлился и дизармился» проверяется через get_drone_state(master).armed
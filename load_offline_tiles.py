@@ -2,6 +2,10 @@
 
 import tkintermapview
 import os
+import sys
+
+from mission_files import load_mission, mission_positions
+from tile_downloader import CORRIDOR_FULL_ZOOM, CORRIDOR_WIDTH, TileDownloader
 
 
 # This scripts creates a database with offline tiles.
@@ -16,15 +20,27 @@ zoom_max = 20
 script_directory = os.path.dirname(os.path.abspath(__file__))
 database_path = os.path.join(script_directory, "offline_tiles.db")
 
-# create OfflineLoader instance
-loader = tkintermapview.OfflineLoader(path=database_path,
-                                      tile_server="https://mt0.google.com/vt/lyrs=s&hl=en&x={x}&y={y}&z={z}&s=Ga")
-
-# save the tiles to the database, an existing database will extended
-loader.save_offline_tiles(top_left_position, bottom_right_position, zoom_min, zoom_max)
-
-# You can call save_offline_tiles() multiple times and load multiple regions into the database.
-# You can also pass a tile_server argument to the OfflineLoader and specify the server to use.
+tile_server = "https://mt0.google.com/vt/lyrs=s&hl=en&x={x}&y={y}&z={z}&s=Ga"
+
+# Параллельная загрузка с докачкой: прерванный запуск продолжается с уже сохранённых тайлов
+downloader = TileDownloader(database_path, tile_server)
+if len(sys.argv) > 1:
+    # python load_offline_tiles.py миссия.plan [ширина коридора, м]:
+    # крупные зумы - только коридор вдоль маршрута, до CORRIDOR_FULL_ZOOM - весь прямоугольник
+    corridor_width = float(sys.argv[2]) if len(sys.argv) > 2 else CORRIDOR_WIDTH
+    mission = load_mission(sys.argv[1])
+    route = mission_positions(mission.items)
+    if mission.home is not None:
+        route.insert(0, mission.home[:2])
+    downloader.download_corridor(route, zoom_min, zoom_max, width=corridor_width, full_zoom=CORRIDOR_FULL_ZOOM)
+else:
+    downloader.download(top_left_position, bottom_right_position, zoom_min, zoom_max)
+
+# create OfflineLoader instance (только для печати загруженных областей)
+loader = tkintermapview.OfflineLoader(path=database_path, tile_server=tile_server)
+
+# You can call download() multiple times and load multiple regions into the database.
+# You can also pass another tile_server to the TileDownloader and specify the server to use.
 # This server needs to be then also set for the TkinterMapView when the database is used.
 # You can load tiles of multiple servers in the database. Which one then will be used depends on
 # which server is specified for the TkinterMapView.
@@ -1,13 +1,19 @@
 import customtkinter as ctk
 import os
+from tkinter import filedialog
 import setup_gui as gui
 from status_bar import StatusBar
+from command_executor import CommandExecutor
 from extended_mapview import ExtendedMapView
+from vehicle_marker import VehicleMarker
+from drone_state import get_drone_state
 from flight_control import (
-    connect_to_ardupilot, set_home, set_mode_guided, set_mode_auto,
+    connect_to_ardupilot, disconnect_from_ardupilot, set_home, set_mode_guided, set_mode_auto,
     send_command_arm, send_command_disarm, send_command_takeoff, send_command_land
 )
-from mission_control import send_waypoints_to_drone
+from mission_control import build_mission, send_mission_to_drone, send_waypoints_to_drone
+from mission_files import FILE_TYPES, load_mission, mission_positions, save_mission
+from tile_downloader import TileDownloader
 
 
 # Источники используемых GUI библиотек
@@ -46,6 +52,8 @@ DRONE_TEXT_COLOR = 'blue'
 DRONE_ICON_COLOR_IN = 'blue'
 DRONE_ICON_COLOR_OUT = 'red'
 
+VEHICLE_TEXT = 'UAV'
+
 PATH_CYCLIC = False
 PATH_COLOR = 'red'
 PATH_WIDTH = 3
@@ -58,6 +66,17 @@ TARGET_COMPONENT = 1    # ID автопилота
 
 TAKEOFF_ALT = 10 # Взлетаем на относительную высоту в метрах
 
+# Офлайн-карта вдоль маршрута: крупные зумы - только коридор вокруг линии полёта
+PREFETCH_ZOOM_MIN = 13
+PREFETCH_ZOOM_MAX = 20
+PREFETCH_FULL_ZOOM = 14     # До этого зума - весь прямоугольник маршрута
+CORRIDOR_WIDTH = 200        # Ширина коридора в метрах
+
+# Операции executor, которые работают через соединение master:
+# пока они идут, отключаться нельзя. Загрузка карты и файлы миссий соединение не трогают.
+LINK_OPERATIONS = ("connect", "set_home", "guided", "send_wp", "arm", "takeoff", "land", "disarm", "auto")
+CLOSE_WAIT_TIMEOUT = 3.0    # Сколько ждём эти операции при закрытии окна, прежде чем закрыть соединение (секунды)
+
 
 # Глобальная переменная marker для позиции Home дрона
 drone_home_marker = None
@@ -65,9 +84,17 @@ drone_home_marker = None
 # Глобальная переменная Список точек маршрута (lat, lon)
 position_list = []
 
+# Миссия, загруженная из файла, и её точки на карте:
+# пока маршрут не меняли, в дрон отправляются пункты из файла (с их командами и высотами)
+loaded_mission = None
+loaded_positions = None
+
 # Глобальная переменная для работы с MAVLink
 master = None
 
+# Загрузка карты вдоль маршрута (останавливается при закрытии окна)
+route_downloader = None
+
 
 # Создание основного окна Tkinter
 window = ctk.CTk()
@@ -111,6 +138,9 @@ status_bar = StatusBar(frame_status, height=28)  # height=28 чтобы влез
 status_bar.pack(padx=2, pady=2, fill='both')
 status_bar.set_status("Это строка состояния!", "info")
 
+# Долгие MAVLink операции выполняются в рабочих потоках, результат приходит в статус-бар
+executor = CommandExecutor(window, status_bar.set_status)
+
 
 # И используем grid для размещения дочерних элементов
 #zoom_label = ctk.CTkLabel(frame_ctrl, text="Зум: ", height=40, font=("Arial", 12))
@@ -152,6 +182,15 @@ btn_send_disarm.grid(row=7, column=0, padx=10, pady=5, sticky="ew")
 btn_send_auto = ctk.CTkButton(frame_ctrl, text="AUTO", height=40)
 btn_send_auto.grid(row=8, column=0, padx=10, pady=5, sticky="ew")
 
+btn_load_wp = ctk.CTkButton(frame_ctrl, text="LOAD WP", height=40)
+btn_load_wp.grid(row=9, column=0, padx=10, pady=5, sticky="ew")
+
+btn_save_wp = ctk.CTkButton(frame_ctrl, text="SAVE WP", height=40)
+btn_save_wp.grid(row=10, column=0, padx=10, pady=5, sticky="ew")
+
+btn_cache_route = ctk.CTkButton(frame_ctrl, text="CACHE ROUTE", height=40)
+btn_cache_route.grid(row=11, column=0, padx=10, pady=5, sticky="ew")
+
 
 #switch = ctk.CTkSwitch(frame_ctrl, text="Слои карты", height=40)
 #switch.grid(row=3, column=0, padx=10, pady=5, sticky="w")
@@ -161,10 +200,10 @@ btn_send_auto.grid(row=8, column=0, padx=10, pady=5, sticky="ew")
 #checkbox_grid.grid(row=4, column=0, padx=10, pady=5, sticky="w")
 
 spacer = ctk.CTkFrame(frame_ctrl, fg_color="transparent")
-spacer.grid(row=9, column=0, sticky="nsew")
+spacer.grid(row=12, column=0, sticky="nsew")
 
 # Настраиваем веса строк
-frame_ctrl.grid_rowconfigure(9, weight=1)  # Заполнитель растягивается
+frame_ctrl.grid_rowconfigure(12, weight=1)  # Заполнитель растягивается
 
 
 # MAP
@@ -205,6 +244,19 @@ map_widget.set_position(MAP_INIT_POSITION_LAT, MAP_INIT_POSITION_LON)
 map_widget.set_zoom(MAP_INIT_ZOOM)
 
 
+# Маршрут по путевым точкам: редактируется по одному отрезку
+route_layer = map_widget.set_route(color=PATH_COLOR, width=PATH_WIDTH)
+
+# Маркеры путевых точек одним слоем: миссия из файла на тысячи точек выводится за один проход.
+# На мелком зуме близкие точки объединяются в кластеры, при приближении - распадаются
+waypoint_layer = map_widget.set_markers_bulk((), texts=[], command=lambda index: marker_click_event_handler(index),
+                                             color=MARKER_ICON_COLOR_IN, outline=MARKER_ICON_COLOR_OUT,
+                                             text_color=MARKER_TEXT_COLOR)
+
+# Текущее положение аппарата по телеметрии (стрелка по курсу)
+vehicle_marker = VehicleMarker(map_widget, text=VEHICLE_TEXT)
+
+
 # Функция для добавления маркера на карту
 def add_marker_event_handler(position):
     '''
@@ -220,37 +272,37 @@ def add_marker_event_handler(position):
     position_list.append(position)
     #count = len(position_list) - 1
     count = len(position_list)
-    map_widget.set_marker(position[0], position[1],
-                   text=MARKER_TEXT_PREFIX + str(count), text_color=MARKER_TEXT_COLOR,
-                   marker_color_circle= MARKER_ICON_COLOR_IN, marker_color_outside=MARKER_ICON_COLOR_OUT,
-                   command=marker_click_event_handler)
-    if count > 1:
-        map_widget.delete_all_path()
-        map_widget.set_path(position_list, color=PATH_COLOR, width=PATH_WIDTH)
+    waypoint_layer.append(position, text=MARKER_TEXT_PREFIX + str(count))
+    # Дорисовываем только новый отрезок маршрута
+    route_layer.append(position)
 
 
-def marker_click_event_handler(marker):
+def marker_click_event_handler(index):
     #last_index = -2 if PATH_CYCLIC else -1
-    last_index = -1
-    if marker.position != position_list[last_index]: return
-    map_widget.delete(marker)
-    map_widget.delete_all_path()
+    last_index = len(position_list) - 1
+    if index != last_index: return
+    waypoint_layer.pop()
 
     #if len(position_list) == 2:
     #    position_list.clear()
     #else:
     position_list.pop(last_index)
-    if len(position_list) > 1:
-        map_widget.set_path(position_list, color=PATH_COLOR, width=PATH_WIDTH)
+    route_layer.remove(last_index)
 
 
 def delete_all_markers_event_handler():
-    global drone_home_marker
     position_list.clear()
-    position = drone_home_marker.position
-    map_widget.delete_all_marker()
-    map_widget.delete_all_path()
-    drone_home_marker = draw_drone_home_position(position)
+    waypoint_layer.clear()
+    route_layer.clear()
+
+
+def show_mission(positions):
+    """Весь маршрут на карту одним пакетом: один проход по точкам для маркеров и для линии"""
+    position_list[:] = positions
+    waypoint_layer.set_positions(positions, [MARKER_TEXT_PREFIX + str(i) for i in range(1, len(positions) + 1)])
+    route_layer.set_positions(positions)
+    if positions:
+        map_widget.set_position(*positions[0])
 
 
 # Отрисовка HOME дрона на карте
@@ -313,17 +365,30 @@ def connect_mavlink_advanced():
     #if current_icon == "🔌":
     if master is None:
         connection_string = get_connection_string()
-        status_bar.set_status(f"Подключаемся к Ardupilot по адресу: {connection_string} ...")
-        master = connect_to_ardupilot(connection_string)
-        if master is None:
-            status_bar.set_status("Ошибка подключения!", "error")
-        else:
-            status_bar.set_status(f"Подключились к системе {master.target_system}, компонент {master.target_component}", "success")
-            conn_button.configure(text="⚡", fg_color=("green", "darkgreen"))
+
+        def on_connected(result, error):
+            global master
+            master = result
+            if master is None and error is None:
+                status_bar.set_status("Ошибка подключения!", "error")
+            elif master is not None:
+                status_bar.set_status(f"Подключились к системе {master.target_system}, компонент {master.target_component}", "success")
+                conn_button.configure(text="⚡", fg_color=("green", "darkgreen"))
+                link = master
+                vehicle_marker.track(lambda: get_drone_state(link))
+
+        executor.submit("connect", connect_to_ardupilot, connection_string, button=conn_button,
+                        busy_text=f"Подключаемся к Ardupilot по адресу: {connection_string} ...",
+                        error_text="Ошибка подключения!", on_done=on_connected)
     else:
+        if any(executor.is_running(name) for name in LINK_OPERATIONS):
+            status_bar.set_status("Дождитесь завершения команд перед отключением!", "warning")
+            return
         conn_button.configure(text="🔌", fg_color=("gray70", "gray30"))
         status_bar.set_status("Отключились от Ardupilot!", "info")
-        master.close()
+        vehicle_marker.stop_tracking()
+        vehicle_marker.hide()
+        disconnect_from_ardupilot(master)
         master = None
 
 conn_button.configure(command=connect_mavlink_advanced)
@@ -331,13 +396,11 @@ conn_button.configure(command=connect_mavlink_advanced)
 
 def send_home_advanced():
     if master:
-        status_bar.set_status(f"Устанавливаем новые координаты Home.")
         home_position = HOME_POSITION_SPARTAK
-        result = set_home(master, **home_position)
-        if result:
-            status_bar.set_status("Новые координаты Home установились успешно!", "success")
-        else:
-            status_bar.set_status("Ошибка при установки Home", "error")
+        executor.submit("set_home", set_home, master, button=btn_send_home,
+                        busy_text="Устанавливаем новые координаты Home.",
+                        success_text="Новые координаты Home установились успешно!",
+                        error_text="Ошибка при установки Home", **home_position)
     else:
         status_bar.set_status("Нет подключения к Ardupilot!", "error")
 
@@ -345,8 +408,10 @@ btn_send_home.configure(command=send_home_advanced)
 
 def send_guided_advanced():
     if master:
-        status_bar.set_status(f"Устанавливаем режим GUIDED.")
-        set_mode_guided(master)
+        executor.submit("guided", set_mode_guided, master, button=btn_send_guided,
+                        busy_text="Устанавливаем режим GUIDED.",
+                        success_text="Режим GUIDED установлен!",
+                        error_text="Автопилот не подтвердил режим GUIDED")
     else:
         status_bar.set_status("Нет подключения к Ardupilot!", "error")
 
@@ -357,21 +422,93 @@ def send_wp_advanced():
         status_bar.set_status("Нет маршрутных точек для полета!", "error")
         return
     if master:
-        status_bar.set_status(f"Отправляем точки маршрута.")
-        result = send_waypoints_to_drone(master, position_list, TAKEOFF_ALT)
-        if result:
-            print("Маршрут загружен в Ardupilot! Теперь можно нажать AUTO!")
+        if loaded_mission is not None and position_list == loaded_positions:
+            # Маршрут из файла не меняли: отправляем его пункты как есть
+            func, args = send_mission_to_drone, (list(loaded_mission.items),)
         else:
-            print("Не удалось отправить маршрут!")
+            # Работаем с копией: пока идёт загрузка, на карте можно менять точки
+            func, args = send_waypoints_to_drone, (list(position_list), TAKEOFF_ALT)
+        executor.submit("send_wp", func, master, *args,
+                        button=btn_send_wp,
+                        busy_text="Отправляем точки маршрута.",
+                        success_text="Маршрут загружен в Ardupilot! Теперь можно нажать AUTO!",
+                        error_text="Не удалось отправить маршрут!")
     else:
         status_bar.set_status("Нет подключения к Ardupilot!", "error")
 
 btn_send_wp.configure(command=send_wp_advanced)
 
+def load_wp_advanced():
+    path = filedialog.askopenfilename(title="Загрузить миссию", filetypes=FILE_TYPES)
+    if not path:
+        return
+
+    def on_loaded(mission, error):
+        global loaded_mission, loaded_positions
+        if mission is None:
+            return
+        positions = mission_positions(mission.items)
+        loaded_mission = mission
+        loaded_positions = list(positions)
+        show_mission(positions)
+        if mission.home is not None:
+            set_drone_home_event_handler(mission.home[:2])
+
+    # Разбор файла - в рабочем потоке, на карту - одним пакетом в потоке Tkinter
+    executor.submit("load_wp", load_mission, path, button=btn_load_wp,
+                    busy_text=f"Загружаем миссию из {os.path.basename(path)} ...",
+                    success_text="Миссия загружена!",
+                    error_text="Не удалось загрузить миссию!", on_done=on_loaded)
+
+btn_load_wp.configure(command=load_wp_advanced)
+
+def save_wp_advanced():
+    if len(position_list) == 0:
+        status_bar.set_status("Нет маршрутных точек для сохранения!", "error")
+        return
+    path = filedialog.asksaveasfilename(title="Сохранить миссию", filetypes=FILE_TYPES,
+                                        defaultextension=".plan")
+    if not path:
+        return
+    if loaded_mission is not None and position_list == loaded_positions:
+        items = list(loaded_mission.items)
+    else:
+        items = build_mission(position_list, TAKEOFF_ALT)
+    home = drone_home_marker.position + (0.0,)
+    executor.submit("save_wp", save_mission, path, items, home, button=btn_save_wp,
+                    busy_text=f"Сохраняем миссию в {os.path.basename(path)} ...",
+                    success_text="Миссия сохранена!",
+                    error_text="Не удалось сохранить миссию!")
+
+btn_save_wp.configure(command=save_wp_advanced)
+
+def cache_route_advanced():
+    if len(position_list) == 0:
+        status_bar.set_status("Нет маршрутных точек для загрузки карты!", "error")
+        return
+    global route_downloader
+    route = list(position_list)
+    if drone_home_marker is not None:
+        route.insert(0, drone_home_marker.position)
+    route_downloader = TileDownloader(database_path, map_widget.tile_server, max_zoom=map_widget.max_zoom)
+
+    def on_cached(stats, error):
+        if stats is not None:
+            status_bar.set_status(f"Карта маршрута: {stats}", "success" if stats.failed == 0 else "warning")
+
+    executor.submit("cache_route", route_downloader.download_corridor, route, PREFETCH_ZOOM_MIN, PREFETCH_ZOOM_MAX,
+                    width=CORRIDOR_WIDTH, full_zoom=PREFETCH_FULL_ZOOM, button=btn_cache_route,
+                    busy_text="Загружаем карту вдоль маршрута ...",
+                    error_text="Не удалось загрузить карту маршрута!", on_done=on_cached)
+
+btn_cache_route.configure(command=cache_route_advanced)
+
 def send_arm_advanced():
     if master:
-        status_bar.set_status(f"Отправляем команду ARM.")
-        send_command_arm(master)
+        executor.submit("arm", send_command_arm, master, button=btn_send_arm,
+                        busy_text="Отправляем команду ARM.",
+                        success_text="Команда ARM отправлена.",
+                        error_text="Ошибка отправки команды ARM")
     else:
         status_bar.set_status("Нет подключения к Ardupilot!", "error")
 
@@ -379,8 +516,10 @@ btn_send_arm.configure(command=send_arm_advanced)
 
 def send_takeoff_advanced():
     if master:
-        status_bar.set_status(f"Отправляем команду TAKEOFF.")
-        send_command_takeoff(master, TAKEOFF_ALT)
+        executor.submit("takeoff", send_command_takeoff, master, TAKEOFF_ALT, button=btn_send_takeoff,
+                        busy_text="Отправляем команду TAKEOFF.",
+                        success_text="Команда TAKEOFF отправлена.",
+                        error_text="Ошибка отправки команды TAKEOFF")
     else:
         status_bar.set_status("Нет подключения к Ardupilot!", "error")
 
@@ -388,8 +527,10 @@ btn_send_takeoff.configure(command=send_takeoff_advanced)
 
 def send_land_advanced():
     if master:
-        status_bar.set_status(f"Отправляем команду LAND.")
-        send_command_land(master)
+        executor.submit("land", send_command_land, master, button=btn_send_land,
+                        busy_text="Отправляем команду LAND.",
+                        success_text="Команда LAND отправлена.",
+                        error_text="Ошибка отправки команды LAND")
     else:
         status_bar.set_status("Нет подключения к Ardupilot!", "error")
 
@@ -397,8 +538,10 @@ btn_send_land.configure(command=send_land_advanced)
 
 def send_disarm_advanced():
     if master:
-        status_bar.set_status(f"Отправляем команду DISARM.")
-        send_command_disarm(master)
+        executor.submit("disarm", send_command_disarm, master, button=btn_send_disarm,
+                        busy_text="Отправляем команду DISARM.",
+                        success_text="Команда DISARM отправлена.",
+                        error_text="Ошибка отправки команды DISARM")
     else:
         status_bar.set_status("Нет подключения к Ardupilot!", "error")
 
@@ -406,13 +549,30 @@ btn_send_disarm.configure(command=send_disarm_advanced)
 
 def send_auto_advanced():
     if master:
-        status_bar.set_status(f"Устанавливаем режим AUTO.")
-        set_mode_auto(master)
+        executor.submit("auto", set_mode_auto, master, button=btn_send_auto,
+                        busy_text="Устанавливаем режим AUTO.",
+                        success_text="Режим AUTO установлен!",
+                        error_text="Автопилот не подтвердил режим AUTO")
     else:
         status_bar.set_status("Нет подключения к Ardupilot!", "error")
 
 btn_send_auto.configure(command=send_auto_advanced)
 
 
+def on_window_close():
+    vehicle_marker.stop_tracking()
+    if route_downloader is not None:
+        route_downloader.stop()
+    # Соединение закрываем только после операций, которые им пользуются
+    if not executor.wait(LINK_OPERATIONS, CLOSE_WAIT_TIMEOUT):
+        print(f"Операции с автопилотом не завершились за {CLOSE_WAIT_TIMEOUT} с, закрываем соединение")
+    executor.shutdown()
+    if master is not None:
+        disconnect_from_ardupilot(master)
+    window.destroy()
+
+window.protocol("WM_DELETE_WINDOW", on_window_close)
+
+
 # Запуск главного цикла Tkinter
 window.mainloop()
@@ -0,0 +1,266 @@
+# marker_layer.py
+
+import itertools
+import math
+from array import array
+from typing import Callable, Iterable, Optional, Sequence, Tuple
+
+from tkintermapview.utility_functions import decimal_to_osm, osm_to_decimal
+
+from spatial_index import GridIndex
+
+CLUSTER_CELL_PX = 64        # Размер ячейки кластеризации на экране (пиксели)
+CLUSTER_MAX_ZOOM = 18       # С этого зума маркеры никогда не объединяются
+MAX_SINGLE_MARKERS = 300    # Больше отдельных маркеров на экране не рисуем - объединяем в кластеры
+VIEW_MARGIN_PX = 64         # Запас вокруг видимой области, чтобы при сдвиге края не были пустыми
+HIT_RADIUS_PX = 12          # Радиус попадания кликом по маркеру
+RECLUSTER_DELAY_MS = 120    # Пересчёт кластеров после окончания сдвига карты
+
+MARKER_RADIUS = 6
+MARKER_COLOR = 'yellow'
+MARKER_OUTLINE = 'red'
+MARKER_TEXT_COLOR = 'yellow'
+CLUSTER_COLOR = 'orange'
+CLUSTER_OUTLINE = 'white'
+CLUSTER_TEXT_COLOR = 'black'
+MARKER_FONT = ("Tahoma", 9, "bold")
+
+_layer_ids = itertools.count()
+
+
+class MarkerLayer:
+    """
+    Большой набор маркеров (тысячи точек импортированной съёмки или скачанной миссии).
+
+    Координаты проецируются один раз в нормированный Меркатор (array('d')),
+    дальше перевод в пиксели - одно умножение и сложение на точку.
+    На экран попадают только видимые точки; если их много или зум мелкий,
+    точки объединяются по сетке CLUSTER_CELL_PX в кружки с числом маркеров.
+    Число элементов canvas ограничено размером экрана, а не размером миссии.
+    При сдвиге карты слой переносится одним canvas.move(), кластеры
+    пересчитываются после остановки карты.
+    Все методы вызываются из потока Tkinter.
+    """
+
+    def __init__(self, map_widget, positions: Iterable[Tuple[float, float]] = (),
+                 texts: Optional[Sequence[str]] = None, command: Optional[Callable] = None,
+                 color: str = MARKER_COLOR, outline: str = MARKER_OUTLINE, text_color: str = MARKER_TEXT_COLOR,
+                 cluster_color: str = CLUSTER_COLOR, cluster_max_zoom: int = CLUSTER_MAX_ZOOM):
+        self.map_widget = map_widget
+        self.canvas = map_widget.canvas
+        self.command = command          # command(index) при клике по отдельному маркеру
+        self.color = color
+        self.outline = outline
+        self.text_color = text_color
+        self.cluster_color = cluster_color
+        self.cluster_max_zoom = cluster_max_zoom
+        self.tag = f"markers{next(_layer_ids)}"
+
+        self._wx = array('d')
+        self._wy = array('d')
+        self._index = GridIndex()
+        self._texts = None
+        self._view = None
+        self._items = {}                # id элемента canvas -> индекс точки или список индексов кластера
+        self._recluster_id = None
+
+        self.canvas.tag_bind(self.tag, "<Button-1>", self._on_click)
+        self.set_positions(positions, texts)
+
+    def __len__(self):
+        return len(self._wx)
+
+    @property
+    def item_count(self) -> int:
+        """Сколько элементов canvas сейчас занимает слой"""
+        return len(self.canvas.find_withtag(self.tag))
+
+    def position(self, index: int) -> Tuple[float, float]:
+        return osm_to_decimal(self._wx[index], self._wy[index], 0)
+
+    def set_positions(self, positions: Iterable[Tuple[float, float]], texts: Optional[Sequence[str]] = None) -> None:
+        """Заменяет все точки слоя: один проход проекции для всего набора"""
+        wx = array('d')
+        wy = array('d')
+        index = GridIndex()
+        for i, (lat, lon) in enumerate(positions):
+            x, y = decimal_to_osm(lat, lon, 0)
+            wx.append(x)
+            wy.append(y)
+            index.insert(i, x, y)
+        self._wx, self._wy, self._index = wx, wy, index
+        self._texts = list(texts) if texts is not None else None
+        self._view = None
+        self.draw()
+
+    def append(self, position: Tuple[float, float], text: Optional[str] = None) -> None:
+        """Добавляет одну точку в конец (ручное построение маршрута)"""
+        x, y = decimal_to_osm(position[0], position[1], 0)
+        self._index.insert(len(self._wx), x, y)
+        self._wx.append(x)
+        self._wy.append(y)
+        if self._texts is not None:
+            self._texts.append(text or "")
+        self._view = None
+        self.draw()
+
+    def pop(self) -> Tuple[float, float]:
+        """Удаляет последнюю точку"""
+        index = len(self._wx) - 1
+        position = self.position(index)
+        self._index.remove(index)
+        self._wx.pop()
+        self._wy.pop()
+        if self._texts is not None:
+            self._texts.pop()
+        self._view = None
+        self.draw()
+        return position
+
+    def clear(self) -> None:
+        self.set_positions(())
+
+    def delete(self) -> None:
+        self._cancel_recluster()
+        self.canvas.delete(self.tag)
+        self._items.clear()
+        self.map_widget.remove_overlay(self)
+
+    # --- отрисовка (вызывается картой при сдвиге/зуме) ---
+
+    def draw(self) -> None:
+        view = self.map_widget.view_transform()
+        if view is None:
+            return
+        last_view, self._view = self._view, view
+
+        if last_view is not None and view[0] == last_view[0] and view[1] == last_view[1]:
+            # Сдвиг карты: переносим готовые элементы, кластеры пересчитаем, когда карта остановится
+            dx = view[2] - last_view[2]
+            dy = view[3] - last_view[3]
+            if dx or dy:
+                self.canvas.move(self.tag, dx, dy)
+                self._schedule_recluster()
+            return
+
+        self._cancel_recluster()
+        self._rebuild()
+
+    def _schedule_recluster(self) -> None:
+        self._cancel_recluster()
+        self._recluster_id = self.map_widget.after(RECLUSTER_DELAY_MS, self._recluster)
+
+    def _cancel_recluster(self) -> None:
+        if self._recluster_id is not None:
+            self.map_widget.after_cancel(self._recluster_id)
+            self._recluster_id = None
+
+    def _recluster(self) -> None:
+        self._recluster_id = None
+        self._view = self.map_widget.view_transform()
+        if self._view is not None:
+            self._rebuild()
+
+    def visible_indices(self) -> list:
+        """Индексы точек в видимой области (с запасом VIEW_MARGIN_PX), через пространственный индекс"""
+        scale_x, scale_y, offset_x, offset_y = self._view
+        return sorted(self._index.query((-VIEW_MARGIN_PX - offset_x) / scale_x,
+                                        (-VIEW_MARGIN_PX - offset_y) / scale_y,
+                                        (self.map_widget.width + VIEW_MARGIN_PX - offset_x) / scale_x,
+                                        (self.map_widget.height + VIEW_MARGIN_PX - offset_y) / scale_y))
+
+    def hit_test(self, canvas_x: float, canvas_y: float, radius_px: float = HIT_RADIUS_PX) -> Optional[int]:
+        """Индекс ближайшей к точке canvas точки слоя не дальше radius_px или None"""
+        view = self.map_widget.view_transform()
+        if view is None:
+            return None
+        scale_x, scale_y, offset_x, offset_y = view
+        return self._index.nearest((canvas_x - offset_x) / scale_x, (canvas_y - offset_y) / scale_y,
+                                   radius_px / scale_x)
+
+    def _rebuild(self) -> None:
+        self.canvas.delete(self.tag)
+        self._items.clear()
+        if not len(self._wx):
+            return
+
+        visible = self.visible_indices()
+        clustered = (round(self.map_widget.zoom) < self.cluster_max_zoom
+                     or len(visible) > MAX_SINGLE_MARKERS)
+        if clustered:
+            cells = self._cluster(visible)
+            for members in cells.values():
+                if len(members) == 1:
+                    self._draw_marker(members[0])
+                else:
+                    self._draw_cluster(members)
+        else:
+            for index in visible:
+                self._draw_marker(index)
+        self.map_widget.manage_z_order()
+
+    def _cluster(self, indices: list) -> dict:
+        # Ячейки считаются в пикселях мира (а не экрана), поэтому кластеры не "прыгают" при сдвиге
+        scale_x, scale_y = self._view[0], self._view[1]
+        cell_x = CLUSTER_CELL_PX / scale_x
+        cell_y = CLUSTER_CELL_PX / scale_y
+        cells = {}
+        wx, wy = self._wx, self._wy
+        for i in indices:
+            key = (int(wx[i] / cell_x), int(wy[i] / cell_y))
+            members = cells.get(key)
+            if members is None:
+                cells[key] = [i]
+            else:
+                members.append(i)
+        return cells
+
+    def _canvas_point(self, index: int) -> Tuple[float, float]:
+        scale_x, scale_y, offset_x, offset_y = self._view
+        return self._wx[index] * scale_x + offset_x, self._wy[index] * scale_y + offset_y
+
+    def _draw_marker(self, index: int) -> None:
+        x, y = self._canvas_point(index)
+        r = MARKER_RADIUS
+        item = self.canvas.create_oval(x - r, y - r, x + r, y + r, fill=self.color, outline=self.outline,
+                                       width=2, tag=("marker", self.tag))
+        self._items[item] = index
+        if self._texts is not None:
+            text = self.canvas.create_text(x, y - r - 2, anchor="s", text=self._texts[index],
+                                           fill=self.text_color, font=MARKER_FONT, tag=("marker", self.tag))
+            self._items[text] = index
+
+    def _draw_cluster(self, members: list) -> None:
+        scale_x, scale_y, offset_x, offset_y = self._view
+        wx, wy = self._wx, self._wy
+        count = len(members)
+        x = sum(wx[i] for i in members) / count * scale_x + offset_x
+        y = sum(wy[i] for i in members) / count * scale_y + offset_y
+        r = 10 + 4 * math.log10(count)
+        item = self.canvas.create_oval(x - r, y - r, x + r, y + r, fill=self.cluster_color,
+                                       outline=CLUSTER_OUTLINE, width=2, tag=("marker", self.tag))
+        text = self.canvas.create_text(x, y, text=str(count), fill=CLUSTER_TEXT_COLOR,
+                                       font=MARKER_FONT, tag=("marker", self.tag))
+        self._items[item] = members
+        self._items[text] = members
+
+    def _on_click(self, event) -> None:
+        current = self.canvas.find_withtag("current")
+        target = self._items.get(current[0]) if current else None
+        if isinstance(target, list):
+            # Клик по кластеру: приближаем карту к его центру
+            lat, lon = self._cluster_center(target)
+            self.map_widget.set_position(lat, lon)
+            self.map_widget.set_zoom(min(round(self.map_widget.zoom) + 2, self.map_widget.max_zoom))
+            return
+        # Отдельный маркер: ближайшая точка по индексу (кружок и подпись маленькие, в них легко промахнуться)
+        index = self.hit_test(event.x, event.y)
+        if index is None:
+            index = target
+        if index is not None and self.command is not None:
+            self.command(index)
+
+    def _cluster_center(self, members: list) -> Tuple[float, float]:
+        count = len(members)
+        return osm_to_decimal(sum(self._wx[i] for i in members) / count,
+                              sum(self._wy[i] for i in members) / count, 0)
@@ -0,0 +1,271 @@
+# mavlink_reader.py
+
+import queue
+import threading
+import time
+import weakref
+from typing import Callable, Iterable, Optional, Union
+
+from pymavlink import mavutil
+
+READ_IDLE_TIMEOUT = 0.1     # Сколько ждём данных в select(), если сокет пуст (секунды)
+READ_ERROR_PAUSE = 0.5      # Пауза после ошибки чтения, чтобы не крутить цикл вхолостую
+
+# Ключ подписки "на все типы сообщений"
+ALL_TYPES = None
+
+MessageTypes = Union[str, Iterable[str], None]
+
+
+def normalize_types(types: MessageTypes):
+    """Приводит тип(ы) сообщений к кортежу ключей диспетчера"""
+    if types is ALL_TYPES:
+        return (ALL_TYPES,)
+    if isinstance(types, str):
+        return (types,)
+    return tuple(types)
+
+
+class Subscription:
+    """
+    Подписка на сообщения заданных типов.
+    Поток чтения складывает подходящие сообщения в очередь,
+    а вызывающий код забирает их методом get() в своём потоке.
+    Подписку нужно создавать ДО отправки запроса, тогда ответ не потеряется.
+    """
+
+    def __init__(self, reader: "MavlinkReader", types: MessageTypes, maxsize: int = 0):
+        self.reader = reader
+        self.types = normalize_types(types)
+        self.queue = queue.Queue(maxsize)
+
+    def put(self, msg) -> None:
+        """Кладёт сообщение в очередь (вызывается из потока чтения)"""
+        try:
+            self.queue.put_nowait(msg)
+        except queue.Full:
+            # Очередь ограничена: выбрасываем самое старое сообщение, а не новое
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.queue.put_nowait(msg)
+
+    def get(self, timeout: Optional[float] = None, condition: Callable = None):
+        """
+        Ждёт следующее сообщение, для которого condition(msg) истинно.
+        Возвращает None по таймауту (как recv_match).
+        """
+        end_time = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None
+            if end_time is not None:
+                remaining = end_time - time.monotonic()
+                if remaining <= 0:
+                    return None
+            try:
+                msg = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if condition is None or condition(msg):
+                return msg
+
+    def drain(self) -> list:
+        """Забирает все накопившиеся сообщения без ожидания"""
+        messages = []
+        while True:
+            try:
+                messages.append(self.queue.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def close(self) -> None:
+        self.reader.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class MavlinkReader:
+    """
+    Поток чтения одного MAVLink соединения.
+    Непрерывно вычитывает сокет и раздаёт каждое сообщение:
+    - в очереди подписок (Subscription) по типу сообщения;
+    - в callback-функции, зарегистрированные на тип сообщения.
+    Callback вызываются в потоке чтения, поэтому они должны быть быстрыми
+    и не трогать Tkinter напрямую (только через after()).
+
+    Заодно сериализует отправку: master.mav.send (через него идут все *_send)
+    выполняется под send_lock. Иначе планировщик потоков, рабочие потоки команд
+    и передача миссий получают одинаковые seq и перемешивают байты пакетов в сокете.
+    """
+
+    def __init__(self, master: mavutil.mavlink_connection):
+        self.master = master
+        self.send_lock = threading.RLock()
+        self._lock = threading.Lock()
+        # Списки хранятся кортежами и заменяются целиком (copy-on-write),
+        # поэтому поток чтения обходит их без блокировки
+        self._subscriptions = {}
+        self._callbacks = {}
+        self._thread = None
+        self._running = False
+        self.message_count = 0
+        self._locked_send = None
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._install_send_lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="MavlinkReader", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0) -> None:
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+        self._remove_send_lock()
+
+    def _install_send_lock(self) -> None:
+        if self._locked_send is not None:
+            return
+        mav = self.master.mav
+        send = mav.send
+        lock = self.send_lock
+
+        def locked_send(mavmsg, force_mavlink1=False):
+            with lock:
+                send(mavmsg, force_mavlink1=force_mavlink1)
+
+        # Атрибут экземпляра перекрывает метод класса MAVLink
+        mav.send = locked_send
+        self._locked_send = locked_send
+
+    def _remove_send_lock(self) -> None:
+        mav = self.master.mav
+        if self._locked_send is not None and mav.__dict__.get('send') is self._locked_send:
+            del mav.send
+        self._locked_send = None
+
+    def subscribe(self, types: MessageTypes = ALL_TYPES, maxsize: int = 0) -> Subscription:
+        """Создаёт подписку на тип (строка), список типов или все сообщения (None)"""
+        subscription = Subscription(self, types, maxsize)
+        with self._lock:
+            for key in subscription.types:
+                self._subscriptions[key] = self._subscriptions.get(key, ()) + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for key in subscription.types:
+                subs = tuple(s for s in self._subscriptions.get(key, ()) if s is not subscription)
+                if subs:
+                    self._subscriptions[key] = subs
+                else:
+                    self._subscriptions.pop(key, None)
+
+    def add_callback(self, callback: Callable, types: MessageTypes = ALL_TYPES) -> None:
+        """Регистрирует callback(msg) на тип (строка), список типов или все сообщения (None)"""
+        with self._lock:
+            for key in normalize_types(types):
+                self._callbacks[key] = self._callbacks.get(key, ()) + (callback,)
+
+    def remove_callback(self, callback: Callable, types: MessageTypes = ALL_TYPES) -> None:
+        with self._lock:
+            for key in normalize_types(types):
+                callbacks = tuple(c for c in self._callbacks.get(key, ()) if c != callback)
+                if callbacks:
+                    self._callbacks[key] = callbacks
+                else:
+                    self._callbacks.pop(key, None)
+
+    def dispatch(self, msg) -> None:
+        """Раздаёт сообщение подписчикам и callback-функциям"""
+        msg_type = msg.get_type()
+        if msg_type == 'BAD_DATA':
+            return
+        self.message_count += 1
+
+        for subscription in self._subscriptions.get(msg_type, ()) + self._subscriptions.get(ALL_TYPES, ()):
+            subscription.put(msg)
+
+        for callback in self._callbacks.get(msg_type, ()) + self._callbacks.get(ALL_TYPES, ()):
+            try:
+                callback(msg)
+            except Exception as e:
+                print(f"Ошибка в обработчике {msg_type}: {e}")
+
+    def _run(self) -> None:
+        while self._running:
+            try:
+                msg = self.master.recv_msg()
+            except Exception as e:
+                if not self._running:
+                    break
+                print(f"Ошибка чтения MAVLink: {e}")
+                time.sleep(READ_ERROR_PAUSE)
+                continue
+
+            if msg is None:
+                # Данных нет - ждём их на сокете, а не крутимся в цикле
+                self.master.select(READ_IDLE_TIMEOUT)
+                continue
+
+            self.dispatch(msg)
+
+
+# Один поток чтения на соединение
+_readers = weakref.WeakKeyDictionary()
+_readers_lock = threading.Lock()
+
+
+def start_reader(master: mavutil.mavlink_connection) -> MavlinkReader:
+    """Запускает (или возвращает уже запущенный) поток чтения соединения"""
+    with _readers_lock:
+        reader = _readers.get(master)
+        if reader is None:
+            reader = MavlinkReader(master)
+            _readers[master] = reader
+        reader.start()
+        return reader
+
+
+def find_reader(master: mavutil.mavlink_connection) -> Optional[MavlinkReader]:
+    """Возвращает запущенный поток чтения соединения или None, не создавая новый"""
+    reader = _readers.get(master)
+    if reader is not None and reader.running:
+        return reader
+    return None
+
+
+def get_reader(master: mavutil.mavlink_connection) -> MavlinkReader:
+    """
+    Возвращает поток чтения соединения.
+    Если соединение создано не через connect_to_ardupilot, поток запускается здесь,
+    чтобы все вспомогательные функции читали сокет только через диспетчер.
+    """
+    reader = find_reader(master)
+    if reader is not None:
+        return reader
+    return start_reader(master)
+
+
+def stop_reader(master: mavutil.mavlink_connection) -> None:
+    with _readers_lock:
+        reader = _readers.pop(master, None)
+    if reader is not None:
+        reader.stop()
+
+
+def subscribe(master: mavutil.mavlink_connection, types: MessageTypes = ALL_TYPES, maxsize: int = 0) -> Subscription:
+    """Короткая запись для get_reader(master).subscribe(...)"""
+    return get_reader(master).subscribe(types, maxsize)
@@ -1,10 +1,15 @@
 # mission_control.py
 
+import math
+from array import array
 from dataclasses import dataclass
-from typing import List
+from typing import Iterable, List, Optional, Sequence, Tuple
 
 from pymavlink import mavutil
 
+from mission_sync import VehicleMissionState, mission_sync
+from mission_transfer import MissionDownloader, MissionUploader, MissionTransferError, TransferStats, run_transfer
+
 SCALE_DEG = 1e7
 SCALE_ALT = 1000
 
@@ -34,6 +39,166 @@ class MissionItem:
     y: int  # lon * 1e7
     z: float  # alt (м)
 
+    @classmethod
+    def from_message(cls, msg) -> "MissionItem":
+        """Пункт миссии из полученного MISSION_ITEM_INT"""
+        return cls(
+            seq=msg.seq,
+            frame=msg.frame,
+            command=msg.command,
+            current=msg.current,
+            autocontinue=msg.autocontinue,
+            param1=msg.param1,
+            param2=msg.param2,
+            param3=msg.param3,
+            param4=msg.param4,
+            x=msg.x,
+            y=msg.y,
+            z=msg.z,
+        )
+
+
+class MissionValidationError(ValueError):
+    """Миссия содержит недопустимые пункты (координаты вне диапазона, высота не число)"""
+
+    @classmethod
+    def for_indices(cls, bad: Sequence[int]) -> "MissionValidationError":
+        shown = ", ".join(str(i + 1) for i in bad[:10])
+        return cls(f"Недопустимые пункты миссии ({len(bad)}): {shown}" + (" ..." if len(bad) > 10 else ""))
+
+
+class MissionBatch:
+    """
+    Миссия "столбцами": каждое поле MISSION_ITEM_INT - отдельный array.array
+    в тех же типах, что и в сообщении (int32 для x/y, float32 для параметров и высоты).
+    Около 40 байт на пункт вместо сотен у списка MissionItem.
+    Масштабирование, проверка и правки (высота, сдвиг, разворот) - один проход по столбцу.
+    Для протокола это обычная последовательность: batch[i] собирает MissionItem по запросу,
+    seq - индекс пункта, current=1 только у первого.
+    """
+
+    COLUMNS = {
+        'frame': 'B', 'command': 'H', 'autocontinue': 'B',
+        'param1': 'f', 'param2': 'f', 'param3': 'f', 'param4': 'f',
+        'x': 'i', 'y': 'i', 'z': 'f',
+    }
+
+    def __init__(self, **columns):
+        for name, typecode in self.COLUMNS.items():
+            column = columns.get(name)
+            setattr(self, name, array(typecode) if column is None else array(typecode, column))
+        if len({len(getattr(self, name)) for name in self.COLUMNS}) > 1:
+            raise ValueError("Столбцы миссии разной длины")
+
+    @classmethod
+    def from_coordinates(cls, coordinates: Iterable[Tuple[float, float]], altitude: float = 50.0,
+                         frame: int = mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT,
+                         command: int = mavutil.mavlink.MAV_CMD_NAV_WAYPOINT,
+                         acceptance_radius: float = 2) -> "MissionBatch":
+        """Пункты command (по умолчанию NAV_WAYPOINT) по списку (lat, lon) на одной высоте"""
+        coordinates = coordinates if isinstance(coordinates, (list, tuple)) else list(coordinates)
+        count = len(coordinates)
+        # Проверка до упаковки в int32: иначе 250° или inf дают OverflowError, а NaN - ValueError
+        bad = [i for i, (lat, lon) in enumerate(coordinates) if not (-90 <= lat <= 90 and -180 <= lon <= 180)]
+        if bad:
+            raise MissionValidationError.for_indices(bad)
+        batch = cls()
+        batch.x = array('i', [round(lat * SCALE_DEG) for lat, _ in coordinates])
+        batch.y = array('i', [round(lon * SCALE_DEG) for _, lon in coordinates])
+        # Одинаковые значения - повтором массива из одного элемента (без цикла на Python)
+        batch.frame = array('B', (frame,)) * count
+        batch.command = array('H', (command,)) * count
+        batch.autocontinue = array('B', (1,)) * count
+        batch.param1 = array('f', (0,)) * count                    # Hold time (секунды)
+        batch.param2 = array('f', (acceptance_radius,)) * count    # Acceptance radius (метры)
+        batch.param3 = array('f', (0,)) * count                    # Pass through waypoint
+        batch.param4 = array('f', (0,)) * count                    # Yaw angle
+        batch.z = array('f', (altitude,)) * count
+        return batch
+
+    @classmethod
+    def from_items(cls, items: Iterable[MissionItem]) -> "MissionBatch":
+        batch = cls()
+        columns = [(getattr(batch, name), name) for name in cls.COLUMNS]
+        for item in items:
+            for column, name in columns:
+                column.append(getattr(item, name))
+        return batch
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return MissionBatch(**{name: getattr(self, name)[index] for name in self.COLUMNS})
+        if index < 0:
+            index += len(self.x)
+        return MissionItem(
+            seq=index, frame=self.frame[index], command=self.command[index], current=1 if index == 0 else 0,
+            autocontinue=self.autocontinue[index],
+            param1=self.param1[index], param2=self.param2[index], param3=self.param3[index], param4=self.param4[index],
+            x=self.x[index], y=self.y[index], z=self.z[index],
+        )
+
+    def __iter__(self):
+        for index in range(len(self.x)):
+            yield self[index]
+
+    @property
+    def nbytes(self) -> int:
+        """Память под данные столбцов (байты)"""
+        return sum(len(column) * column.itemsize for column in (getattr(self, name) for name in self.COLUMNS))
+
+    def items(self) -> List[MissionItem]:
+        return list(self)
+
+    def positions(self) -> List[Tuple[float, float]]:
+        """Координаты (lat, lon) всех пунктов"""
+        return [(x / SCALE_DEG, y / SCALE_DEG) for x, y in zip(self.x, self.y)]
+
+    # --- проверка ---
+
+    def invalid_indices(self) -> List[int]:
+        """Индексы пунктов с координатами вне диапазона или высотой не числом"""
+        if not len(self.x):
+            return []
+        lat_limit = 90 * SCALE_DEG
+        lon_limit = 180 * SCALE_DEG
+        # Обычный случай - всё в порядке: min/max по столбцу проходят на C, без цикла по пунктам
+        if (-lat_limit <= min(self.x) and max(self.x) <= lat_limit
+                and -lon_limit <= min(self.y) and max(self.y) <= lon_limit
+                and all(map(math.isfinite, self.z))):
+            return []
+        bad = {i for i, x in enumerate(self.x) if not -lat_limit <= x <= lat_limit}
+        bad.update(i for i, y in enumerate(self.y) if not -lon_limit <= y <= lon_limit)
+        bad.update(i for i, z in enumerate(self.z) if not math.isfinite(z))
+        return sorted(bad)
+
+    def validate(self) -> None:
+        bad = self.invalid_indices()
+        if bad:
+            raise MissionValidationError.for_indices(bad)
+
+    # --- правки всей миссии ---
+
+    def set_altitude(self, altitude: float) -> None:
+        self.z = array('f', (altitude,)) * len(self.z)
+
+    def offset_altitude(self, delta: float) -> None:
+        self.z = array('f', [z + delta for z in self.z])
+
+    def shift(self, delta_lat: float, delta_lon: float) -> None:
+        """Сдвиг всего маршрута на (delta_lat, delta_lon) градусов"""
+        dx = round(delta_lat * SCALE_DEG)
+        dy = round(delta_lon * SCALE_DEG)
+        self.x = array('i', [x + dx for x in self.x])
+        self.y = array('i', [y + dy for y in self.y])
+
+    def reverse(self) -> None:
+        """Обратный порядок пунктов (на месте)"""
+        for name in self.COLUMNS:
+            getattr(self, name).reverse()
+
 
 def clear_mission(master: mavutil.mavlink_connection) -> None:
     """
@@ -43,128 +208,83 @@ def clear_mission(master: mavutil.mavlink_connection) -> None:
         master.target_system,
         master.target_component
     )
+    # ACK здесь не ждём, поэтому не знаем, что теперь на борту
+    mission_sync.forget(master)
 
 
-def upload_mission(master: mavutil.mavlink_connection, items: List[MissionItem]) -> None:
+def upload_mission(master: mavutil.mavlink_connection, items: List[MissionItem],
+                   max_duration: Optional[float] = None) -> TransferStats:
     """
     Загрузка миссии по протоколу Mission Protocol:
     1) MISSION_COUNT
     2) цикл: MISSION_REQUEST_INT -> MISSION_ITEM_INT
     3) ожидание MISSION_ACK.
+    Повторы при потерях, адаптивный таймаут и лимит времени - в MissionUploader.
+    Возвращает статистику передачи, при неудаче бросает MissionTransferError.
     """
-    count = len(items)
-    if count == 0:
-        return
+    if len(items) == 0:
+        return TransferStats()
 
-    master.mav.mission_count_send(
-        master.target_system,
-        master.target_component,
-        count
-    )
+    uploader = MissionUploader(master, items, max_duration=max_duration)
+    try:
+        stats = run_transfer(master, uploader)
+    except MissionTransferError:
+        mission_sync.forget(master)
+        raise
+    mission_sync.confirm(master, items, uploader.opaque_id)
+    print(f"MISSION_ACK получен, загрузка миссии завершена: {stats}")
+    return stats
 
-    sent = 0
-    while sent < count:
-        msg = master.recv_match(
-            type=['MISSION_REQUEST_INT', 'MISSION_ACK'],
-            blocking=True,
-            timeout=5
-        )
-        if msg is None:
-            # ПРОВЕРКА ПРОТОКОЛА: обработка таймаута
-            continue
-
-        if msg.get_type() == 'MISSION_REQUEST_INT':
-            seq = msg.seq
-
-            # ВАЛИДАЦИЯ ДАННЫХ: проверяем, что seq в диапазоне [0, count-1]
-            if seq < 0 or seq >= count:
-                print(f"Получен запрос миссии с некорректным seq={seq}, ожидаем 0..{count-1}")
-                # ПРОВЕРКА ПРОТОКОЛА: игнорируем некорректный запрос
-                continue
-
-            item = items[seq]
-
-            # ПРОВЕРКА ПРОТОКОЛА: отправка точки с подтверждением типа миссии
-            master.mav.mission_item_int_send(
-                master.target_system,
-                master.target_component,
-                item.seq,
-                item.frame,
-                item.command,
-                item.current,
-                item.autocontinue,
-                item.param1,
-                item.param2,
-                item.param3,
-                item.param4,
-                item.x,
-                item.y,
-                item.z,
-                mavutil.mavlink.MAV_MISSION_TYPE_MISSION  # подтверждение типа
-            )
-            sent += 1
-
-        elif msg.get_type() == 'MISSION_ACK':
-            # ПРОВЕРКА ПРОТОКОЛА: получение финального подтверждения
-            print("MISSION_ACK получен, загрузка миссии завершена.")
-            # В реальном коде здесь проверяем msg.type == MAV_MISSION_ACCEPTED
-            break
-
-
-def download_mission(master: mavutil.mavlink_connection) -> List[MissionItem]:
+
+def sync_mission(master: mavutil.mavlink_connection, items: List[MissionItem],
+                 max_duration: Optional[float] = None) -> TransferStats:
+    """
+    Загрузка миссии с передачей только изменённых пунктов:
+    сравнивает items с последней подтверждённой копией на борту и отправляет
+    отличающийся диапазон через MISSION_WRITE_PARTIAL_LIST.
+    Если отпечаток миссии совпал и борт подтверждает ту же миссию - ничего не передаётся.
+    Если копии нет или изменилось число пунктов - полная загрузка.
+    """
+    if len(items) == 0:
+        return TransferStats()
+
+    stats = mission_sync.upload(master, items, max_duration=max_duration)
+    print(f"Миссия на борту синхронизирована: {stats}")
+    return stats
+
+
+def download_mission(master: mavutil.mavlink_connection,
+                     max_duration: Optional[float] = None) -> List[MissionItem]:
     """
     Чтение миссии по протоколу Mission Protocol:
     1) MISSION_REQUEST_LIST
     2) получение MISSION_COUNT
-    3) цикл: MISSION_REQUEST_INT -> MISSION_ITEM_INT
+    3) MISSION_REQUEST_INT -> MISSION_ITEM_INT для каждого недостающего пункта
+    4) MISSION_ACK
+    Возвращает полную миссию или бросает MissionTransferError (со статистикой).
     """
-    # ПРОВЕРКА ПРОТОКОЛА: начало обмена
-    master.mav.mission_request_list_send(
-        master.target_system,
-        master.target_component
-    )
+    def cached(count, opaque_id):
+        # Борт сообщил тот же opaque_id, что и у нашей копии - пункты не запрашиваем
+        items = mission_sync.cached_download(master, VehicleMissionState(count, opaque_id))
+        if items is not None:
+            print("Миссия на борту не менялась, используем сохранённую копию.")
+        return items
 
-    # ПРОВЕРКА ПРОТОКОЛА: ожидание ответа с таймаутом
-    msg = master.recv_match(type=['MISSION_COUNT'], blocking=True, timeout=5)
-    if msg is None:
-        return []  # ПРОВЕРКА: таймаут протокола
-
-    count = msg.count
-    items: List[MissionItem] = []
-
-    for seq in range(count):
-        # ПРОВЕРКА ПРОТОКОЛА: запрос каждой точки
-        master.mav.mission_request_int_send(
-            master.target_system,
-            master.target_component,
-            seq,
-            mavutil.mavlink.MAV_MISSION_TYPE_MISSION  # подтверждение типа
-        )
+    downloader = MissionDownloader(master, max_duration=max_duration,
+                                   item_factory=MissionItem.from_message, cached=cached)
+    stats = run_transfer(master, downloader)
+    if stats.items:
+        print(f"Миссия прочитана: {stats}")
 
-        # ПРОВЕРКА ПРОТОКОЛА: получение точки
-        item_msg = master.recv_match(type=['MISSION_ITEM_INT'], blocking=True, timeout=5)
-        if item_msg is None:
-            continue  # ПРОВЕРКА: пропуск точки при таймауте
-
-        # ВАЛИДАЦИЯ ДАННЫХ: создание объекта из полученных данных
-        items.append(
-            MissionItem(
-                seq=item_msg.seq,
-                frame=item_msg.frame,
-                command=item_msg.command,
-                current=item_msg.current,
-                autocontinue=item_msg.autocontinue,
-                param1=item_msg.param1,
-                param2=item_msg.param2,
-                param3=item_msg.param3,
-                param4=item_msg.param4,
-                x=item_msg.x,
-                y=item_msg.y,
-                z=item_msg.z,
-            )
-        )
+    # Полностью скачанная миссия - это и есть подтверждённая копия борта
+    mission_sync.confirm(master, downloader.items, downloader.opaque_id)
+    return downloader.items
 
-    return items
+
+def build_mission(coordinates: list,  # список кортежей [(lat1, lon1), (lat2, lon2), ...]
+                  altitude: float = 50.0) -> MissionBatch:
+    """Пункты NAV_WAYPOINT по списку координат на одной относительной высоте"""
+    return MissionBatch.from_coordinates(coordinates, altitude)
 
 
 # Рабочая функция для основной программы с маркерами на карте
@@ -179,46 +299,53 @@ def send_waypoints_to_drone(master: mavutil.mavlink_connection,
         print("Ошибка: список координат пуст")
         return False
 
+    try:
+        mission = build_mission(coordinates, altitude)
+        mission.validate()
+    except MissionValidationError as e:
+        print(f"❌ {e}")
+        return False
+
+    # Построчный вывод тысяч точек занимает больше времени, чем их подготовка - печатаем только края
+    first_lat, first_lon = coordinates[0]
+    last_lat, last_lon = coordinates[-1]
+    print(f"Точки 1..{len(coordinates)}: от {first_lat:.7f}, {first_lon:.7f} "
+          f"до {last_lat:.7f}, {last_lon:.7f}, высота {altitude}м")
+    return send_mission_to_drone(master, mission)
+
+
+def send_mission_to_drone(master: mavutil.mavlink_connection, mission_items: Sequence[MissionItem]) -> bool:
+    """
+    Отправляет готовые пункты миссии (например, загруженные из файла).
+    Возвращает True при успешной отправке, False при ошибке.
+    """
+    if not mission_items:
+        print("Ошибка: миссия пуста")
+        return False
+
     if not master:
         print("Ошибка: нет соединения с дроном")
         return False
 
-    # Очищаем старый маршрут
-    clear_mission(master)
-
-    mission_items = []
+    # Старый маршрут не очищаем: MISSION_COUNT заменяет миссию целиком,
+    # а при том же числе точек отправляются только изменённые
 
     try:
-        for i, (lat, lon) in enumerate(coordinates):
-            # Первая точка - текущая (current=1), остальные - нет (current=0)
-            current_flag = 1 if i == 0 else 0
-
-            item = MissionItem(
-                seq=i,
-                frame=mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT,
-                command=mavutil.mavlink.MAV_CMD_NAV_WAYPOINT,
-                current=current_flag,
-                autocontinue=1,
-                param1=0,  # Hold time (секунды)
-                param2=2,  # Acceptance radius (метры)
-                param3=0,  # Pass through waypoint
-                param4=0,  # Yaw angle
-                x=int(lat * SCALE_DEG),  # Широта * 1e7
-                y=int(lon * SCALE_DEG),  # Долгота * 1e7
-                z=altitude  # Высота
-            )
-            mission_items.append(item)
-            print(f"Точка {i + 1}: {lat:.7f}, {lon:.7f}, высота {altitude}м")
-
         print(f"Создано {len(mission_items)} точек маршрута")
 
-        # Отправляем миссию
-        upload_mission(master, mission_items)
+        # Отправляем миссию (только изменения относительно борта)
+        sync_mission(master, mission_items)
 
         print("✅ Маршрут успешно отправлен дрону!")
         print("   Переключите дрон в режим AUTO для начала полета")
         return True
 
+    except MissionTransferError as e:
+        print(f"❌ Ошибка отправки маршрута: {e}")
+        if e.stats is not None:
+            print(f"   {e.stats}")
+        return False
+
     except Exception as e:
         print(f"❌ Ошибка отправки маршрута: {e}")
         return False
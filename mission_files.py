@@ -0,0 +1,250 @@
+# mission_files.py
+
+import json
+import math
+import os
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from pymavlink import mavutil
+
+from mission_control import SCALE_DEG, MissionItem
+
+WAYPOINTS_HEADER = "QGC WPL 110"
+PLAN_FILE_TYPE = "Plan"
+PLAN_VERSION = 1
+PLAN_MISSION_VERSION = 2
+PLAN_GROUND_STATION = "MiniGCS"
+PLAN_FIRMWARE_ARDUPILOT = mavutil.mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA
+PLAN_VEHICLE_TYPE = mavutil.mavlink.MAV_TYPE_QUADROTOR
+PLAN_CRUISE_SPEED = 15      # м/с, значения по умолчанию QGroundControl
+PLAN_HOVER_SPEED = 5
+PLAN_ALTITUDE_MODE_RELATIVE = 1
+
+# В файлах координаты - градусы (MISSION_ITEM), у нас - MISSION_ITEM_INT (градусы * 1e7)
+_INT_FRAMES = {
+    mavutil.mavlink.MAV_FRAME_GLOBAL: mavutil.mavlink.MAV_FRAME_GLOBAL_INT,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT: mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT_INT,
+    mavutil.mavlink.MAV_FRAME_GLOBAL_TERRAIN_ALT: mavutil.mavlink.MAV_FRAME_GLOBAL_TERRAIN_ALT_INT,
+}
+_FILE_FRAMES = {int_frame: frame for frame, int_frame in _INT_FRAMES.items()}
+_GLOBAL_FRAMES = frozenset(_INT_FRAMES) | frozenset(_FILE_FRAMES)
+
+
+class MissionFileError(Exception):
+    """Файл миссии не читается: неизвестный формат или повреждённая строка"""
+
+
+class MissionFile(NamedTuple):
+    """Содержимое файла миссии"""
+    items: List[MissionItem]
+    home: Optional[Tuple[float, float, float]]     # (lat, lon, alt) или None
+
+
+def mission_positions(items: Iterable[MissionItem]) -> List[Tuple[float, float]]:
+    """Координаты (lat, lon) пунктов с положением на карте (команды без координат пропускаются)"""
+    return [(item.x / SCALE_DEG, item.y / SCALE_DEG) for item in items
+            if item.frame in _GLOBAL_FRAMES and (item.x or item.y)]
+
+
+def _item(seq: int, frame: int, command: int, current: int, autocontinue: int,
+          params: Sequence[float], lat: float, lon: float, alt: float) -> MissionItem:
+    return MissionItem(seq, _INT_FRAMES.get(frame, frame), command, current, autocontinue,
+                       params[0], params[1], params[2], params[3],
+                       round(lat * SCALE_DEG), round(lon * SCALE_DEG), alt)
+
+
+# --- Mission Planner (.waypoints) ---
+
+def iter_waypoints(lines: Iterable[str], home: Optional[list] = None) -> Iterator[MissionItem]:
+    """
+    Пункты миссии из строк файла .waypoints (QGC WPL 110) по одной строке, без чтения файла целиком.
+    Строка с seq 0 - точка Home: она кладётся в home (если передан список), а не в миссию.
+    Остальные пункты нумеруются заново с 0.
+    """
+    lines = iter(lines)
+    header = next(lines, "").strip()
+    if not header.startswith("QGC WPL"):
+        raise MissionFileError(f"Нет заголовка {WAYPOINTS_HEADER!r}")
+
+    seq = 0
+    for number, line in enumerate(lines, start=2):
+        fields = line.split()
+        if not fields:
+            continue
+        if len(fields) != 12:
+            raise MissionFileError(f"Строка {number}: ожидается 12 полей, найдено {len(fields)}")
+        try:
+            file_seq = int(fields[0])
+            current, frame, command = int(fields[1]), int(fields[2]), int(fields[3])
+            p1, p2, p3, p4, lat, lon, alt = map(float, fields[4:11])
+            autocontinue = int(float(fields[11]))
+        except ValueError as e:
+            raise MissionFileError(f"Строка {number}: {e}") from None
+        if file_seq == 0:
+            if home is not None:
+                home[:] = (lat, lon, alt)
+            continue
+        yield _item(seq, frame, command, 1 if seq == 0 else 0, autocontinue, (p1, p2, p3, p4), lat, lon, alt)
+        seq += 1
+
+
+def read_waypoints(path: str) -> MissionFile:
+    home = []
+    with open(path, encoding="utf-8") as f:
+        items = list(iter_waypoints(f, home))
+    return MissionFile(items, tuple(home) if home else None)
+
+
+def write_waypoints(path: str, items: Sequence[MissionItem],
+                    home: Optional[Tuple[float, float, float]] = None) -> None:
+    """
+    Сохраняет миссию в .waypoints. Первая строка - Home (seq 0), как у Mission Planner;
+    если Home не задан, берётся положение первого пункта.
+    """
+    if home is None:
+        positions = mission_positions(items[:1])
+        home = positions[0] + (0.0,) if positions else (0.0, 0.0, 0.0)
+    lines = [WAYPOINTS_HEADER,
+             _waypoint_line(0, 1, mavutil.mavlink.MAV_FRAME_GLOBAL, mavutil.mavlink.MAV_CMD_NAV_WAYPOINT,
+                            (0, 0, 0, 0), home[0], home[1], home[2], 1)]
+    for seq, item in enumerate(items, start=1):
+        lines.append(_waypoint_line(seq, 0, _FILE_FRAMES.get(item.frame, item.frame), item.command,
+                                    (item.param1, item.param2, item.param3, item.param4),
+                                    item.x / SCALE_DEG, item.y / SCALE_DEG, item.z, item.autocontinue))
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("\n".join(lines))
+        f.write("\n")
+
+
+def _waypoint_line(seq, current, frame, command, params, lat, lon, alt, autocontinue) -> str:
+    return (f"{seq}\t{current}\t{frame}\t{command}\t"
+            f"{params[0]:.8f}\t{params[1]:.8f}\t{params[2]:.8f}\t{params[3]:.8f}\t"
+            f"{lat:.8f}\t{lon:.8f}\t{alt:.6f}\t{autocontinue}")
+
+
+# --- QGroundControl (.plan) ---
+
+def iter_plan_items(plan_items: Iterable[dict]) -> Iterator[MissionItem]:
+    """
+    Пункты миссии из mission.items файла .plan.
+    Сложные пункты (съёмка, коридор) разворачиваются в их готовые простые пункты,
+    остальные ComplexItem без развёрнутых пунктов пропускаются.
+    """
+    seq = 0
+    skipped = 0
+    for plan_item in plan_items:
+        item_type = plan_item.get("type")
+        if item_type == "SimpleItem":
+            simple_items = (plan_item,)
+        elif item_type == "ComplexItem":
+            simple_items = plan_item.get("TransectStyleComplexItem", {}).get("Items")
+            if not simple_items:
+                skipped += 1
+                continue
+        else:
+            raise MissionFileError(f"Неизвестный тип пункта миссии: {item_type!r}")
+
+        for simple in simple_items:
+            params = [math.nan if p is None else p for p in simple.get("params", ())]
+            if len(params) != 7:
+                raise MissionFileError(f"Пункт {seq + 1}: ожидается 7 параметров, найдено {len(params)}")
+            lat, lon, alt = (0.0 if math.isnan(p) else p for p in params[4:7])
+            yield _item(seq, simple["frame"], simple["command"], 1 if seq == 0 else 0,
+                        1 if simple.get("autoContinue", True) else 0, params, lat, lon, alt)
+            seq += 1
+
+    if skipped:
+        print(f"Пропущено сложных пунктов без развёрнутых точек: {skipped}")
+
+
+def read_plan(path: str) -> MissionFile:
+    # json.load - разбор на C; пункты из готового списка превращаются в MissionItem за один проход
+    with open(path, encoding="utf-8") as f:
+        try:
+            plan = json.load(f)
+        except ValueError as e:
+            raise MissionFileError(f"Некорректный JSON: {e}") from None
+    if plan.get("fileType") != PLAN_FILE_TYPE:
+        raise MissionFileError(f"Это не файл миссии QGroundControl: fileType={plan.get('fileType')!r}")
+
+    mission = plan.get("mission", {})
+    try:
+        items = list(iter_plan_items(mission.get("items", ())))
+    except (KeyError, TypeError) as e:
+        raise MissionFileError(f"Повреждённый пункт миссии: {e!r}") from None
+    home = mission.get("plannedHomePosition")
+    return MissionFile(items, tuple(home) if home else None)
+
+
+def write_plan(path: str, items: Sequence[MissionItem],
+               home: Optional[Tuple[float, float, float]] = None) -> None:
+    if home is None:
+        positions = mission_positions(items[:1])
+        home = positions[0] + (0.0,) if positions else (0.0, 0.0, 0.0)
+    plan = {
+        "fileType": PLAN_FILE_TYPE,
+        "groundStation": PLAN_GROUND_STATION,
+        "version": PLAN_VERSION,
+        "geoFence": {"circles": [], "polygons": [], "version": 2},
+        "rallyPoints": {"points": [], "version": 2},
+        "mission": {
+            "cruiseSpeed": PLAN_CRUISE_SPEED,
+            "hoverSpeed": PLAN_HOVER_SPEED,
+            "firmwareType": PLAN_FIRMWARE_ARDUPILOT,
+            "vehicleType": PLAN_VEHICLE_TYPE,
+            "globalPlanAltitudeMode": PLAN_ALTITUDE_MODE_RELATIVE,
+            "plannedHomePosition": list(home),
+            "version": PLAN_MISSION_VERSION,
+            "items": [_plan_item(item) for item in items],
+        },
+    }
+    # Без indent: форматирование с отступами в json идёт на Python и на больших миссиях в разы медленнее
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(plan))
+
+
+def _plan_item(item: MissionItem) -> dict:
+    # NaN в JSON не бывает: QGroundControl пишет его как null
+    params = [None if isinstance(p, float) and math.isnan(p) else p
+              for p in (item.param1, item.param2, item.param3, item.param4,
+                        item.x / SCALE_DEG, item.y / SCALE_DEG, item.z)]
+    return {
+        "AMSLAltAboveTerrain": None,
+        "Altitude": item.z,
+        "AltitudeMode": PLAN_ALTITUDE_MODE_RELATIVE,
+        "autoContinue": bool(item.autocontinue),
+        "command": item.command,
+        "doJumpId": item.seq + 1,
+        "frame": _FILE_FRAMES.get(item.frame, item.frame),
+        "params": params,
+        "type": "SimpleItem",
+    }
+
+
+# --- выбор формата по расширению ---
+
+_READERS = {".plan": read_plan, ".waypoints": read_waypoints, ".txt": read_waypoints}
+_WRITERS = {".plan": write_plan, ".waypoints": write_waypoints, ".txt": write_waypoints}
+
+FILE_TYPES = [("Миссия QGroundControl", "*.plan"), ("Миссия Mission Planner", "*.waypoints *.txt")]
+
+
+def load_mission(path: str) -> MissionFile:
+    """Читает миссию из .plan или .waypoints (формат по расширению файла)"""
+    reader = _READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        raise MissionFileError(f"Неизвестный формат файла миссии: {path}")
+    mission = reader(path)
+    print(f"Загружена миссия из {path}: {len(mission.items)} пунктов")
+    return mission
+
+
+def save_mission(path: str, items: Sequence[MissionItem],
+                 home: Optional[Tuple[float, float, float]] = None) -> bool:
+    """Сохраняет миссию в .plan или .waypoints (формат по расширению файла)"""
+    writer = _WRITERS.get(os.path.splitext(path)[1].lower())
+    if writer is None:
+        raise MissionFileError(f"Неизвестный формат файла миссии: {path}")
+    writer(path, items, home)
+    print(f"Миссия сохранена в {path}: {len(items)} пунктов")
+    return True
@@ -0,0 +1,207 @@
+# mission_sync.py
+
+import copy
+import hashlib
+import struct
+import threading
+import weakref
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+from pymavlink import mavutil
+
+from mavlink_reader import subscribe
+from mission_transfer import MissionUploader, TransferStats, run_transfer
+
+QUERY_TIMEOUT = 1.5     # Ожидание MISSION_COUNT при проверке миссии на борту (секунды)
+QUERY_RETRIES = 2
+
+# Поля MISSION_ITEM_INT в том виде, в каком они уходят в автопилот
+_ITEM_STRUCT = struct.Struct('<HBHBBffffiif')
+
+
+def mission_fingerprint(items: Sequence) -> str:
+    """
+    Отпечаток (хеш содержимого) миссии по полям MissionItem.
+    Одинаковые миссии дают одинаковый отпечаток независимо от того,
+    когда и как были построены объекты пунктов.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(len(items).to_bytes(4, 'little'))
+    for seq, item in enumerate(items):
+        digest.update(_ITEM_STRUCT.pack(
+            seq, item.frame, item.command, item.current, item.autocontinue,
+            item.param1, item.param2, item.param3, item.param4,
+            item.x, item.y, item.z
+        ))
+    return digest.hexdigest()
+
+
+def changed_range(old: Sequence, new: Sequence) -> Optional[Tuple[int, int]]:
+    """
+    Диапазон [start, end] отличающихся пунктов двух миссий одинаковой длины.
+    None - миссии совпадают.
+    """
+    count = len(new)
+    start = 0
+    while start < count and old[start] == new[start]:
+        start += 1
+    if start == count:
+        return None
+    end = count - 1
+    while end > start and old[end] == new[end]:
+        end -= 1
+    return start, end
+
+
+class VehicleMissionState(NamedTuple):
+    """Что автопилот сообщает о своей миссии в MISSION_COUNT"""
+    count: int
+    opaque_id: int  # 0 - автопилот (или диалект pymavlink) не поддерживает opaque_id
+
+
+def query_vehicle_mission(master: mavutil.mavlink_connection,
+                          mission_type: int = mavutil.mavlink.MAV_MISSION_TYPE_MISSION,
+                          timeout: float = QUERY_TIMEOUT, retries: int = QUERY_RETRIES
+                          ) -> Optional[VehicleMissionState]:
+    """
+    Спрашивает у автопилота число пунктов и opaque_id миссии (MISSION_REQUEST_LIST -> MISSION_COUNT).
+    Сами пункты не запрашиваются. None - автопилот не ответил.
+    """
+    def is_our_count(msg):
+        return (msg.get_srcSystem() == master.target_system
+                and getattr(msg, 'mission_type', mission_type) == mission_type)
+
+    with subscribe(master, 'MISSION_COUNT') as replies:
+        for attempt in range(retries):
+            master.mav.mission_request_list_send(master.target_system, master.target_component, mission_type)
+            msg = replies.get(timeout=timeout, condition=is_our_count)
+            if msg is not None:
+                # Завершаем обмен: пункты нам не нужны
+                master.mav.mission_ack_send(master.target_system, master.target_component,
+                                            mavutil.mavlink.MAV_MISSION_ACCEPTED, mission_type)
+                return VehicleMissionState(msg.count, getattr(msg, 'opaque_id', 0))
+    return None
+
+
+class _VehicleMission:
+    """Подтверждённая копия миссии на борту одного аппарата"""
+
+    def __init__(self, master, items, opaque_id=0):
+        self.master_ref = weakref.ref(master)
+        self.items = [copy.copy(item) for item in items]
+        self.fingerprint = mission_fingerprint(items)
+        self.opaque_id = opaque_id
+
+    def agrees_with(self, master, state: Optional[VehicleMissionState]) -> bool:
+        """
+        Совпадает ли копия с тем, что сейчас на борту.
+        Если автопилот сообщает opaque_id - сравниваем его (работает и после переподключения).
+        Иначе доверяем копии только в том же соединении и при том же числе пунктов.
+        """
+        if state is None or state.count != len(self.items):
+            return False
+        if state.opaque_id and self.opaque_id:
+            return state.opaque_id == self.opaque_id
+        return self.master_ref() is master
+
+
+class MissionSync:
+    """
+    Синхронизация миссии с учётом того, что уже есть на борту.
+    Для каждого аппарата хранится последняя подтверждённая автопилотом копия миссии
+    (MISSION_ACK после загрузки или полное скачивание) и её отпечаток.
+    - отпечаток совпал и борт подтверждает ту же миссию - передача пропускается;
+    - то же число пунктов - отправляется только изменённый диапазон (MISSION_WRITE_PARTIAL_LIST);
+    - иначе полная загрузка (MISSION_COUNT).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vehicles = {}
+
+    @staticmethod
+    def vehicle_key(master: mavutil.mavlink_connection) -> tuple:
+        return master.target_system, master.target_component
+
+    def _entry(self, master) -> Optional[_VehicleMission]:
+        with self._lock:
+            return self._vehicles.get(self.vehicle_key(master))
+
+    def confirmed(self, master: mavutil.mavlink_connection,
+                  state: Optional[VehicleMissionState] = None) -> Optional[list]:
+        """
+        Подтверждённая копия миссии аппарата или None.
+        Без state (ответа борта) копия действительна только в том соединении,
+        в котором получена: после переподключения миссию мог поменять кто-то другой.
+        """
+        entry = self._entry(master)
+        if entry is None:
+            return None
+        if state is None:
+            return entry.items if entry.master_ref() is master else None
+        return entry.items if entry.agrees_with(master, state) else None
+
+    def cached_download(self, master: mavutil.mavlink_connection,
+                        state: VehicleMissionState) -> Optional[list]:
+        """
+        Копия для download_mission без передачи пунктов.
+        Только по opaque_id: без него нельзя быть уверенным, что миссию не поменял другой GCS.
+        """
+        entry = self._entry(master)
+        if entry is None or not state.opaque_id or state.opaque_id != entry.opaque_id:
+            return None
+        if state.count != len(entry.items):
+            return None
+        return [copy.copy(item) for item in entry.items]
+
+    def confirm(self, master: mavutil.mavlink_connection, items: Sequence, opaque_id: int = 0) -> None:
+        with self._lock:
+            self._vehicles[self.vehicle_key(master)] = _VehicleMission(master, items, opaque_id)
+
+    def forget(self, master: mavutil.mavlink_connection) -> None:
+        with self._lock:
+            self._vehicles.pop(self.vehicle_key(master), None)
+
+    def upload(self, master: mavutil.mavlink_connection, items: Sequence,
+               max_duration: Optional[float] = None) -> TransferStats:
+        """
+        Загружает миссию, отправляя только отличия от подтверждённой копии.
+        При неудаче копия забывается (состояние борта неизвестно) и исключение пробрасывается.
+        """
+        entry = self._entry(master)
+        if entry is not None:
+            # Один короткий обмен вместо полной загрузки: что сейчас на борту?
+            state = query_vehicle_mission(master)
+            if not entry.agrees_with(master, state):
+                print("Миссия на борту изменилась или не подтверждена, нужна полная загрузка.")
+                self.forget(master)
+                entry = None
+
+        changes = None
+        if entry is not None and len(entry.items) == len(items):
+            changes = changed_range(entry.items, items)
+            if changes is None or entry.fingerprint == mission_fingerprint(items):
+                print("Миссия на борту совпадает с отправляемой, загрузка пропущена.")
+                return TransferStats()
+
+        if changes is not None:
+            start, end = changes
+            print(f"Загружаем изменённые пункты {start}..{end} из {len(items)}")
+            uploader = MissionUploader(master, items, max_duration=max_duration,
+                                       start_index=start, end_index=end)
+        else:
+            uploader = MissionUploader(master, items, max_duration=max_duration)
+
+        try:
+            stats = run_transfer(master, uploader)
+        except Exception:
+            self.forget(master)
+            raise
+
+        # opaque_id из ACK частичной загрузки тоже описывает всю миссию на борту
+        self.confirm(master, items, uploader.opaque_id)
+        return stats
+
+
+# Общий реестр подтверждённых миссий для всех соединений программы
+mission_sync = MissionSync()
@@ -0,0 +1,557 @@
+# mission_transfer.py
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Sequence
+
+from pymavlink import mavutil
+
+from mavlink_reader import subscribe
+
+# Адаптивный таймаут ожидания ответа (как RTO в TCP, RFC 6298)
+RTO_INITIAL = 1.5       # Начальный таймаут, пока нет замеров RTT (секунды)
+RTO_MIN = 0.3           # Нижняя граница таймаута
+RTO_MAX = 5.0           # Верхняя граница таймаута (прежний фиксированный таймаут)
+RTT_ALPHA = 1 / 8       # Вес нового замера в сглаженном RTT
+RTT_BETA = 1 / 4        # Вес нового замера в разбросе RTT
+
+MAX_RETRIES = 8                 # Сколько раз подряд можно повторить один шаг обмена
+MAX_DURATION_BASE = 10.0        # Общий лимит времени передачи: база (секунды)
+MAX_DURATION_PER_ITEM = 0.5     # ... плюс столько секунд на каждый пункт миссии
+DOWNLOAD_WINDOW = 4             # Сколько MISSION_REQUEST_INT может ждать ответа одновременно
+
+# Ошибки MISSION_ACK, после которых передачу можно продолжать:
+# автопилот ругается на повтор уже принятого пункта
+NON_FATAL_ACK_TYPES = (
+    mavutil.mavlink.MAV_MISSION_INVALID_SEQUENCE,
+)
+
+
+class MissionTransferError(Exception):
+    """Передача миссии не завершилась (таймаут, отказ автопилота, лимит времени)"""
+
+    def __init__(self, message, stats=None):
+        super().__init__(message)
+        self.stats = stats
+
+
+def mission_result_name(result: int) -> str:
+    """Имя кода MAV_MISSION_RESULT для сообщений об ошибках"""
+    entry = mavutil.mavlink.enums['MAV_MISSION_RESULT'].get(result)
+    return entry.name if entry is not None else str(result)
+
+
+class RttEstimator:
+    """
+    Оценка времени ответа канала (RTT) и таймаута повтора (RTO).
+    Замеры берутся только по обменам без повторов (алгоритм Карна),
+    при каждом повторе таймаут удваивается до RTO_MAX.
+    """
+
+    def __init__(self, rto_initial=RTO_INITIAL, rto_min=RTO_MIN, rto_max=RTO_MAX):
+        self.rto_min = rto_min
+        self.rto_max = rto_max
+        self.srtt = None
+        self.rttvar = None
+        self.rto = rto_initial
+        self.backoff = 1
+
+    def sample(self, rtt: float) -> None:
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * rtt
+        self.rto = min(self.rto_max, max(self.rto_min, self.srtt + 4 * self.rttvar))
+        self.backoff = 1
+
+    def on_retransmit(self) -> None:
+        self.backoff = min(self.backoff * 2, 64)
+
+    @property
+    def timeout(self) -> float:
+        return min(self.rto_max, self.rto * self.backoff)
+
+
+@dataclass
+class TransferStats:
+    """Статистика одной передачи миссии"""
+    items: int = 0
+    elapsed: float = 0.0
+    retransmits: int = 0
+    duplicate_requests: int = 0
+    rtt_samples: int = 0
+    rtt_sum: float = 0.0
+    rtt_min: Optional[float] = None
+    rtt_max: Optional[float] = None
+
+    def add_rtt(self, rtt: float) -> None:
+        self.rtt_samples += 1
+        self.rtt_sum += rtt
+        self.rtt_min = rtt if self.rtt_min is None else min(self.rtt_min, rtt)
+        self.rtt_max = rtt if self.rtt_max is None else max(self.rtt_max, rtt)
+
+    @property
+    def rtt_avg(self) -> Optional[float]:
+        return self.rtt_sum / self.rtt_samples if self.rtt_samples else None
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        rtt = (f"{self.rtt_avg * 1000:.0f} мс ({self.rtt_min * 1000:.0f}..{self.rtt_max * 1000:.0f})"
+               if self.rtt_samples else "нет данных")
+        return (f"{self.items} пунктов за {self.elapsed:.2f} с ({self.items_per_second:.1f} пунктов/с), "
+                f"повторов: {self.retransmits}, повторных запросов: {self.duplicate_requests}, RTT: {rtt}")
+
+
+class MissionUploader:
+    """
+    Конечный автомат загрузки миссии в автопилот (Mission Protocol, сторона GCS).
+    Не читает сокет сам: драйвер (run_transfer или asyncio-версия) передаёт ему
+    ответы автопилота через handle() и вызывает poll(), когда истёк таймаут.
+
+    - MISSION_COUNT (или MISSION_WRITE_PARTIAL_LIST при частичной загрузке
+      диапазона start_index..end_index) повторяется, пока автопилот не запросил первый пункт;
+    - пункт повторяется, если за RTO не пришёл следующий запрос или ACK;
+    - повторный MISSION_REQUEST_INT на уже отправленный пункт просто обслуживается ещё раз;
+    - MISSION_ACK ACCEPTED засчитывается только после отправки последнего пункта
+      (ранний ACK - это ответ на MISSION_CLEAR_ALL);
+    - общий лимит времени и лимит повторов не дают зависнуть на плохом канале.
+    """
+
+    REPLY_TYPES = ('MISSION_REQUEST_INT', 'MISSION_REQUEST', 'MISSION_ACK')
+
+    def __init__(self, master: mavutil.mavlink_connection, items: Sequence,
+                 mission_type: int = mavutil.mavlink.MAV_MISSION_TYPE_MISSION,
+                 max_duration: Optional[float] = None, max_retries: int = MAX_RETRIES,
+                 rtt: Optional[RttEstimator] = None,
+                 start_index: int = 0, end_index: Optional[int] = None):
+        self.master = master
+        self.items = items
+        self.count = len(items)
+        self.mission_type = mission_type
+        self.max_retries = max_retries
+
+        # Частичная загрузка: автопилот запросит только пункты start_index..end_index
+        self.partial = end_index is not None
+        self.first_seq = start_index
+        self.last_seq = end_index if self.partial else self.count - 1
+        if self.partial and not (0 <= self.first_seq <= self.last_seq < self.count):
+            raise ValueError(f"Некорректный диапазон {start_index}..{end_index} для миссии из {self.count} пунктов")
+
+        if max_duration is None:
+            max_duration = MAX_DURATION_BASE + MAX_DURATION_PER_ITEM * (self.last_seq - self.first_seq + 1)
+        self.max_duration = max_duration
+        self.rtt = rtt if rtt is not None else RttEstimator()
+        self.stats = TransferStats()
+
+        self.finished = False
+        self.error = None
+        self.opaque_id = 0          # Идентификатор миссии из MISSION_ACK (если автопилот его сообщает)
+        self._start_time = None
+        self._last_sent = None      # seq последнего отправленного пункта (None - отправлен COUNT)
+        self._last_send_time = None
+        self._retransmitted = False # Текущий шаг уже повторялся (его RTT не замеряем)
+        self._retries = 0
+        self._sent = set()
+        self._deadline = None
+
+    # --- отправка ---
+
+    def _send_start(self) -> None:
+        """Начало обмена: MISSION_COUNT или MISSION_WRITE_PARTIAL_LIST"""
+        if self.partial:
+            self.master.mav.mission_write_partial_list_send(
+                self.master.target_system, self.master.target_component,
+                self.first_seq, self.last_seq, self.mission_type
+            )
+            return
+        self.master.mav.mission_count_send(
+            self.master.target_system, self.master.target_component,
+            self.count, self.mission_type
+        )
+
+    def _send_item(self, seq: int) -> None:
+        item = self.items[seq]
+        self.master.mav.mission_item_int_send(
+            self.master.target_system,
+            self.master.target_component,
+            seq,
+            item.frame,
+            item.command,
+            item.current,
+            item.autocontinue,
+            item.param1,
+            item.param2,
+            item.param3,
+            item.param4,
+            item.x,
+            item.y,
+            item.z,
+            self.mission_type
+        )
+
+    def _arm_timer(self, now: float) -> None:
+        self._last_send_time = now
+        self._deadline = now + self.rtt.timeout
+
+    # --- интерфейс драйвера ---
+
+    def start(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._start_time = now
+        if self.count == 0:
+            self._finish(now)
+            return
+        self._send_start()
+        self._arm_timer(now)
+
+    def time_to_deadline(self, now: Optional[float] = None) -> float:
+        """Сколько ещё можно ждать ответа до повтора или общего таймаута"""
+        now = time.monotonic() if now is None else now
+        limit = self._start_time + self.max_duration
+        return max(0.0, min(self._deadline, limit) - now)
+
+    def handle(self, msg, now: Optional[float] = None) -> None:
+        if self.finished or not self._is_for_us(msg):
+            return
+        now = time.monotonic() if now is None else now
+
+        if msg.get_type() == 'MISSION_ACK':
+            self._handle_ack(msg, now)
+            return
+
+        seq = msg.seq
+        if seq < self.first_seq or seq > self.last_seq:
+            print(f"Получен запрос миссии с некорректным seq={seq}, ожидаем {self.first_seq}..{self.last_seq}")
+            return
+
+        if seq in self._sent:
+            # Повторный запрос (наш пункт или следующий запрос потерялся) - отвечаем тем же пунктом
+            self.stats.duplicate_requests += 1
+            self.stats.retransmits += 1
+            self._send_item(seq)
+            self._last_sent = seq
+            self._retransmitted = True
+            self._arm_timer(now)
+            return
+
+        # Новый запрос - предыдущий шаг обмена подтверждён
+        self._sample_rtt(now)
+        self._sent.add(seq)
+        self.stats.items = len(self._sent)
+        self._send_item(seq)
+        self._last_sent = seq
+        self._retries = 0
+        self._arm_timer(now)
+
+    def poll(self, now: Optional[float] = None) -> None:
+        """Проверка таймаутов: повтор последнего шага или завершение с ошибкой"""
+        if self.finished:
+            return
+        now = time.monotonic() if now is None else now
+
+        if now - self._start_time >= self.max_duration:
+            self._fail(now, f"Превышено время передачи миссии ({self.max_duration:.0f} с)")
+            return
+        if now < self._deadline:
+            return
+
+        self._retries += 1
+        if self._retries > self.max_retries:
+            self._fail(now, f"Автопилот не отвечает после {self.max_retries} повторов")
+            return
+
+        self.rtt.on_retransmit()
+        self.stats.retransmits += 1
+        self._retransmitted = True
+        if self._last_sent is None:
+            self._send_start()
+        else:
+            self._send_item(self._last_sent)
+        self._arm_timer(now)
+
+    # --- внутреннее ---
+
+    def _is_for_us(self, msg) -> bool:
+        if msg.get_srcSystem() != self.master.target_system:
+            return False
+        return getattr(msg, 'mission_type', self.mission_type) == self.mission_type
+
+    def _sample_rtt(self, now: float) -> None:
+        if not self._retransmitted and self._last_send_time is not None:
+            rtt = now - self._last_send_time
+            self.rtt.sample(rtt)
+            self.stats.add_rtt(rtt)
+        self._retransmitted = False
+
+    def _handle_ack(self, msg, now: float) -> None:
+        if msg.type == mavutil.mavlink.MAV_MISSION_ACCEPTED:
+            if self.last_seq in self._sent:
+                self._sample_rtt(now)
+                self.opaque_id = getattr(msg, 'opaque_id', 0)
+                self._finish(now)
+            # Иначе это ACK на MISSION_CLEAR_ALL или прошлую загрузку - игнорируем
+            return
+        if msg.type in NON_FATAL_ACK_TYPES:
+            return
+        self._fail(now, f"Автопилот отклонил миссию: {mission_result_name(msg.type)}")
+
+    def _finish(self, now: float) -> None:
+        self.finished = True
+        self.stats.elapsed = now - self._start_time
+
+    def _fail(self, now: float, error: str) -> None:
+        self.error = error
+        self._finish(now)
+
+
+class MissionDownloader:
+    """
+    Конечный автомат чтения миссии из автопилота (Mission Protocol, сторона GCS).
+    Драйвер тот же, что у MissionUploader (run_transfer или asyncio-версия).
+
+    - MISSION_REQUEST_LIST повторяется, пока не пришёл MISSION_COUNT;
+    - хранится множество ещё не полученных seq, запрашиваются только они,
+      одновременно в полёте не больше window запросов;
+    - пункты принимаются в любом порядке, повторно пришедший пункт просто считается;
+    - запрос, на который за RTO не пришёл пункт, повторяется (только он, а не вся миссия);
+    - после получения всех пунктов автопилоту отправляется MISSION_ACK ACCEPTED;
+    - задержка ответа на каждый запрос попадает в stats (min/avg/max RTT).
+
+    cached(count, opaque_id) - необязательная проверка кэша: если она вернула список,
+    пункты не запрашиваются. item_factory(msg) превращает MISSION_ITEM_INT в пункт миссии.
+    """
+
+    REPLY_TYPES = ('MISSION_COUNT', 'MISSION_ITEM_INT', 'MISSION_ACK')
+
+    def __init__(self, master: mavutil.mavlink_connection,
+                 mission_type: int = mavutil.mavlink.MAV_MISSION_TYPE_MISSION,
+                 max_duration: Optional[float] = None, max_retries: int = MAX_RETRIES,
+                 rtt: Optional[RttEstimator] = None, window: int = DOWNLOAD_WINDOW,
+                 item_factory: Optional[Callable] = None, cached: Optional[Callable] = None):
+        self.master = master
+        self.mission_type = mission_type
+        self.max_retries = max_retries
+        self.window = max(1, window)
+        self.item_factory = item_factory if item_factory is not None else (lambda msg: msg)
+        self.cached = cached
+        # Пока число пунктов неизвестно, лимит считаем как для пустой миссии
+        self._fixed_duration = max_duration
+        self.max_duration = max_duration if max_duration is not None else MAX_DURATION_BASE
+        self.rtt = rtt if rtt is not None else RttEstimator()
+        self.stats = TransferStats()
+
+        self.count = None           # Число пунктов из MISSION_COUNT
+        self.opaque_id = 0
+        self.items = []             # Результат, упорядоченный по seq
+        self.finished = False
+        self.error = None
+        self._received = {}
+        self._missing = []          # Ещё не полученные seq по возрастанию
+        self._pending = {}          # seq -> (время отправки, был ли повтор)
+        self._start_time = None
+        self._list_sent_time = None
+        self._list_retransmitted = False
+        self._deadline = None
+        self._retries = 0
+
+    # --- отправка ---
+
+    def _send_request_list(self, now: float) -> None:
+        self.master.mav.mission_request_list_send(
+            self.master.target_system, self.master.target_component, self.mission_type
+        )
+        self._list_sent_time = now
+        self._deadline = now + self.rtt.timeout
+
+    def _send_request(self, seq: int, now: float, retransmit: bool = False) -> None:
+        self.master.mav.mission_request_int_send(
+            self.master.target_system, self.master.target_component, seq, self.mission_type
+        )
+        self._pending[seq] = (now, retransmit)
+
+    def _send_ack(self) -> None:
+        self.master.mav.mission_ack_send(
+            self.master.target_system, self.master.target_component,
+            mavutil.mavlink.MAV_MISSION_ACCEPTED, self.mission_type
+        )
+
+    def _fill_window(self, now: float) -> None:
+        """Запрашивает следующие недостающие пункты, пока окно не заполнено"""
+        for seq in self._missing:
+            if len(self._pending) >= self.window:
+                break
+            if seq not in self._pending:
+                self._send_request(seq, now)
+        self._rearm(now)
+
+    def _rearm(self, now: float) -> None:
+        if self._pending:
+            oldest = min(sent for sent, _ in self._pending.values())
+            self._deadline = oldest + self.rtt.timeout
+        else:
+            self._deadline = now + self.rtt.timeout
+
+    # --- интерфейс драйвера ---
+
+    def start(self, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._start_time = now
+        self._send_request_list(now)
+
+    def time_to_deadline(self, now: Optional[float] = None) -> float:
+        """Сколько ещё можно ждать ответа до повтора или общего таймаута"""
+        now = time.monotonic() if now is None else now
+        limit = self._start_time + self.max_duration
+        return max(0.0, min(self._deadline, limit) - now)
+
+    def handle(self, msg, now: Optional[float] = None) -> None:
+        if self.finished or not self._is_for_us(msg):
+            return
+        now = time.monotonic() if now is None else now
+
+        msg_type = msg.get_type()
+        if msg_type == 'MISSION_COUNT':
+            self._handle_count(msg, now)
+        elif msg_type == 'MISSION_ITEM_INT':
+            self._handle_item(msg, now)
+        elif msg_type == 'MISSION_ACK':
+            if msg.type == mavutil.mavlink.MAV_MISSION_ACCEPTED or msg.type in NON_FATAL_ACK_TYPES:
+                return
+            self._fail(now, f"Автопилот прервал чтение миссии: {mission_result_name(msg.type)}")
+
+    def poll(self, now: Optional[float] = None) -> None:
+        """Проверка таймаутов: повтор просроченных запросов или завершение с ошибкой"""
+        if self.finished:
+            return
+        now = time.monotonic() if now is None else now
+
+        if now - self._start_time >= self.max_duration:
+            self._fail(now, f"Превышено время чтения миссии ({self.max_duration:.0f} с), "
+                            f"не получено пунктов: {self._missing_count()}")
+            return
+        if now < self._deadline:
+            return
+
+        self._retries += 1
+        if self._retries > self.max_retries:
+            self._fail(now, f"Автопилот не отвечает после {self.max_retries} повторов, "
+                            f"не получено пунктов: {self._missing_count()}")
+            return
+
+        if self.count is None:
+            self.rtt.on_retransmit()
+            self.stats.retransmits += 1
+            self._list_retransmitted = True
+            self._send_request_list(now)
+            return
+
+        timeout = self.rtt.timeout
+        expired = [seq for seq, (sent, _) in self._pending.items() if now - sent >= timeout]
+        self.rtt.on_retransmit()
+        for seq in expired:
+            self.stats.retransmits += 1
+            self._send_request(seq, now, retransmit=True)
+        self._rearm(now)
+
+    # --- внутреннее ---
+
+    def _is_for_us(self, msg) -> bool:
+        if msg.get_srcSystem() != self.master.target_system:
+            return False
+        return getattr(msg, 'mission_type', self.mission_type) == self.mission_type
+
+    def _missing_count(self) -> int:
+        return len(self._missing) if self.count is not None else 0
+
+    def _handle_count(self, msg, now: float) -> None:
+        if self.count is not None:
+            # Повтор MISSION_COUNT на наш повторный MISSION_REQUEST_LIST
+            if msg.count != self.count:
+                self._fail(now, f"Число пунктов миссии изменилось во время чтения: {self.count} -> {msg.count}")
+            return
+
+        if not self._list_retransmitted:
+            self._sample_rtt(now - self._list_sent_time)
+        self._retries = 0
+        self.count = msg.count
+        self.opaque_id = getattr(msg, 'opaque_id', 0)
+        if self._fixed_duration is None:
+            self.max_duration = MAX_DURATION_BASE + MAX_DURATION_PER_ITEM * self.count
+
+        if self.cached is not None:
+            cached_items = self.cached(self.count, self.opaque_id)
+            if cached_items is not None:
+                self.items = cached_items
+                self._send_ack()
+                self._finish(now)
+                return
+
+        if self.count == 0:
+            self._send_ack()
+            self._finish(now)
+            return
+
+        self._missing = list(range(self.count))
+        self._fill_window(now)
+
+    def _handle_item(self, msg, now: float) -> None:
+        seq = msg.seq
+        if self.count is None or seq >= self.count:
+            print(f"Получен пункт миссии с некорректным seq={seq}")
+            return
+        if seq in self._received:
+            self.stats.duplicate_requests += 1
+            return
+
+        pending = self._pending.pop(seq, None)
+        if pending is not None:
+            sent, retransmitted = pending
+            # По Карну: задержку повторённого запроса не замеряем
+            if not retransmitted:
+                self._sample_rtt(now - sent)
+        self._received[seq] = self.item_factory(msg)
+        self._missing.remove(seq)
+        self.stats.items = len(self._received)
+        self._retries = 0
+
+        if not self._missing:
+            self.items = [self._received[i] for i in range(self.count)]
+            self._send_ack()
+            self._finish(now)
+            return
+        self._fill_window(now)
+
+    def _sample_rtt(self, rtt: float) -> None:
+        self.rtt.sample(rtt)
+        self.stats.add_rtt(rtt)
+
+    def _finish(self, now: float) -> None:
+        self.finished = True
+        self.stats.elapsed = now - self._start_time
+
+    def _fail(self, now: float, error: str) -> None:
+        self.error = error
+        self._finish(now)
+
+
+def run_transfer(master: mavutil.mavlink_connection, engine) -> TransferStats:
+    """
+    Синхронный драйвер конечного автомата передачи миссии.
+    Ответы автопилота берутся из очереди потока чтения (mavlink_reader).
+    """
+    with subscribe(master, engine.REPLY_TYPES) as replies:
+        engine.start()
+        while not engine.finished:
+            msg = replies.get(timeout=engine.time_to_deadline())
+            if msg is not None:
+                engine.handle(msg)
+            engine.poll()
+
+    if engine.error:
+        raise MissionTransferError(engine.error, engine.stats)
+    return engine.stats
@@ -0,0 +1,641 @@
+# mock_autopilot.py
+
+import argparse
+import heapq
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from pymavlink import mavutil
+
+MOCK_ADDRESS = "tcpin:127.0.0.1:14550"  # Адрес со стороны аппарата (GCS подключается к tcp:127.0.0.1:14550)
+MOCK_SYSTEM = 1
+MOCK_COMPONENT = 1
+
+HEARTBEAT_RATE_HZ = 1
+TELEMETRY_RATE_HZ = 5           # GLOBAL_POSITION_INT, ATTITUDE, VFR_HUD
+RECV_TIMEOUT = 0.1
+
+HOME_LAT = 55.7558              # Точка старта по умолчанию
+HOME_LON = 37.6173
+HOME_ALT = 150.0                # м над уровнем моря
+
+CRUISE_SPEED = 10.0             # м/с по горизонтали в AUTO, GUIDED и RTL
+CLIMB_SPEED = 2.5               # м/с набор высоты
+LAND_SPEED = 1.0                # м/с снижение при посадке
+ACCEPT_RADIUS = 2.0             # м: точка миссии достигнута
+BATTERY_DRAIN = 0.05            # % в секунду, пока двигатели включены
+EARTH_RADIUS = 6378137.0
+
+MODES = {name: number for number, name in mavutil.mode_mapping_acm.items()}
+
+mavlink = mavutil.mavlink
+
+# Диалект выбирает pymavlink по MAVLINK20 при импорте; имитатор говорит на том же, что и станция в этом процессе
+MAVLINK2 = float(mavlink.WIRE_PROTOCOL_VERSION) >= 2
+MAVLINK_OVERHEAD = 12 if MAVLINK2 else 8   # Заголовок и CRC кадра
+
+
+def _extensions(*values) -> tuple:
+    """Поля-расширения MAVLink 2 (mission_type, target у COMMAND_ACK): в MAVLink 1 их нет"""
+    return values if MAVLINK2 else ()
+
+
+def _mission_type(msg) -> int:
+    return getattr(msg, 'mission_type', mavlink.MAV_MISSION_TYPE_MISSION)
+
+
+@dataclass
+class LinkProfile:
+    """
+    Параметры эмулируемого канала в одну сторону.
+    latency и jitter - секунды, loss - доля потерянных сообщений (0..1),
+    bandwidth - байт/с (0 - без ограничения, 57600 бод телеметрийного радио - около 5760 байт/с).
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    loss: float = 0.0
+    bandwidth: float = 0.0
+
+
+@dataclass
+class LinkStats:
+    """Счётчики одного направления канала"""
+    passed: int = 0
+    dropped: int = 0
+    bytes: int = 0
+
+    def __str__(self):
+        return f"{self.passed} сообщений ({self.bytes / 1024:.1f} КБ), потеряно {self.dropped}"
+
+
+class _LinkDirection:
+    """
+    Одно направление канала: сообщения выдаются deliver() в своём потоке
+    через latency ± jitter, часть теряется, а скорость ограничена bandwidth.
+    Порядок сообщений сохраняется, как в последовательном радиоканале: джиттер
+    задерживает следующие сообщения, но не переставляет их.
+    """
+
+    def __init__(self, name: str, deliver, profile: LinkProfile, rng: random.Random):
+        self.deliver = deliver
+        self.profile = profile
+        self.stats = LinkStats()
+        self._rng = rng
+        self._queue = []
+        self._counter = 0
+        self._last_due = 0.0
+        self._next_free = 0.0       # Канал занят передачей предыдущего сообщения до этого момента
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, item, size: int) -> None:
+        profile = self.profile
+        with self._condition:
+            if profile.loss and self._rng.random() < profile.loss:
+                self.stats.dropped += 1
+                return
+            delay = profile.latency
+            if profile.jitter:
+                delay += self._rng.uniform(-profile.jitter, profile.jitter)
+            due = max(time.monotonic() + max(0.0, delay), self._last_due)
+            self._last_due = due
+            self._counter += 1
+            heapq.heappush(self._queue, (due, self._counter, item, size))
+            self._condition.notify()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._queue.clear()
+            self._condition.notify()
+        self._thread.join(timeout=1.0)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running:
+                    if self._queue:
+                        due = max(self._queue[0][0], self._next_free)
+                        wait = due - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._condition.wait(wait)
+                    else:
+                        self._condition.wait()
+                if not self._running:
+                    return
+                _, _, item, size = heapq.heappop(self._queue)
+                if self.profile.bandwidth:
+                    self._next_free = max(self._next_free, time.monotonic()) + size / self.profile.bandwidth
+                self.stats.passed += 1
+                self.stats.bytes += size
+            try:
+                self.deliver(item)
+            except Exception as e:
+                print(f"Mock: ошибка обработки {item}: {e}")
+
+
+@dataclass
+class _UploadSession:
+    """Приём миссии: MISSION_COUNT или MISSION_WRITE_PARTIAL_LIST -> запросы пунктов -> MISSION_ACK"""
+    mission_type: int
+    items: list
+    expected: int               # seq, который запрашиваем сейчас
+    last: int                   # seq последнего пункта обмена
+    gcs: tuple                  # (system, component) наземной станции
+
+
+@dataclass
+class _VehicleState:
+    lat: float = HOME_LAT
+    lon: float = HOME_LON
+    alt: float = 0.0            # Относительная высота, м
+    home: tuple = (HOME_LAT, HOME_LON, HOME_ALT)
+    heading: float = 0.0
+    groundspeed: float = 0.0
+    climb: float = 0.0
+    armed: bool = False
+    mode: int = MODES['STABILIZE']
+    target: Optional[tuple] = None      # (lat, lon, alt) цели в GUIDED
+    mission_seq: int = 0
+    battery: float = 100.0
+    missions: Dict[int, list] = field(default_factory=dict)    # mission_type -> пункты MISSION_ITEM_INT
+
+
+class MockAutopilot:
+    """
+    Лёгкий имитатор ArduCopter для прогонов без SITL (CI, замеры протокола).
+
+    Слушает обычный адрес mavutil со стороны аппарата (tcpin:..., udpout:...) и отвечает на:
+    - HEARTBEAT (1 Гц) и телеметрию GLOBAL_POSITION_INT, ATTITUDE, VFR_HUD, SYS_STATUS;
+    - SET_MODE и COMMAND_LONG/COMMAND_INT (ARM/DISARM, TAKEOFF, LAND, DO_SET_MODE, DO_SET_HOME,
+      MISSION_START, SET_MESSAGE_INTERVAL, REQUEST_MESSAGE) с COMMAND_ACK;
+    - протокол миссий: загрузка (MISSION_COUNT), частичная запись (MISSION_WRITE_PARTIAL_LIST),
+      чтение (MISSION_REQUEST_LIST), MISSION_CLEAR_ALL и MISSION_SET_CURRENT.
+    Полёт упрощённый: прямые участки с постоянной скоростью, без физики.
+    Канал в обе стороны проходит через LinkProfile: задержка, джиттер, потери и ограничение скорости.
+    """
+
+    def __init__(self, address: str = MOCK_ADDRESS, system: int = MOCK_SYSTEM, component: int = MOCK_COMPONENT,
+                 uplink: Optional[LinkProfile] = None, downlink: Optional[LinkProfile] = None,
+                 telemetry_hz: float = TELEMETRY_RATE_HZ, seed: Optional[int] = None):
+        self.address = address
+        self.system = system
+        self.component = component
+        self.uplink = uplink or LinkProfile()           # GCS -> аппарат
+        self.downlink = downlink or LinkProfile()       # аппарат -> GCS
+        self.telemetry_hz = telemetry_hz
+        self.state = _VehicleState()
+        self.commands = 0
+        self.uploads = 0
+        self.downloads = 0
+
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self._upload: Optional[_UploadSession] = None
+        self._gcs = (255, 0)
+        self._boot = time.monotonic()
+        self._running = False
+        self._threads = []
+        self.master = None
+        self._incoming = None
+        self._outgoing = None
+        self._handlers = {
+            'SET_MODE': self._on_set_mode,
+            'COMMAND_LONG': self._on_command,
+            'COMMAND_INT': self._on_command,
+            'MISSION_COUNT': self._on_mission_count,
+            'MISSION_WRITE_PARTIAL_LIST': self._on_write_partial_list,
+            'MISSION_ITEM_INT': self._on_mission_item,
+            'MISSION_REQUEST_LIST': self._on_request_list,
+            'MISSION_REQUEST_INT': self._on_mission_request,
+            'MISSION_REQUEST': self._on_mission_request,
+            'MISSION_CLEAR_ALL': self._on_clear_all,
+            'MISSION_SET_CURRENT': self._on_set_current,
+        }
+
+    # --- запуск и остановка ---
+
+    def start(self) -> "MockAutopilot":
+        self.master = mavutil.mavlink_connection(self.address, source_system=self.system,
+                                                 source_component=self.component)
+        self._running = True
+        self._incoming = _LinkDirection("MockUplink", self._handle, self.uplink, self._rng)
+        self._outgoing = _LinkDirection("MockDownlink", self._transmit, self.downlink, self._rng)
+        self._threads = [threading.Thread(target=self._receive_loop, name="MockReceive", daemon=True),
+                         threading.Thread(target=self._telemetry_loop, name="MockTelemetry", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        for direction in (self._incoming, self._outgoing):
+            if direction is not None:
+                direction.stop()
+        if self.master is not None:
+            self.master.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def uplink_stats(self) -> LinkStats:
+        return self._incoming.stats
+
+    @property
+    def downlink_stats(self) -> LinkStats:
+        return self._outgoing.stats
+
+    def mission(self, mission_type: int = mavlink.MAV_MISSION_TYPE_MISSION) -> list:
+        with self._lock:
+            return list(self.state.missions.get(mission_type, ()))
+
+    # --- канал ---
+
+    def _receive_loop(self) -> None:
+        while self._running:
+            msg = self.master.recv_match(blocking=True, timeout=RECV_TIMEOUT)
+            if msg is None or msg.get_type() == 'BAD_DATA':
+                continue
+            self._incoming.put(msg, len(msg.get_msgbuf()))
+
+    def _send(self, msg) -> None:
+        # Сообщение ещё не упаковано: размер - полезная нагрузка плюс заголовок и CRC
+        self._outgoing.put(msg, MAVLINK_OVERHEAD + msg.unpacker.size)
+
+    def _transmit(self, msg) -> None:
+        self.master.mav.send(msg)
+
+    # --- обработка входящих ---
+
+    def _handle(self, msg) -> None:
+        handler = self._handlers.get(msg.get_type())
+        if handler is None:
+            return
+        target = getattr(msg, 'target_system', self.system)
+        if target not in (0, self.system):
+            return
+        with self._lock:
+            self._gcs = (msg.get_srcSystem(), msg.get_srcComponent())
+            handler(msg)
+
+    def _ack(self, command: int, result: int) -> None:
+        self.commands += 1
+        self._send(self.master.mav.command_ack_encode(command, result, *_extensions(0, 0, *self._gcs)))
+
+    def _mission_ack(self, result: int, mission_type: int, gcs=None) -> None:
+        system, component = gcs or self._gcs
+        self._send(self.master.mav.mission_ack_encode(system, component, result, *_extensions(mission_type)))
+
+    def _on_set_mode(self, msg) -> None:
+        self._set_mode(msg.custom_mode)
+        # ArduPilot отвечает на SET_MODE так же, как на команду, и сразу шлёт HEARTBEAT с новым режимом
+        self._ack(mavlink.MAVLINK_MSG_ID_SET_MODE, mavlink.MAV_RESULT_ACCEPTED)
+        self._send_heartbeat()
+
+    def _set_mode(self, mode: int) -> None:
+        state = self.state
+        state.mode = mode
+        state.target = None
+
+    def _on_command(self, msg) -> None:
+        state = self.state
+        command = msg.command
+        result = mavlink.MAV_RESULT_ACCEPTED
+        if command == mavlink.MAV_CMD_COMPONENT_ARM_DISARM:
+            state.armed = msg.param1 == 1
+            if not state.armed:
+                state.target = None
+        elif command == mavlink.MAV_CMD_NAV_TAKEOFF:
+            if not state.armed or state.mode != MODES['GUIDED']:
+                result = mavlink.MAV_RESULT_FAILED
+            else:
+                state.target = (state.lat, state.lon, msg.param7)
+        elif command == mavlink.MAV_CMD_NAV_LAND:
+            self._set_mode(MODES['LAND'])
+        elif command == mavlink.MAV_CMD_DO_SET_MODE:
+            self._set_mode(int(msg.param2))
+        elif command == mavlink.MAV_CMD_MISSION_START:
+            if not state.armed or not state.missions.get(mavlink.MAV_MISSION_TYPE_MISSION):
+                result = mavlink.MAV_RESULT_FAILED
+            else:
+                self._set_mode(MODES['AUTO'])
+        elif command == mavlink.MAV_CMD_DO_SET_HOME:
+            if msg.param1 == 1:
+                state.home = (state.lat, state.lon, state.home[2] + state.alt)
+            elif msg.get_type() == 'COMMAND_INT':
+                state.home = (msg.x / 1e7, msg.y / 1e7, msg.z)     # В COMMAND_INT координаты - целые *1e7
+            else:
+                state.home = (msg.param5, msg.param6, msg.param7)
+            self._send_home()
+        elif command == mavlink.MAV_CMD_REQUEST_MESSAGE:
+            if int(msg.param1) == mavlink.MAVLINK_MSG_ID_HOME_POSITION:
+                self._send_home()
+        elif command != mavlink.MAV_CMD_SET_MESSAGE_INTERVAL:
+            result = mavlink.MAV_RESULT_UNSUPPORTED
+        self._ack(command, result)
+
+    # --- протокол миссий ---
+
+    def _on_mission_count(self, msg) -> None:
+        mission_type = _mission_type(msg)
+        if msg.count == 0:
+            self.state.missions[mission_type] = []
+            self._upload = None
+            self._mission_ack(mavlink.MAV_MISSION_ACCEPTED, mission_type)
+            return
+        # Повторный MISSION_COUNT начинает загрузку заново
+        self._upload = _UploadSession(mission_type, [None] * msg.count, 0, msg.count - 1, self._gcs)
+        self._request_item(self._upload)
+
+    def _on_write_partial_list(self, msg) -> None:
+        mission_type = _mission_type(msg)
+        current = self.state.missions.get(mission_type, [])
+        start, end = msg.start_index, msg.end_index
+        if end < 0:
+            end = len(current) - 1
+        if not (0 <= start <= end < len(current)):
+            self._mission_ack(mavlink.MAV_MISSION_INVALID_SEQUENCE, mission_type)
+            return
+        self._upload = _UploadSession(mission_type, list(current), start, end, self._gcs)
+        self._request_item(self._upload)
+
+    def _request_item(self, session: _UploadSession) -> None:
+        system, component = session.gcs
+        self._send(self.master.mav.mission_request_int_encode(system, component, session.expected,
+                                                              *_extensions(session.mission_type)))
+
+    def _on_mission_item(self, msg) -> None:
+        session = self._upload
+        mission_type = _mission_type(msg)
+        stored = self.state.missions.get(mission_type, [])
+        if session is None or session.mission_type != mission_type:
+            # Потерялся наш MISSION_ACK: станция повторяет последний пункт - подтверждаем ещё раз
+            if stored and msg.seq == len(stored) - 1:
+                self._mission_ack(mavlink.MAV_MISSION_ACCEPTED, mission_type)
+            return
+        if msg.seq != session.expected:
+            # Пункт не тот (повтор или потерялся наш запрос) - запрашиваем нужный ещё раз
+            self._request_item(session)
+            return
+        session.items[msg.seq] = msg
+        if msg.seq < session.last:
+            session.expected += 1
+            self._request_item(session)
+            return
+        self.state.missions[session.mission_type] = session.items
+        if session.mission_type == mavlink.MAV_MISSION_TYPE_MISSION:
+            self.state.mission_seq = min(self.state.mission_seq, len(session.items) - 1)
+        self._upload = None
+        self.uploads += 1
+        self._mission_ack(mavlink.MAV_MISSION_ACCEPTED, session.mission_type, session.gcs)
+
+    def _on_request_list(self, msg) -> None:
+        mission_type = _mission_type(msg)
+        items = self.state.missions.get(mission_type, [])
+        self.downloads += 1
+        self._send(self.master.mav.mission_count_encode(*self._gcs, len(items), *_extensions(mission_type)))
+
+    def _on_mission_request(self, msg) -> None:
+        mission_type = _mission_type(msg)
+        items = self.state.missions.get(mission_type, [])
+        if not 0 <= msg.seq < len(items):
+            self._mission_ack(mavlink.MAV_MISSION_INVALID_SEQUENCE, mission_type)
+            return
+        # На MISSION_REQUEST тоже отвечаем MISSION_ITEM_INT: станция читает миссию только в этом формате
+        item = items[msg.seq]
+        self._send(self.master.mav.mission_item_int_encode(
+            *self._gcs, item.seq, item.frame, item.command, int(item.seq == self.state.mission_seq),
+            item.autocontinue, item.param1, item.param2, item.param3, item.param4,
+            item.x, item.y, item.z, *_extensions(mission_type)))
+
+    def _on_clear_all(self, msg) -> None:
+        mission_type = _mission_type(msg)
+        self.state.missions[mission_type] = []
+        if mission_type == mavlink.MAV_MISSION_TYPE_MISSION:
+            self.state.mission_seq = 0
+        self._upload = None
+        self._mission_ack(mavlink.MAV_MISSION_ACCEPTED, mission_type)
+
+    def _on_set_current(self, msg) -> None:
+        items = self.state.missions.get(mavlink.MAV_MISSION_TYPE_MISSION, [])
+        if 0 <= msg.seq < len(items):
+            self.state.mission_seq = msg.seq
+        self._send_mission_current()
+
+    # --- телеметрия ---
+
+    def _telemetry_loop(self) -> None:
+        period = 1.0 / self.telemetry_hz
+        heartbeat_every = max(1, round(self.telemetry_hz / HEARTBEAT_RATE_HZ))
+        tick = 0
+        next_time = time.monotonic()
+        while self._running:
+            with self._lock:
+                self._step(period)
+                if tick % heartbeat_every == 0:
+                    self._send_heartbeat()
+                    self._send_sys_status()
+                self._send_position()
+            tick += 1
+            next_time += period
+            time.sleep(max(0.0, next_time - time.monotonic()))
+
+    def _time_boot_ms(self) -> int:
+        return int((time.monotonic() - self._boot) * 1000) & 0xFFFFFFFF
+
+    def _send_heartbeat(self) -> None:
+        state = self.state
+        base_mode = mavlink.MAV_MODE_FLAG_CUSTOM_MODE_ENABLED
+        if state.armed:
+            base_mode |= mavlink.MAV_MODE_FLAG_SAFETY_ARMED
+        status = mavlink.MAV_STATE_ACTIVE if state.armed else mavlink.MAV_STATE_STANDBY
+        self._send(self.master.mav.heartbeat_encode(mavlink.MAV_TYPE_QUADROTOR, mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+                                                    base_mode, state.mode, status))
+
+    def _send_sys_status(self) -> None:
+        battery = self.state.battery
+        voltage = int(10500 + 2100 * battery / 100)         # 3S: 10.5..12.6 В
+        current = 1500 if self.state.armed else 50          # сантиампер
+        self._send(self.master.mav.sys_status_encode(0, 0, 0, 200, voltage, current, int(battery),
+                                                     0, 0, 0, 0, 0, 0))
+
+    def _send_position(self) -> None:
+        state = self.state
+        heading = math.radians(state.heading)
+        vn = state.groundspeed * math.cos(heading)
+        ve = state.groundspeed * math.sin(heading)
+        mav = self.master.mav
+        self._send(mav.global_position_int_encode(
+            self._time_boot_ms(), int(state.lat * 1e7), int(state.lon * 1e7),
+            int((state.home[2] + state.alt) * 1000), int(state.alt * 1000),
+            int(vn * 100), int(ve * 100), int(-state.climb * 100), int(state.heading * 100) % 36000))
+        self._send(mav.attitude_encode(self._time_boot_ms(), 0.0, 0.0, heading - 2 * math.pi * (heading > math.pi),
+                                       0.0, 0.0, 0.0))
+        self._send(mav.vfr_hud_encode(state.groundspeed, state.groundspeed, int(state.heading) % 360,
+                                      50 if state.armed else 0, state.home[2] + state.alt, state.climb))
+
+    def _send_home(self) -> None:
+        lat, lon, alt = self.state.home
+        self._send(self.master.mav.home_position_encode(int(lat * 1e7), int(lon * 1e7), int(alt * 1000),
+                                                        0, 0, 0, [1, 0, 0, 0], 0, 0, 0))
+
+    def _send_mission_current(self) -> None:
+        self._send(self.master.mav.mission_current_encode(self.state.mission_seq))
+
+    # --- упрощённый полёт ---
+
+    def _step(self, dt: float) -> None:
+        state = self.state
+        state.groundspeed = 0.0
+        state.climb = 0.0
+        if not state.armed:
+            return
+        state.battery = max(0.0, state.battery - BATTERY_DRAIN * dt)
+
+        if state.mode == MODES['LAND']:
+            self._land(dt)
+        elif state.mode == MODES['RTL']:
+            home_lat, home_lon, _ = state.home
+            if self._fly_to(home_lat, home_lon, max(state.alt, 15.0), dt):
+                self._set_mode(MODES['LAND'])
+        elif state.mode == MODES['GUIDED']:
+            if state.target is not None and self._fly_to(*state.target, dt):
+                state.target = None
+        elif state.mode == MODES['AUTO']:
+            self._step_mission(dt)
+
+    def _step_mission(self, dt: float) -> None:
+        state = self.state
+        items = state.missions.get(mavlink.MAV_MISSION_TYPE_MISSION, [])
+        if state.mission_seq >= len(items):
+            return
+        item = items[state.mission_seq]
+        if item.command == mavlink.MAV_CMD_NAV_TAKEOFF:
+            reached = self._fly_to(state.lat, state.lon, item.z, dt)
+        elif item.command == mavlink.MAV_CMD_NAV_WAYPOINT:
+            reached = self._fly_to(item.x / 1e7, item.y / 1e7, item.z, dt)
+        elif item.command == mavlink.MAV_CMD_NAV_LAND:
+            self._land(dt)
+            reached = not state.armed
+        elif item.command == mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH:
+            self._set_mode(MODES['RTL'])
+            reached = True
+        else:
+            reached = True          # Команды DO_* и прочее - без действия
+        if reached:
+            self._send(self.master.mav.mission_item_reached_encode(item.seq))
+            if state.mission_seq + 1 < len(items):
+                state.mission_seq += 1
+                self._send_mission_current()
+
+    def _land(self, dt: float) -> None:
+        state = self.state
+        state.climb = -LAND_SPEED
+        state.alt = max(0.0, state.alt - LAND_SPEED * dt)
+        if state.alt == 0.0:
+            state.armed = False
+            state.climb = 0.0
+
+    def _fly_to(self, lat: float, lon: float, alt: float, dt: float) -> bool:
+        """Шаг прямо к цели: сначала набор высоты до 1 м (взлёт), дальше одновременно. True - цель достигнута"""
+        state = self.state
+        north = math.radians(lat - state.lat) * EARTH_RADIUS
+        east = math.radians(lon - state.lon) * EARTH_RADIUS * math.cos(math.radians(state.lat))
+        distance = math.hypot(north, east)
+
+        climb = max(-CLIMB_SPEED * dt, min(CLIMB_SPEED * dt, alt - state.alt))
+        state.alt += climb
+        state.climb = climb / dt
+
+        if distance > ACCEPT_RADIUS and state.alt >= 1.0:
+            step = min(distance, CRUISE_SPEED * dt)
+            state.lat += math.degrees(north / distance * step / EARTH_RADIUS)
+            state.lon += math.degrees(east / distance * step / EARTH_RADIUS / math.cos(math.radians(state.lat)))
+            state.heading = math.degrees(math.atan2(east, north)) % 360
+            state.groundspeed = step / dt
+            distance -= step
+        return distance <= ACCEPT_RADIUS and abs(alt - state.alt) < 0.5
+
+
+def gcs_address(address: str) -> str:
+    """Адрес для наземной станции по адресу имитатора: tcpin:хост:порт -> tcp:..., udpout:... -> udpin:..."""
+    kind, _, rest = address.partition(":")
+    return {"tcpin": "tcp", "udpout": "udpin", "udpin": "udpout", "tcp": "tcpin"}.get(kind, kind) + ":" + rest
+
+
+def run_benchmark(vehicle: MockAutopilot, count: int, rounds: int = 1) -> None:
+    """Загрузка, частичная правка, чтение и очистка миссии из count точек через тот же код, что у приложения"""
+    from mavlink_reader import start_reader, stop_reader
+    from mission_control import build_mission, clear_mission, download_mission, sync_mission, upload_mission
+    from tlog_replay import open_connection
+
+    master = open_connection(gcs_address(vehicle.address), source_system=200, source_component=1)
+    if master.wait_heartbeat(timeout=5) is None:
+        print("Имитатор не отвечает!")
+        return
+    start_reader(master)
+    try:
+        lat, lon, _ = vehicle.state.home
+        side = max(1, int(math.sqrt(count)))
+        coordinates = [(lat + 0.0005 * (i // side), lon + 0.0005 * (i % side)) for i in range(count)]
+        for _ in range(rounds):
+            mission = build_mission(coordinates)
+            start = time.monotonic()
+            stats = upload_mission(master, mission)
+            print(f"Загрузка {count} пунктов: {time.monotonic() - start:.2f} с, {stats}")
+
+            mission.z[count // 2] += 5
+            start = time.monotonic()
+            sync_mission(master, mission)
+            print(f"Частичная запись: {time.monotonic() - start:.2f} с")
+
+            start = time.monotonic()
+            items = download_mission(master)
+            print(f"Чтение {len(items)} пунктов: {time.monotonic() - start:.2f} с")
+
+            clear_mission(master)
+    finally:
+        stop_reader(master)
+        master.close()
+
+
+if __name__ == "__main__":
+    # python mock_autopilot.py [адрес] [--latency мс] [--jitter мс] [--loss доля] [--bandwidth байт/с] [--bench N]
+    parser = argparse.ArgumentParser(description="Имитатор ArduCopter для прогонов без SITL")
+    parser.add_argument("address", nargs="?", default=MOCK_ADDRESS,
+                        help=f"адрес mavutil со стороны аппарата (по умолчанию {MOCK_ADDRESS})")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка в одну сторону, мс")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки, ± мс")
+    parser.add_argument("--loss", type=float, default=0.0, help="доля потерянных сообщений в каждую сторону")
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="скорость канала, байт/с (0 - без ограничения)")
+    parser.add_argument("--seed", type=int, default=None, help="зерно генератора потерь и джиттера")
+    parser.add_argument("--bench", type=int, default=0, metavar="N",
+                        help="прогнать обмен миссией из N точек и завершиться")
+    parser.add_argument("--rounds", type=int, default=1, help="число повторов для --bench")
+    args = parser.parse_args()
+
+    profile = LinkProfile(args.latency / 1000, args.jitter / 1000, args.loss, args.bandwidth)
+    with MockAutopilot(args.address, uplink=profile, downlink=LinkProfile(**vars(profile)), seed=args.seed) as mock:
+        print(f"Имитатор слушает {args.address}, станция подключается к {gcs_address(args.address)}")
+        try:
+            if args.bench:
+                run_benchmark(mock, args.bench, args.rounds)
+            else:
+                while True:
+                    time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        print(f"Канал к станции: {mock.downlink_stats}; от станции: {mock.uplink_stats}")
@@ -0,0 +1,225 @@
+# route_layer.py
+
+import itertools
+import tkinter
+from typing import Dict, Iterable, List, Tuple
+
+from tkintermapview.utility_functions import decimal_to_osm
+
+from spatial_index import GridIndex
+
+ROUTE_COLOR = 'red'
+ROUTE_WIDTH = 3
+
+_route_ids = itertools.count()
+
+
+class RouteLayer:
+    """
+    Маршрут (ломаная) на ExtendedMapView с пошаговым редактированием.
+
+    Каждый отрезок - отдельная линия canvas, поэтому добавление, вставка,
+    удаление и перенос точки трогают только 1-3 соседних отрезка, а не весь путь
+    (как delete_all_path() + set_path()).
+    Для точек хранятся нормированные координаты Меркатора (0..1), не зависящие от зума:
+    при сдвиге карты весь слой переносится одним canvas.move(),
+    при зуме пересчёт - одно умножение и сложение на точку, без тригонометрии.
+    Рамки отрезков лежат в GridIndex: на canvas есть только отрезки рядом с экраном
+    (viewport_world карты), так что маршрут на десятки тысяч точек не создаёт столько же линий.
+    Все методы вызываются из потока Tkinter.
+    """
+
+    def __init__(self, map_widget, positions: Iterable[Tuple[float, float]] = (),
+                 color: str = ROUTE_COLOR, width: int = ROUTE_WIDTH):
+        self.map_widget = map_widget
+        self.canvas = map_widget.canvas
+        self.color = color
+        self.width = width
+        self.tag = f"route{next(_route_ids)}"
+
+        self._positions: List[Tuple[float, float]] = []
+        self._world: List[Tuple[float, float]] = []   # Меркатор 0..1
+        # Отрезки с постоянными номерами: вставка точки не перенумеровывает остальные в индексе
+        self._segments: List[int] = []                # _segments[i] - номер отрезка между точками i и i+1
+        self._segment_world: Dict[int, tuple] = {}    # номер -> (x0, y0, x1, y1) в Меркаторе
+        self._segment_ids = itertools.count()
+        self._index = GridIndex()
+        self._items: Dict[int, int] = {}              # номер отрезка -> линия canvas (только рядом с экраном)
+        self._view = None                             # (scale_x, scale_y, offset_x, offset_y) последней отрисовки
+        self._viewport = None                         # Область последней отрисовки в Меркаторе
+
+        self._add_positions(positions)
+        self.draw()
+
+    # --- данные ---
+
+    @property
+    def positions(self) -> List[Tuple[float, float]]:
+        return list(self._positions)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        return self._positions[index]
+
+    @property
+    def drawn_segments(self) -> int:
+        """Отрезков на canvas сейчас"""
+        return len(self._items)
+
+    # --- редактирование ---
+
+    def append(self, position: Tuple[float, float]) -> None:
+        self.insert(len(self._positions), position)
+
+    def insert(self, index: int, position: Tuple[float, float]) -> None:
+        """Вставляет точку перед index: один отрезок заменяется двумя"""
+        count = len(self._positions)
+        index = max(0, min(index if index >= 0 else count + index, count))
+        self._positions.insert(index, tuple(position))
+        self._world.insert(index, decimal_to_osm(position[0], position[1], 0))
+
+        if 0 < index < count:
+            # Точка внутри маршрута: отрезок (index-1, index) делим на два
+            self._update_segment(index - 1)
+            self._new_segment(index)
+        elif index == count and count > 0:
+            self._new_segment(index - 1)
+        elif index == 0 and count > 0:
+            self._new_segment(0)
+
+    def remove(self, index: int = -1) -> Tuple[float, float]:
+        """Удаляет точку: два соседних отрезка заменяются одним"""
+        count = len(self._positions)
+        if index < 0:
+            index += count
+        position = self._positions.pop(index)
+        self._world.pop(index)
+        if not self._segments:
+            return position
+
+        if index == count - 1:
+            self._drop_segment(index - 1)
+        elif index == 0:
+            self._drop_segment(0)
+        else:
+            # Отрезок (index-1, index) становится (index-1, index+1), отрезок (index, index+1) лишний
+            self._drop_segment(index)
+            self._update_segment(index - 1)
+        return position
+
+    def move(self, index: int, position: Tuple[float, float]) -> None:
+        """Переносит точку: меняются только два примыкающих отрезка"""
+        if index < 0:
+            index += len(self._positions)
+        self._positions[index] = tuple(position)
+        self._world[index] = decimal_to_osm(position[0], position[1], 0)
+        for segment in (index - 1, index):
+            if 0 <= segment < len(self._segments):
+                self._update_segment(segment)
+
+    def set_positions(self, positions: Iterable[Tuple[float, float]]) -> None:
+        """Заменяет весь маршрут (например, после загрузки из файла)"""
+        self.clear()
+        self._view = None       # Отрезки создаст одна отрисовка после загрузки, а не каждый по отдельности
+        self._add_positions(positions)
+        self.draw()
+
+    def clear(self) -> None:
+        self.canvas.delete(self.tag)
+        self._positions.clear()
+        self._world.clear()
+        self._segments.clear()
+        self._segment_world.clear()
+        self._index.clear()
+        self._items.clear()
+
+    def delete(self) -> None:
+        self.clear()
+        self.map_widget.remove_overlay(self)
+
+    # --- отрисовка (вызывается картой при сдвиге/зуме) ---
+
+    def draw(self) -> None:
+        view = self.map_widget.view_transform()
+        viewport = self.map_widget.viewport_world()
+        if view is None or viewport is None:
+            return
+        last_view, self._view = self._view, view
+        self._viewport = viewport
+        items = self._items
+
+        zoomed = last_view is None or view[0] != last_view[0] or view[1] != last_view[1]
+        if not zoomed:
+            # Только сдвиг карты: переносим уже нарисованные отрезки одной командой
+            dx = view[2] - last_view[2]
+            dy = view[3] - last_view[3]
+            if (dx or dy) and items:
+                self.canvas.move(self.tag, dx, dy)
+
+        visible = self._index.query(*viewport)
+        for segment in [segment for segment in items if segment not in visible]:
+            self.canvas.delete(items.pop(segment))
+        created = False
+        for segment in visible:
+            item = items.get(segment)
+            if item is None:
+                items[segment] = self._create_line(segment)
+                created = True
+            elif zoomed:
+                # Зум или изменение размера окна: новые координаты из кэша Меркатора
+                self.canvas.coords(item, *self._line_coords(segment))
+        if created:
+            self.map_widget.manage_z_order()
+
+    def _add_positions(self, positions: Iterable[Tuple[float, float]]) -> None:
+        for position in positions:
+            self._positions.append(tuple(position))
+            self._world.append(decimal_to_osm(position[0], position[1], 0))
+            if len(self._positions) > 1:
+                self._new_segment(len(self._positions) - 2)
+
+    def _new_segment(self, index: int) -> None:
+        """Новый отрезок между точками index и index+1 (вставляется в список на место index)"""
+        self._segments.insert(index, next(self._segment_ids))
+        self._update_segment(index)
+
+    def _drop_segment(self, index: int) -> None:
+        segment = self._segments.pop(index)
+        del self._segment_world[segment]
+        self._index.remove(segment)
+        item = self._items.pop(segment, None)
+        if item is not None:
+            self.canvas.delete(item)
+
+    def _update_segment(self, index: int) -> None:
+        """Концы отрезка index изменились: рамка в индексе и линия, если отрезок рядом с экраном"""
+        segment = self._segments[index]
+        (x0, y0), (x1, y1) = self._world[index], self._world[index + 1]
+        self._segment_world[segment] = (x0, y0, x1, y1)
+        self._index.insert(segment, min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+        if self._view is None:
+            return
+
+        min_x, min_y, max_x, max_y = self._viewport
+        visible = min(x0, x1) <= max_x and max(x0, x1) >= min_x and min(y0, y1) <= max_y and max(y0, y1) >= min_y
+        item = self._items.get(segment)
+        if item is not None:
+            if visible:
+                self.canvas.coords(item, *self._line_coords(segment))
+            else:
+                self.canvas.delete(self._items.pop(segment))
+        elif visible:
+            self._items[segment] = self._create_line(segment)
+            self.map_widget.manage_z_order()
+
+    def _line_coords(self, segment: int) -> tuple:
+        scale_x, scale_y, offset_x, offset_y = self._view
+        x0, y0, x1, y1 = self._segment_world[segment]
+        return (x0 * scale_x + offset_x, y0 * scale_y + offset_y,
+                x1 * scale_x + offset_x, y1 * scale_y + offset_y)
+
+    def _create_line(self, segment: int) -> int:
+        return self.canvas.create_line(*self._line_coords(segment), width=self.width, fill=self.color,
+                                       capstyle=tkinter.ROUND, tag=("path", self.tag))
@@ -0,0 +1,122 @@
+# spatial_index.py
+
+import math
+from typing import Hashable, Optional, Tuple
+
+INDEX_ZOOM = 16                 # Ячейка сетки = один тайл этого зума
+INDEX_CELL = 1 / 2 ** INDEX_ZOOM  # ... в нормированных координатах Меркатора (0..1)
+MAX_CELLS_PER_ITEM = 64         # Объекты крупнее (длинные пути, большие зоны) хранятся отдельным списком
+
+Box = Tuple[float, float, float, float]
+
+
+class GridIndex:
+    """
+    Пространственный индекс объектов карты: равномерная сетка по тайлам INDEX_ZOOM.
+    Координаты - нормированный Меркатор (decimal_to_osm(lat, lon, 0)).
+    Точка занимает одну ячейку, отрезок или полигон - ячейки своей рамки.
+    query() возвращает объекты, рамки которых пересекают область,
+    nearest() ищет ближайшую точку для проверки клика.
+    """
+
+    def __init__(self, cell_size: float = INDEX_CELL):
+        self.cell_size = cell_size
+        self._cells = {}        # (cx, cy) -> set(key)
+        self._boxes = {}        # key -> (min_x, min_y, max_x, max_y)
+        self._large = set()     # Объекты, не разложенные по ячейкам
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def __contains__(self, key):
+        return key in self._boxes
+
+    def box(self, key) -> Optional[Box]:
+        return self._boxes.get(key)
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._boxes.clear()
+        self._large.clear()
+
+    def _cell_range(self, min_x, min_y, max_x, max_y):
+        size = self.cell_size
+        return (math.floor(min_x / size), math.floor(min_y / size),
+                math.floor(max_x / size), math.floor(max_y / size))
+
+    def insert(self, key: Hashable, min_x: float, min_y: float,
+               max_x: Optional[float] = None, max_y: Optional[float] = None) -> None:
+        """Добавляет (или переносит) объект: точку или рамку"""
+        if max_x is None:
+            max_x, max_y = min_x, min_y
+        if key in self._boxes:
+            self.remove(key)
+        self._boxes[key] = (min_x, min_y, max_x, max_y)
+
+        cx0, cy0, cx1, cy1 = self._cell_range(min_x, min_y, max_x, max_y)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > MAX_CELLS_PER_ITEM:
+            self._large.add(key)
+            return
+        cells = self._cells
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket is None:
+                    cells[(cx, cy)] = {key}
+                else:
+                    bucket.add(key)
+
+    def remove(self, key: Hashable) -> None:
+        box = self._boxes.pop(key, None)
+        if box is None:
+            return
+        if key in self._large:
+            self._large.discard(key)
+            return
+        cx0, cy0, cx1, cy1 = self._cell_range(*box)
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                bucket = self._cells.get((cx, cy))
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._cells[(cx, cy)]
+
+    def query(self, min_x: float, min_y: float, max_x: float, max_y: float) -> set:
+        """Ключи объектов, рамки которых пересекают область"""
+        boxes = self._boxes
+        cx0, cy0, cx1, cy1 = self._cell_range(min_x, min_y, max_x, max_y)
+        result = set()
+
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            # Область больше занятых ячеек (мелкий зум) - быстрее пройти по ячейкам, чем по сетке
+            for (cx, cy), bucket in self._cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    result.update(bucket)
+        else:
+            cells = self._cells
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    bucket = cells.get((cx, cy))
+                    if bucket:
+                        result.update(bucket)
+        result.update(self._large)
+
+        # Ячейка шире объекта: точная проверка рамок
+        return {key for key in result
+                if boxes[key][0] <= max_x and boxes[key][2] >= min_x
+                and boxes[key][1] <= max_y and boxes[key][3] >= min_y}
+
+    def nearest(self, x: float, y: float, radius: float) -> Optional[Hashable]:
+        """Ближайший к (x, y) объект не дальше radius (по центру рамки) или None"""
+        best = None
+        best_distance = radius * radius
+        for key in self.query(x - radius, y - radius, x + radius, y + radius):
+            min_x, min_y, max_x, max_y = self._boxes[key]
+            dx = (min_x + max_x) / 2 - x
+            dy = (min_y + max_y) / 2 - y
+            distance = dx * dx + dy * dy
+            if distance <= best_distance:
+                best = key
+                best_distance = distance
+        return best
@@ -1,5 +1,49 @@
+import threading
+import time
+
 import customtkinter as ctk
 
+REFRESH_MS = 50     # Не чаще одной перерисовки статус-бара за столько миллисекунд
+
+
+class StatusModel:
+    """
+    Состояние статус-бара: поля пишут все источники (мышь, зум, телеметрия, результаты команд),
+    из любого потока. Запись без изменения значения ничего не помечает;
+    take_changes() отдаёт изменившиеся с прошлого раза поля.
+    """
+
+    def __init__(self, **values):
+        self._values = dict(values)
+        self._changed = set(values)
+        self._lock = threading.Lock()
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._changed)
+
+    def get(self, name, default=None):
+        return self._values.get(name, default)
+
+    def update(self, **values) -> bool:
+        """Записать поля; True, если что-то изменилось"""
+        changed = False
+        with self._lock:
+            for name, value in values.items():
+                if self._values.get(name) != value or name not in self._values:
+                    self._values[name] = value
+                    self._changed.add(name)
+                    changed = True
+        return changed
+
+    def take_changes(self) -> dict:
+        with self._lock:
+            if not self._changed:
+                return {}
+            changes = {name: self._values[name] for name in self._changed}
+            self._changed.clear()
+        return changes
+
 
 class StatusBar(ctk.CTkFrame):
     def __init__(self, master, **kwargs):
@@ -49,10 +93,19 @@ class StatusBar(ctk.CTkFrame):
             "loading": ("blue", "lightblue")
         }
 
+        # Источники пишут в модель, ячейки перерисовываются одним тиком и только при изменении текста/цвета
+        self.model = StatusModel()
+        self._painted = {}          # ячейка -> (текст, цвет) последней отрисовки
+        self._last_paint = 0.0
+        self._refresh_id = None
+        self._paint_pending = False
+        self._main_thread = threading.current_thread()
+
         # Инициализируем значения
         self.set_coordinates(0.0, 0.0)
         self.set_zoom(0)
         self.set_status("Это строка состояния!", "info")
+        self._tick()
 
     def _create_cells(self, parent, bar_height):
         """Создаем отдельные ячейки статус-бара"""
@@ -125,29 +178,79 @@ class StatusBar(ctk.CTkFrame):
 
     def set_status(self, text, status_type="info"):
         """Установить основной текст статуса"""
-        self.status_cell.configure(text=text)
+        values = {"status": text}
         if status_type in self.status_colors:
-            self.status_cell.configure(text_color=self.status_colors[status_type])
+            values["status_type"] = status_type
+        self._write(**values)
 
     def set_coordinates(self, lat, lon):
         """Установить координаты"""
-        self.lat_cell.configure(text=f"Lat: {lat:.7f}")
-        self.lon_cell.configure(text=f"Lon: {lon:.7f}")
+        self._write(lat=lat, lon=lon)
 
     def set_zoom(self, zoom_level):
         """Установить уровень зума"""
-        self.zoom_cell.configure(text=f"Zoom: {round(zoom_level)}")
-
-        # Меняем цвет в зависимости от уровня зума
-        if zoom_level < 14:
-            color = ("blue", "lightblue")
-        elif zoom_level < 16:
-            color = ("green", "lightgreen")
-        elif zoom_level < 18:
-            color = ("orange", "yellow")
-        else:
-            color = ("red", "pink")
-        self.zoom_cell.configure(text_color=color)
+        self._write(zoom=round(zoom_level))
+
+    def _write(self, **values):
+        if not self.model.update(**values):
+            return
+        # Из потока Tkinter первое изменение после паузы рисуется сразу (передний фронт),
+        # частые изменения - не чаще тика. Из других потоков изменения забирает тик
+        if not self._paint_pending and threading.current_thread() is self._main_thread:
+            if (time.monotonic() - self._last_paint) * 1000 >= REFRESH_MS:
+                if self._refresh_id is not None:
+                    self.after_cancel(self._refresh_id)
+                self._refresh_id = self.after_idle(self._tick)
+                self._paint_pending = True
+
+    def _tick(self):
+        """Перерисовка изменившихся ячеек; тик идёт постоянно, без изменений - одна проверка"""
+        self._refresh_id = None
+        self._paint_pending = False
+        if self.model.dirty:
+            self._paint(self.model.take_changes())
+            self._last_paint = time.monotonic()
+        self._refresh_id = self.after(REFRESH_MS, self._tick)
+
+    def destroy(self):
+        if self._refresh_id is not None:
+            self.after_cancel(self._refresh_id)
+            self._refresh_id = None
+        super().destroy()
+
+    def _paint(self, changes):
+        model = self.model
+        if "status" in changes or "status_type" in changes:
+            color = self.status_colors.get(model.get("status_type", "info"))
+            self._paint_cell(self.status_cell, model.get("status", ""), color)
+        if "lat" in changes:
+            self._paint_cell(self.lat_cell, f"Lat: {model.get('lat'):.7f}")
+        if "lon" in changes:
+            self._paint_cell(self.lon_cell, f"Lon: {model.get('lon'):.7f}")
+        if "zoom" in changes:
+            zoom_level = model.get("zoom")
+            # Меняем цвет в зависимости от уровня зума
+            if zoom_level < 14:
+                color = ("blue", "lightblue")
+            elif zoom_level < 16:
+                color = ("green", "lightgreen")
+            elif zoom_level < 18:
+                color = ("orange", "yellow")
+            else:
+                color = ("red", "pink")
+            self._paint_cell(self.zoom_cell, f"Zoom: {zoom_level}", color)
+
+    def _paint_cell(self, cell, text, color=None):
+        """configure только для того, что действительно поменялось на экране"""
+        painted_text, painted_color = self._painted.get(cell, (None, None))
+        options = {}
+        if text != painted_text:
+            options["text"] = text
+        if color is not None and color != painted_color:
+            options["text_color"] = color
+        if options:
+            cell.configure(**options)
+            self._painted[cell] = (text, color if color is not None else painted_color)
 
     def update_all(self, status_text, status_type, lat, lon, zoom):
         """Обновить все поля сразу"""
@@ -0,0 +1,192 @@
+# stream_scheduler.py
+
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Callable, Optional
+
+# Если поток отстал больше чем на столько периодов, пропущенные отправки не догоняем
+MAX_CATCH_UP_PERIODS = 1
+
+
+class Stream:
+    """
+    Периодическая отправка одного сообщения.
+    Моменты отправки считаются от времени запуска (start + n * period),
+    поэтому задержки потока не накапливаются (нет дрейфа).
+    """
+
+    def __init__(self, send: Callable, rate_hz: float, duration: Optional[float] = None,
+                 count: Optional[int] = None, owner=None, name: str = ""):
+        if rate_hz <= 0:
+            raise ValueError(f"Частота потока {name} должна быть больше нуля: {rate_hz}")
+        self.send = send
+        self.period = 1.0 / rate_hz
+        self.duration = duration
+        self.count = count
+        self.owner = owner
+        self.name = name or getattr(send, '__name__', 'stream')
+        self.sent = 0
+        self.skipped = 0            # Пропущенные отправки (поток не успел)
+        self.start_time = None
+        self._tick = 0
+        self._cancelled = False
+        self._done = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return not self._done.is_set()
+
+    def cancel(self) -> None:
+        """Останавливает поток; из очереди планировщика он уберётся при следующем срабатывании"""
+        self._cancelled = True
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт окончания потока (по числу отправок, длительности или отмене)"""
+        return self._done.wait(timeout)
+
+    def _due(self) -> float:
+        return self.start_time + self._tick * self.period
+
+    def _expired(self, due: float) -> bool:
+        if self._cancelled:
+            return True
+        if self.count is not None and self.sent >= self.count:
+            return True
+        return self.duration is not None and due - self.start_time >= self.duration
+
+    def _advance(self, now: float) -> None:
+        """Следующий момент отправки по сетке периода, без догоняющей пачки"""
+        self._tick += 1
+        behind = math.floor((now - self._due()) / self.period)
+        if behind > MAX_CATCH_UP_PERIODS:
+            self.skipped += behind
+            self._tick += behind
+
+
+class StreamScheduler:
+    """
+    Один поток таймера для всех периодических исходящих сообщений
+    (подмешивание GPS, HEARTBEAT станции, повтор HOME_POSITION).
+    Потоки хранятся в куче по времени следующей отправки,
+    поток таймера спит ровно до ближайшей из них.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._current = None        # Поток, который сейчас отправляется (его нет в куче)
+
+    def add(self, send: Callable, rate_hz: float, duration: Optional[float] = None,
+            count: Optional[int] = None, owner=None, name: str = "", delay: float = 0.0) -> Stream:
+        """
+        Регистрирует периодическую отправку send() с частотой rate_hz.
+        Поток заканчивается после count отправок, через duration секунд или по cancel().
+        owner - например, соединение master: cancel_owner(master) остановит все его потоки.
+        """
+        stream = Stream(send, rate_hz, duration, count, owner, name)
+        stream.start_time = time.monotonic() + delay
+        with self._cond:
+            heapq.heappush(self._heap, (stream.start_time, next(self._order), stream))
+            self._ensure_thread()
+            self._cond.notify_all()
+        return stream
+
+    def cancel(self, stream: Stream) -> None:
+        stream.cancel()
+        with self._cond:
+            self._cond.notify_all()
+
+    def cancel_owner(self, owner) -> None:
+        """
+        Останавливает все потоки, зарегистрированные с этим owner.
+        Если один из них как раз отправляется, ждёт конца отправки:
+        после возврата соединение owner можно закрывать.
+        """
+        with self._cond:
+            for _, _, stream in self._heap:
+                if stream.owner is owner:
+                    stream.cancel()
+            current = self._current
+            if current is not None and current.owner is owner:
+                current.cancel()
+                if threading.current_thread() is not self._thread:
+                    while self._current is current:
+                        self._cond.wait()
+            self._cond.notify_all()
+
+    def streams(self, owner=None) -> list:
+        with self._cond:
+            return [stream for _, _, stream in self._heap
+                    if stream.active and (owner is None or stream.owner is owner)]
+
+    def stop(self) -> None:
+        with self._cond:
+            self._running = False
+            for _, _, stream in self._heap:
+                stream.cancel()
+            if self._current is not None:
+                self._current.cancel()
+            self._heap.clear()
+            self._cond.notify_all()
+
+    def _ensure_thread(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        if self._thread is not None and self._thread.is_alive():
+            # Поток после stop() ещё не вышел - он увидит _running и продолжит работу
+            return
+        self._thread = threading.Thread(target=self._run, name="StreamScheduler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._running:
+                    # Отменённые потоки просто выбрасываем из кучи
+                    while self._heap and self._heap[0][2]._cancelled:
+                        heapq.heappop(self._heap)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    due = self._heap[0][0]
+                    delay = due - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if not self._running:
+                    return
+                _, _, stream = heapq.heappop(self._heap)
+                self._current = stream
+
+            # Отправляем вне блокировки: add() и cancel() не ждут сокет
+            if not stream._expired(due):
+                try:
+                    stream.send()
+                    stream.sent += 1
+                except Exception as e:
+                    print(f"Ошибка отправки потока {stream.name}: {e}")
+                    stream.cancel()
+
+            now = time.monotonic()
+            stream._advance(now)
+            next_due = stream._due()
+            # Возврат в кучу под блокировкой: отмена во время отправки (cancel_owner) не потеряется
+            with self._cond:
+                self._current = None
+                self._cond.notify_all()
+                if stream._expired(next_due):
+                    stream._done.set()
+                    continue
+                heapq.heappush(self._heap, (next_due, next(self._order), stream))
+
+
+# Общий планировщик для всех соединений программы
+stream_scheduler = StreamScheduler()
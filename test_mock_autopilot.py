@@ -0,0 +1,86 @@
+# test_mock_autopilot.py
+# Прогон протокола миссий и команд приложения против MockAutopilot на свободном локальном порту:
+# python -m pytest -q test_mock_autopilot.py (работает и с MAVLINK20=1, и без)
+
+import socket
+import time
+from contextlib import contextmanager
+
+import pytest
+from pymavlink import mavutil
+
+from flight_control import send_command_arm, send_command_takeoff, set_mode_guided
+from mavlink_reader import start_reader, stop_reader, subscribe
+from mission_control import build_mission, clear_mission, download_mission, sync_mission, upload_mission
+from mock_autopilot import LinkProfile, MockAutopilot, gcs_address
+from tlog_replay import open_connection
+
+MISSION_SIZE = 40
+LOSSY_LINK = LinkProfile(latency=0.005, jitter=0.002, loss=0.1)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def _vehicle(profile: LinkProfile):
+    """Имитатор на свободном порту и подключённая к нему станция (поток чтения запущен)"""
+    vehicle = MockAutopilot(f"tcpin:127.0.0.1:{_free_port()}", uplink=profile,
+                            downlink=LinkProfile(**vars(profile)), seed=7).start()
+    master = open_connection(gcs_address(vehicle.address), source_system=200, source_component=1)
+    try:
+        assert master.wait_heartbeat(timeout=5) is not None, "имитатор не прислал HEARTBEAT"
+        start_reader(master)
+        yield vehicle, master
+    finally:
+        stop_reader(master)
+        master.close()
+        vehicle.stop()
+
+
+def _fields(item) -> tuple:
+    return item.seq, item.command, item.x, item.y, round(item.z, 3)
+
+
+@pytest.mark.parametrize("profile", [LinkProfile(), LOSSY_LINK], ids=["clean", "lossy"])
+def test_mission_upload_sync_download_clear(profile):
+    with _vehicle(profile) as (vehicle, master):
+        lat, lon, _ = vehicle.state.home
+        mission = build_mission([(lat + 0.0005 * i, lon + 0.0003 * i) for i in range(MISSION_SIZE)], 30.0)
+
+        upload_mission(master, mission)
+        assert [_fields(item) for item in vehicle.mission()] == [_fields(item) for item in mission]
+
+        # Изменён один пункт: уходит только он (MISSION_WRITE_PARTIAL_LIST)
+        mission.z[MISSION_SIZE // 2] += 5
+        assert sync_mission(master, mission).items == 1
+        assert vehicle.mission()[MISSION_SIZE // 2].z == pytest.approx(35.0)
+
+        downloaded = download_mission(master)
+        assert [_fields(item) for item in downloaded] == [_fields(item) for item in mission]
+
+        # clear_mission не ждёт MISSION_ACK - ждём, пока борт очистит миссию
+        clear_mission(master)
+        deadline = time.monotonic() + 5
+        while vehicle.mission() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert vehicle.mission() == []
+
+
+def test_commands_acknowledged():
+    with _vehicle(LinkProfile()) as (vehicle, master):
+        assert set_mode_guided(master)
+
+        with subscribe(master, 'COMMAND_ACK') as acks:
+            send_command_arm(master)
+            ack = acks.get(timeout=5, condition=lambda m: m.command == mavutil.mavlink.MAV_CMD_COMPONENT_ARM_DISARM)
+        assert ack is not None and ack.result == mavutil.mavlink.MAV_RESULT_ACCEPTED
+        assert vehicle.state.armed
+
+        with subscribe(master, 'COMMAND_ACK') as acks:
+            send_command_takeoff(master, 10)
+            ack = acks.get(timeout=5, condition=lambda m: m.command == mavutil.mavlink.MAV_CMD_NAV_TAKEOFF)
+        assert ack is not None and ack.result == mavutil.mavlink.MAV_RESULT_ACCEPTED
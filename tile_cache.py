@@ -0,0 +1,124 @@
+# tile_cache.py
+
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+TILE_CACHE_BYTES = 256 * 2 ** 20    # Бюджет памяти под декодированные тайлы по умолчанию
+EVICTION_SAMPLE = 32                # Из скольких самых старых тайлов выбирать самый далёкий для вытеснения
+ZOOM_DISTANCE_PENALTY = 4           # "Расстояние" в тайлах за каждый уровень зума от текущего
+
+# Ключ: (сервер, zoom, x, y)
+TileKey = Tuple[str, int, int, int]
+
+
+def image_size_bytes(image) -> int:
+    """Оценка памяти декодированного тайла: Tk хранит 4 байта на пиксель"""
+    try:
+        return image.width() * image.height() * 4
+    except Exception:
+        return 256 * 256 * 4
+
+
+class TileCache:
+    """
+    Кэш декодированных тайлов (PhotoImage) с ограничением по памяти.
+
+    Ключ - (сервер, zoom, x, y), поэтому тайлы разных серверов не смешиваются
+    и переживают переключение сервера. При превышении бюджета вытесняется не просто
+    самый старый тайл, а самый далёкий от текущего вида среди EVICTION_SAMPLE самых старых:
+    недавно просмотренная соседняя область остаётся в памяти.
+    Методы потокобезопасны: кэш читают фоновые потоки загрузки и поток Tkinter.
+    """
+
+    def __init__(self, max_bytes: int = TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # key -> (image, size), от старых к новым
+        self._focus = None              # (zoom, x, y) центра экрана, дробные номера тайла
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return key in self._entries
+
+    def set_focus(self, zoom: int, x: float, y: float) -> None:
+        """Центр текущего вида (номера тайлов на зуме zoom) - от него считается "далеко" при вытеснении"""
+        self._focus = (zoom, x, y)
+
+    def get(self, key: TileKey):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key: TileKey):
+        """Тайл или None без учёта в счётчиках попаданий (повторная проверка того же запроса)"""
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def put(self, key: TileKey, image, size: Optional[int] = None) -> None:
+        if size is None:
+            size = image_size_bytes(image)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (image, size)
+            self.bytes += size
+            if self.bytes > self.max_bytes:
+                self._evict()
+
+    def discard(self, key: TileKey) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _distance(self, key: TileKey) -> float:
+        focus = self._focus
+        if focus is None:
+            return 0.0
+        _, zoom, x, y = key
+        focus_zoom, focus_x, focus_y = focus
+        # Переводим центр вида на зум тайла и меряем расстояние в тайлах
+        scale = 2.0 ** (zoom - focus_zoom)
+        dx = abs(x + 0.5 - focus_x * scale)
+        dy = abs(y + 0.5 - focus_y * scale)
+        return max(dx, dy) + abs(zoom - focus_zoom) * ZOOM_DISTANCE_PENALTY
+
+    def _evict(self) -> None:
+        entries = self._entries
+        while self.bytes > self.max_bytes and len(entries) > 1:
+            # Кандидаты - самые давно использованные; из них уходит самый далёкий от вида
+            candidates = []
+            for key in entries:
+                candidates.append(key)
+                if len(candidates) >= EVICTION_SAMPLE:
+                    break
+            victim = max(candidates, key=self._distance)
+            self.bytes -= entries.pop(victim)[1]
+            self.evictions += 1
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self):
+        return (f"{len(self._entries)} тайлов, {self.bytes / 2 ** 20:.1f}/{self.max_bytes / 2 ** 20:.0f} МБ, "
+                f"попаданий {self.hits}, промахов {self.misses} ({self.hit_rate:.0%}), вытеснено {self.evictions}")
@@ -0,0 +1,151 @@
+# tile_dedup.py
+
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+
+COMPACT_BATCH = 2000        # Строк в одной пачке вставки при сжатии
+
+# После сжатия tiles - представление поверх двух таблиц:
+# tile_blobs - уникальные картинки, tile_refs - (сервер, z, x, y) -> картинка.
+# Запросы tkintermapview, OfflineLoader и TileStore к tiles работают без изменений,
+# новые тайлы через INSTEAD OF-триггер сразу ложатся без дублей (поиск по размеру, затем по содержимому).
+COMPACT_SCHEMA = (
+    """CREATE TABLE tile_blobs (
+            id INTEGER PRIMARY KEY,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL);""",
+    """CREATE INDEX tile_blobs_size ON tile_blobs (size);""",
+    """CREATE TABLE tile_refs (
+            server VARCHAR(300) NOT NULL,
+            zoom INTEGER NOT NULL,
+            x INTEGER NOT NULL,
+            y INTEGER NOT NULL,
+            blob_id INTEGER NOT NULL REFERENCES tile_blobs (id),
+            PRIMARY KEY (server, zoom, x, y)) WITHOUT ROWID;""",
+)
+
+COMPACT_VIEW = (
+    """CREATE VIEW tiles AS
+            SELECT r.zoom AS zoom, r.x AS x, r.y AS y, r.server AS server, b.data AS tile_image
+            FROM tile_refs r JOIN tile_blobs b ON b.id = r.blob_id;""",
+    """CREATE TRIGGER tiles_insert INSTEAD OF INSERT ON tiles
+        BEGIN
+            INSERT INTO tile_blobs (size, data)
+                SELECT length(NEW.tile_image), NEW.tile_image
+                WHERE NOT EXISTS (SELECT 1 FROM tile_blobs
+                                  WHERE size = length(NEW.tile_image) AND data = NEW.tile_image);
+            INSERT OR REPLACE INTO tile_refs (server, zoom, x, y, blob_id)
+                VALUES (NEW.server, NEW.zoom, NEW.x, NEW.y,
+                        (SELECT id FROM tile_blobs
+                         WHERE size = length(NEW.tile_image) AND data = NEW.tile_image));
+        END;""",
+    """CREATE TRIGGER tiles_delete INSTEAD OF DELETE ON tiles
+        BEGIN
+            DELETE FROM tile_refs
+                WHERE server = OLD.server AND zoom = OLD.zoom AND x = OLD.x AND y = OLD.y;
+        END;""",
+)
+
+
+@dataclass
+class CompactionStats:
+    """Результат сжатия базы тайлов"""
+    tiles: int = 0
+    unique: int = 0
+    removed_blobs: int = 0      # Картинки, на которые больше никто не ссылается
+    size_before: int = 0
+    size_after: int = 0
+    elapsed: float = 0.0
+
+    def __str__(self):
+        saved = self.size_before - self.size_after
+        return (f"{self.tiles} тайлов, уникальных картинок {self.unique}, удалено лишних {self.removed_blobs}; "
+                f"{self.size_before / 2 ** 20:.1f} -> {self.size_after / 2 ** 20:.1f} МБ "
+                f"(-{saved / 2 ** 20:.1f} МБ) за {self.elapsed:.1f} с")
+
+
+def is_compacted(connection: sqlite3.Connection) -> bool:
+    row = connection.execute("SELECT type FROM sqlite_master WHERE name='tiles';").fetchone()
+    return row is not None and row[0] == "view"
+
+
+def _file_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def compact_tiles(path: str, vacuum: bool = True) -> CompactionStats:
+    """
+    Сжатие offline_tiles.db: одинаковые картинки тайлов хранятся один раз.
+    Первый запуск переводит таблицу tiles в tile_blobs + tile_refs (хеш blake2b по содержимому).
+    Повторный запуск только удаляет картинки без ссылок. VACUUM возвращает место в файле.
+    """
+    stats = CompactionStats(size_before=_file_size(path))
+    start = time.monotonic()
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        connection.execute("BEGIN IMMEDIATE;")
+        try:
+            if not is_compacted(connection):
+                _convert(connection, stats)
+            stats.removed_blobs = connection.execute(
+                "DELETE FROM tile_blobs WHERE id NOT IN (SELECT blob_id FROM tile_refs);").rowcount
+            stats.tiles = connection.execute("SELECT count(*) FROM tile_refs;").fetchone()[0]
+            stats.unique = connection.execute("SELECT count(*) FROM tile_blobs;").fetchone()[0]
+            connection.execute("COMMIT;")
+        except BaseException:
+            connection.execute("ROLLBACK;")
+            raise
+        if vacuum:
+            connection.execute("VACUUM;")
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    finally:
+        connection.close()
+    stats.size_after = _file_size(path)
+    stats.elapsed = time.monotonic() - start
+    return stats
+
+
+def _convert(connection: sqlite3.Connection, stats: CompactionStats) -> None:
+    for statement in COMPACT_SCHEMA:
+        connection.execute(statement)
+
+    blob_ids = {}               # (хеш, размер) -> id картинки
+    refs = []
+    blobs = []
+    next_id = 1
+    # Отдельный курсор чтения: вставка идёт в другие таблицы того же соединения
+    reader = connection.execute("SELECT server, zoom, x, y, tile_image FROM tiles;")
+    for server, zoom, x, y, data in reader:
+        key = (hashlib.blake2b(data, digest_size=16).digest(), len(data))
+        blob_id = blob_ids.get(key)
+        if blob_id is None:
+            blob_id = blob_ids[key] = next_id
+            next_id += 1
+            blobs.append((blob_id, len(data), data))
+        refs.append((server, zoom, x, y, blob_id))
+        if len(refs) >= COMPACT_BATCH:
+            _flush(connection, blobs, refs)
+    _flush(connection, blobs, refs)
+
+    connection.execute("DROP TABLE tiles;")
+    for statement in COMPACT_VIEW:
+        connection.execute(statement)
+
+
+def _flush(connection: sqlite3.Connection, blobs: list, refs: list) -> None:
+    connection.executemany("INSERT INTO tile_blobs (id, size, data) VALUES (?, ?, ?);", blobs)
+    connection.executemany("INSERT INTO tile_refs (server, zoom, x, y, blob_id) VALUES (?, ?, ?, ?, ?);", refs)
+    blobs.clear()
+    refs.clear()
+
+
+if __name__ == "__main__":
+    # python tile_dedup.py [путь к базе], по умолчанию - offline_tiles.db рядом со скриптом
+    db_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "offline_tiles.db")
+    print(f"Сжатие {db_path} ...")
+    print(compact_tiles(db_path))
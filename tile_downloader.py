@@ -0,0 +1,361 @@
+# tile_downloader.py
+
+import math
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from tkintermapview.utility_functions import decimal_to_osm
+
+from tile_store import TileStore, open_tile_store
+
+DOWNLOAD_WORKERS = 16       # Размер пула потоков загрузки
+PER_HOST_LIMIT = 8          # Одновременных запросов к одному серверу (не больше, чем разрешают правила сервера)
+QUEUE_PER_WORKER = 4        # Сколько задач держать в очереди пула на каждый поток
+MAX_RETRIES = 5             # Повторов одного тайла при ошибке сети или ответе 429/5xx
+BACKOFF_BASE = 0.5          # Первая пауза перед повтором (секунды), дальше удваивается
+BACKOFF_MAX = 30.0          # Максимальная пауза перед повтором
+REQUEST_TIMEOUT = 15        # Таймаут одного HTTP-запроса (секунды)
+BATCH_SIZE = 500            # Тайлов в одной транзакции записи в базу
+BATCH_SECONDS = 2.0         # ... или не реже, чем раз в столько секунд
+PROGRESS_SECONDS = 1.0      # Период вывода прогресса
+USER_AGENT = "TkinterMapView"
+CORRIDOR_WIDTH = 200.0      # Ширина коридора вдоль маршрута по умолчанию (метры)
+CORRIDOR_FULL_ZOOM = 14     # До этого зума включительно коридор не строится - качается весь прямоугольник
+EARTH_CIRCUMFERENCE = 40075016.686  # Длина экватора (метры) - ширина карты на зуме 0
+
+# Ответы сервера, после которых имеет смысл повторить запрос
+RETRY_STATUS = frozenset((408, 425, 429, 500, 502, 503, 504))
+# Тайла нет и не будет (за краем покрытия) - не повторяем и не записываем
+MISSING_STATUS = frozenset((204, 404, 410))
+
+# Зум, прямоугольник тайлов и набор тайлов внутри него (None - весь прямоугольник)
+Region = Tuple[int, Tuple[int, int, int, int], Optional[Set[Tuple[int, int]]]]
+
+
+def tile_bounds(position_a: Tuple[float, float], position_b: Tuple[float, float],
+                zoom: int) -> Tuple[int, int, int, int]:
+    """Номера тайлов (x0, y0, x1, y1) прямоугольника между двумя точками (включительно)"""
+    ax, ay = decimal_to_osm(*position_a, zoom)
+    bx, by = decimal_to_osm(*position_b, zoom)
+    last = 2 ** zoom - 1
+    return (max(0, math.floor(min(ax, bx))), max(0, math.floor(min(ay, by))),
+            min(last, math.floor(max(ax, bx))), min(last, math.floor(max(ay, by))))
+
+
+def _tile_radius(width: float, lat_a: float, lat_b: float, zoom: int) -> float:
+    """Половина ширины коридора в тайлах зума zoom (по большей из широт - тайлы там мельче в метрах)"""
+    lat = min(89.0, max(abs(lat_a), abs(lat_b)))
+    tile_meters = EARTH_CIRCUMFERENCE * math.cos(math.radians(lat)) / 2 ** zoom
+    return width / 2 / tile_meters
+
+
+def route_bounds(positions: Sequence[Tuple[float, float]], width: float,
+                 zoom: int) -> Tuple[int, int, int, int]:
+    """Прямоугольник тайлов (x0, y0, x1, y1), в который маршрут входит вместе с коридором"""
+    points = [decimal_to_osm(lat, lon, zoom) for lat, lon in positions]
+    lats = [lat for lat, _ in positions]
+    r = _tile_radius(width, min(lats), max(lats), zoom)
+    last = 2 ** zoom - 1
+    return (max(0, math.floor(min(x for x, _ in points) - r)), max(0, math.floor(min(y for _, y in points) - r)),
+            min(last, math.floor(max(x for x, _ in points) + r)), min(last, math.floor(max(y for _, y in points) + r)))
+
+
+def corridor_tiles(positions: Sequence[Tuple[float, float]], width: float, zoom: int) -> Set[Tuple[int, int]]:
+    """
+    Тайлы (x, y) зума zoom, которые задевает коридор шириной width метров вдоль ломаной positions.
+    Отрезок обходится по столбцам тайлов: в столбце берётся диапазон y участка отрезка,
+    расширенный на полширины коридора, - работа пропорциональна длине маршрута, а не площади.
+    Коридор получается не уже заданного (на концах и диагоналях - с небольшим запасом).
+    """
+    points = [decimal_to_osm(lat, lon, zoom) for lat, lon in positions]
+    if len(points) == 1:
+        points = points * 2
+        positions = list(positions) * 2
+    last = 2 ** zoom - 1
+    tiles = set()
+    for i in range(len(points) - 1):
+        (ax, ay), (bx, by) = points[i], points[i + 1]
+        r = _tile_radius(width, positions[i][0], positions[i + 1][0], zoom)
+        if ax > bx:
+            ax, ay, bx, by = bx, by, ax, ay
+        slope = (by - ay) / (bx - ax) if bx > ax else 0.0
+        x0 = max(0, math.floor(ax - r))
+        x1 = min(last, math.floor(bx + r))
+        for x in range(x0, x1 + 1):
+            # Участок отрезка над полосой [x - r, x + 1 + r]
+            left = max(ax, x - r)
+            right = min(bx, x + 1 + r)
+            ya = ay + (left - ax) * slope
+            yb = ay + (right - ax) * slope
+            y0 = max(0, math.floor(min(ya, yb) - r))
+            y1 = min(last, math.floor(max(ya, yb) + r))
+            for y in range(y0, y1 + 1):
+                tiles.add((x, y))
+    return tiles
+
+
+def tile_url(tile_server: str, zoom: int, x: int, y: int) -> str:
+    return tile_server.replace("{x}", str(x)).replace("{y}", str(y)).replace("{z}", str(zoom))
+
+
+@dataclass
+class DownloadStats:
+    """Статистика подготовки офлайн-карты"""
+    total: int = 0          # Тайлов в области
+    present: int = 0        # Уже были в базе (докачка)
+    downloaded: int = 0
+    missing: int = 0        # Сервер ответил, что тайла нет
+    failed: int = 0         # Не скачались после всех повторов
+    retries: int = 0
+    bytes: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.present + self.downloaded + self.missing + self.failed
+
+    @property
+    def tiles_per_second(self) -> float:
+        return self.downloaded / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (f"{self.done}/{self.total} тайлов: скачано {self.downloaded} ({self.bytes / 2 ** 20:.1f} МБ), "
+                f"уже были {self.present}, нет на сервере {self.missing}, ошибок {self.failed}, "
+                f"повторов {self.retries}; {self.elapsed:.1f} с ({self.tiles_per_second:.1f} тайлов/с)")
+
+
+class TileDownloader:
+    """
+    Загрузка тайлов области в базу offline_tiles.db (схема OfflineLoader) или в файл .mbtiles.
+
+    - Пул из workers потоков, у каждого свой requests.Session (keep-alive соединения);
+    - не больше per_host одновременных запросов к одному серверу;
+    - повтор с экспоненциальной паузой (и Retry-After) при ошибках сети и ответах 429/5xx;
+    - докачка: тайлы, уже лежащие в базе, не запрашиваются;
+    - запись - только из вызывающего потока, пачками по batch_size тайлов в одной транзакции.
+    Прервать загрузку можно stop() из другого потока: записанное сохранится, повторный запуск докачает остальное.
+    """
+
+    def __init__(self, db_path: str, tile_server: str, max_zoom: int = 19,
+                 workers: int = DOWNLOAD_WORKERS, per_host: int = PER_HOST_LIMIT,
+                 retries: int = MAX_RETRIES, batch_size: int = BATCH_SIZE,
+                 progress: Optional[Callable[[DownloadStats], None]] = None):
+        self.db_path = db_path
+        self.tile_server = tile_server
+        self.max_zoom = max_zoom
+        self.workers = workers
+        self.per_host = per_host
+        self.retries = retries
+        self.batch_size = batch_size
+        self.progress = progress if progress is not None else self._print_progress
+
+        self._local = threading.local()
+        self._host_limits = {}
+        self._host_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._retries = 0
+        self._retries_lock = threading.Lock()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # --- загрузка одного тайла (потоки пула) ---
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.per_host)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            self._local.session = session
+        return session
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._host_lock:
+            limit = self._host_limits.get(host)
+            if limit is None:
+                limit = self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return limit
+
+    def fetch(self, zoom: int, x: int, y: int) -> Tuple[int, int, int, Optional[bytes], bool]:
+        """
+        Скачивает тайл: (zoom, x, y, данные, ok).
+        данные None и ok=True - тайла на сервере нет; ok=False - не удалось после всех повторов.
+        """
+        url = tile_url(self.tile_server, zoom, x, y)
+        session = self._session()
+        limit = self._host_limit(url)
+        for attempt in range(self.retries + 1):
+            if self._stop.is_set():
+                return zoom, x, y, None, False
+            delay = None
+            try:
+                with limit:
+                    response = session.get(url, timeout=REQUEST_TIMEOUT)
+                    content = response.content
+                if response.status_code == 200 and content:
+                    return zoom, x, y, content, True
+                if response.status_code in MISSING_STATUS or response.status_code == 200:
+                    return zoom, x, y, None, True
+                if response.status_code not in RETRY_STATUS:
+                    print(f"Тайл {zoom}/{x}/{y}: HTTP {response.status_code}")
+                    return zoom, x, y, None, False
+                delay = self._retry_after(response)
+            except requests.RequestException:
+                pass
+
+            if attempt < self.retries:
+                with self._retries_lock:
+                    self._retries += 1
+                if delay is None:
+                    # Экспоненциальная пауза со случайным разбросом, чтобы потоки не повторяли запросы разом
+                    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                self._stop.wait(delay)
+        return zoom, x, y, None, False
+
+    @staticmethod
+    def _retry_after(response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        try:
+            return min(BACKOFF_MAX, float(value)) if value is not None else None
+        except ValueError:
+            return None
+
+    # --- загрузка области ---
+
+    def _tasks(self, store: TileStore, regions: List[Region], stats) -> Iterator[Tuple[int, int, int]]:
+        """Недостающие тайлы по зумам от мелкого к крупному"""
+        for zoom, bounds, tiles in regions:
+            present = store.existing(self.tile_server, zoom, bounds)
+            x0, y0, x1, y1 = bounds
+            if tiles is None:
+                stats.present += len(present)
+                wanted = ((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+            else:
+                stats.present += len(present & tiles)
+                wanted = sorted(tiles)
+            for x, y in wanted:
+                if (x, y) not in present:
+                    yield zoom, x, y
+
+    def download(self, position_a: Tuple[float, float], position_b: Tuple[float, float],
+                 zoom_a: int, zoom_b: int) -> DownloadStats:
+        """Скачивает все тайлы прямоугольника position_a - position_b на зумах zoom_a..zoom_b"""
+        zoom_a, zoom_b = round(min(zoom_a, zoom_b)), round(max(zoom_a, zoom_b))
+        regions = [(zoom, tile_bounds(position_a, position_b, zoom), None) for zoom in range(zoom_a, zoom_b + 1)]
+        # Область целиком в базе (как у OfflineLoader.save_offline_tiles)
+        return self._download(regions, (position_a, position_b, zoom_a, zoom_b))
+
+    def download_corridor(self, positions: Iterable[Tuple[float, float]], zoom_a: int, zoom_b: int,
+                          width: float = CORRIDOR_WIDTH, full_zoom: int = CORRIDOR_FULL_ZOOM) -> DownloadStats:
+        """
+        Тайлы вдоль маршрута: на зумах до full_zoom - весь прямоугольник маршрута (обзор),
+        крупнее - только коридор шириной width метров вокруг линии полёта.
+        Число тайлов растёт вдвое на уровень зума, а не вчетверо, как у прямоугольника.
+        """
+        positions = [tuple(position[:2]) for position in positions]
+        if not positions:
+            raise ValueError("Пустой маршрут")
+        zoom_a, zoom_b = round(min(zoom_a, zoom_b)), round(max(zoom_a, zoom_b))
+        regions = []
+        for zoom in range(zoom_a, zoom_b + 1):
+            bounds = route_bounds(positions, width, zoom)
+            tiles = corridor_tiles(positions, width, zoom) if zoom > full_zoom else None
+            regions.append((zoom, bounds, tiles))
+
+        section = None
+        if zoom_a <= full_zoom:
+            # В sections попадает только прямоугольная часть - коридор OfflineLoader описать не умеет
+            lats = [lat for lat, _ in positions]
+            lons = [lon for _, lon in positions]
+            section = ((max(lats), min(lons)), (min(lats), max(lons)), zoom_a, min(zoom_b, full_zoom))
+        return self._download(regions, section)
+
+    def _download(self, regions: List[Region], section) -> DownloadStats:
+        stats = DownloadStats()
+        for zoom, (x0, y0, x1, y1), tiles in regions:
+            stats.total += (x1 - x0 + 1) * (y1 - y0 + 1) if tiles is None else len(tiles)
+
+        store = open_tile_store(self.db_path)
+        try:
+            store.add_server(self.tile_server, self.max_zoom)
+            self._stop.clear()
+            self._retries = 0
+            start = time.monotonic()
+            self._run(store, self._tasks(store, regions, stats), stats, start)
+            stats.retries = self._retries
+            stats.elapsed = time.monotonic() - start
+
+            if section is not None and stats.failed == 0 and not self._stop.is_set():
+                store.add_section(self.tile_server, *section)
+        finally:
+            store.close()
+        self.progress(stats)
+        return stats
+
+    def _run(self, store: TileStore, tasks, stats, start) -> None:
+        results = queue.Queue()
+        max_in_flight = self.workers * QUEUE_PER_WORKER
+        in_flight = 0
+        batch = []
+        last_flush = last_progress = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="TileDownload") as pool:
+            tasks = iter(tasks)
+            exhausted = False
+            while True:
+                # Задачи подаются порциями: в памяти не больше max_in_flight, а не вся область
+                while not exhausted and in_flight < max_in_flight and not self._stop.is_set():
+                    task = next(tasks, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    pool.submit(self.fetch, *task).add_done_callback(lambda f: results.put(f.result()))
+                    in_flight += 1
+                if in_flight == 0:
+                    break
+
+                try:
+                    zoom, x, y, content, ok = results.get(timeout=BATCH_SECONDS)
+                except queue.Empty:
+                    pass
+                else:
+                    in_flight -= 1
+                    if content is not None:
+                        batch.append((zoom, x, y, content))
+                        stats.downloaded += 1
+                        stats.bytes += len(content)
+                    elif ok:
+                        stats.missing += 1
+                    elif not self._stop.is_set():
+                        # Прерванные stop() загрузки ошибками не считаем - их докачает следующий запуск
+                        stats.failed += 1
+
+                now = time.monotonic()
+                if len(batch) >= self.batch_size or (batch and now - last_flush >= BATCH_SECONDS):
+                    store.put_many(self.tile_server, batch)
+                    batch = []
+                    last_flush = now
+                if now - last_progress >= PROGRESS_SECONDS:
+                    stats.retries = self._retries
+                    stats.elapsed = now - start
+                    self.progress(stats)
+                    last_progress = now
+
+        if batch:
+            store.put_many(self.tile_server, batch)
+
+    @staticmethod
+    def _print_progress(stats: DownloadStats) -> None:
+        print(f"[tiles] {stats}")
@@ -0,0 +1,272 @@
+# tile_prefetch.py
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Iterable, List, Optional, Tuple
+
+from tkintermapview.utility_functions import decimal_to_osm
+
+PREFETCH_WORKERS = 2        # Фоновых потоков предзагрузки (меньше, чем потоков видимых тайлов у карты)
+PREFETCH_BUDGET = 32        # Тайлов на одно изменение вида: остальное всё равно устареет
+LOOKAHEAD_SECONDS = 1.0     # На сколько вперёд предсказываем сдвиг карты и полёт аппарата
+MIN_PAN_SPEED = 0.5         # Тайлов/с: медленнее - считаем, что карта стоит, и грузим кольцо вокруг
+VELOCITY_SMOOTHING = 0.5    # Вес нового замера в скользящей скорости сдвига
+PAN_PAUSE_SECONDS = 0.3     # Перерыв между сдвигами, после которого скорость обнуляется
+VEHICLE_AHEAD_TILES = 3     # Минимум тайлов вперёд по курсу аппарата
+VEHICLE_HINT_SECONDS = 5.0  # Положение аппарата старше этого не учитываем
+IDLE_SLEEP = 0.02           # Пауза потока, пока карта грузит видимые тайлы или задач нет
+EARTH_CIRCUMFERENCE = 40075016.686
+
+Tile = Tuple[int, int, int]     # zoom, x, y
+
+
+class TilePrefetcher:
+    """
+    Предзагрузка тайлов, которые вот-вот понадобятся карте, в её TileCache.
+
+    На каждое изменение вида составляется план не больше budget тайлов:
+    - впереди по курсу аппарата (если карта следит за ним);
+    - по направлению сдвига карты с учётом скорости, а если карта стоит - кольцо вокруг экрана;
+    - следующий уровень зума в сторону последнего изменения зума (вокруг указателя мыши).
+    Новый план заменяет старый: невыполненные задачи прошлого вида отбрасываются.
+    Загрузка идёт через map_view.request_image() (кэш, TileStore, сервер) в нескольких потоках,
+    которые уступают дорогу видимым тайлам: пока у карты есть очередь, предзагрузка ждёт.
+    update(), note_zoom() и set_vehicle() вызываются из потока Tkinter.
+    """
+
+    def __init__(self, map_view, workers: int = PREFETCH_WORKERS, budget: int = PREFETCH_BUDGET):
+        self.map_view = map_view
+        self.budget = budget
+        self.requested = 0
+        self.loaded = 0
+        self.dropped = 0            # Задачи, отброшенные из-за смены вида
+
+        self._pending = deque()
+        self._generation = 0
+        self._condition = threading.Condition()
+        self._running = True
+        self._plan_key = None
+
+        self._sample = None         # (время, zoom, центр x, центр y) прошлого вида
+        self._velocity = (0.0, 0.0) # тайлов/с на текущем зуме
+        self._zoom_direction = 0
+        self._zoom_pointer = (0.5, 0.5)
+        self._vehicle = None        # (время, lat, lon, курс, скорость м/с)
+
+        self._threads = [threading.Thread(target=self._worker, name=f"TilePrefetch-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._pending.clear()
+            self._condition.notify_all()
+
+    # --- подсказки от карты и телеметрии ---
+
+    def note_zoom(self, direction: int, relative_x: float = 0.5, relative_y: float = 0.5) -> None:
+        """Направление последнего изменения зума (+1 - приближение) и точка, вокруг которой зумируют"""
+        self._zoom_direction = (direction > 0) - (direction < 0)
+        self._zoom_pointer = (relative_x, relative_y)
+
+    def set_vehicle(self, lat: float, lon: float, heading: Optional[float], speed: Optional[float] = None) -> None:
+        """Положение, курс (градусы) и путевая скорость (м/с) аппарата"""
+        if heading is None:
+            self._vehicle = None
+            return
+        self._vehicle = (time.monotonic(), lat, lon, heading, speed or 0.0)
+        self.update()
+
+    # --- план ---
+
+    def update(self) -> None:
+        """Вид карты изменился: обновить скорость сдвига и, если нужно, план предзагрузки"""
+        view = self._view()
+        if view is None:
+            return
+        zoom, ul, lr = view
+        now = time.monotonic()
+        center = ((ul[0] + lr[0]) / 2, (ul[1] + lr[1]) / 2)
+        self._update_velocity(now, zoom, center)
+
+        visible = (math.floor(ul[0]), math.floor(ul[1]), math.ceil(lr[0]) - 1, math.ceil(lr[1]) - 1)
+        vx, vy = self._velocity
+        vehicle = self._vehicle
+        if vehicle is not None and now - vehicle[0] > VEHICLE_HINT_SECONDS:
+            vehicle = self._vehicle = None
+        # План меняется, только когда меняются целые тайлы вида, направление сдвига или курс аппарата
+        key = (zoom, visible, self._direction_key(vx, vy), self._zoom_direction,
+               None if vehicle is None else (round(vehicle[3] / 15), self._vehicle_tile(vehicle, zoom)))
+        if key == self._plan_key:
+            return
+        self._plan_key = key
+
+        tiles = self.plan(zoom, ul, lr, visible, vehicle)
+        with self._condition:
+            self._generation += 1
+            self.dropped += len(self._pending)
+            self._pending.clear()
+            self._pending.extend((self._generation, tile) for tile in tiles)
+            self._condition.notify_all()
+
+    def plan(self, zoom: int, ul, lr, visible, vehicle=None) -> List[Tile]:
+        """Тайлы для предзагрузки в порядке важности (не больше budget, без видимых и уже загруженных)"""
+        max_zoom = getattr(self.map_view, "max_zoom", 19)
+        min_zoom = getattr(self.map_view, "min_zoom", 0)
+        x0, y0, x1, y1 = visible
+        center = ((ul[0] + lr[0]) / 2, (ul[1] + lr[1]) / 2)
+        groups = []
+
+        if vehicle is not None:
+            groups.append(self._vehicle_tiles(vehicle, zoom))
+
+        vx, vy = self._velocity
+        if math.hypot(vx, vy) >= MIN_PAN_SPEED:
+            # Вид через LOOKAHEAD_SECONDS, но не меньше чем на тайл в сторону сдвига
+            dx = self._shift(vx * LOOKAHEAD_SECONDS, x1 - x0 + 1)
+            dy = self._shift(vy * LOOKAHEAD_SECONDS, y1 - y0 + 1)
+            groups.append(self._rect_tiles(zoom, x0 + min(dx, 0), y0 + min(dy, 0),
+                                           x1 + max(dx, 0), y1 + max(dy, 0), center))
+        else:
+            groups.append(self._rect_tiles(zoom, x0 - 1, y0 - 1, x1 + 1, y1 + 1, center))
+
+        next_zoom = zoom + self._zoom_direction
+        if self._zoom_direction and min_zoom <= next_zoom <= max_zoom:
+            # Вид следующего зума вокруг указателя: при приближении вдвое меньше, при отдалении вдвое больше
+            px = ul[0] + (lr[0] - ul[0]) * self._zoom_pointer[0]
+            py = ul[1] + (lr[1] - ul[1]) * self._zoom_pointer[1]
+            scale = 2.0 ** self._zoom_direction
+            nul = (px + (ul[0] - px) / scale) * scale, (py + (ul[1] - py) / scale) * scale
+            nlr = (px + (lr[0] - px) / scale) * scale, (py + (lr[1] - py) / scale) * scale
+            groups.append(self._rect_tiles(next_zoom, math.floor(nul[0]), math.floor(nul[1]),
+                                           math.ceil(nlr[0]) - 1, math.ceil(nlr[1]) - 1, (px * scale, py * scale)))
+
+        cache = self.map_view.tile_cache
+        server = self.map_view.tile_server
+        result = []
+        seen = set()
+        for group in groups:
+            for tile in group:
+                t_zoom, x, y = tile
+                if t_zoom == zoom and x0 <= x <= x1 and y0 <= y <= y1:
+                    continue        # Видимые тайлы грузит сама карта
+                if tile in seen or (server, t_zoom, x, y) in cache:
+                    continue
+                seen.add(tile)
+                result.append(tile)
+                if len(result) >= self.budget:
+                    return result
+        return result
+
+    def _view(self):
+        view = self.map_view
+        ul, lr = view.upper_left_tile_pos, view.lower_right_tile_pos
+        if lr[0] <= ul[0] or lr[1] <= ul[1]:
+            return None
+        return round(view.zoom), ul, lr
+
+    def _update_velocity(self, now: float, zoom: int, center) -> None:
+        sample = self._sample
+        self._sample = (now, zoom, center[0], center[1])
+        if sample is None or sample[1] != zoom or now - sample[0] > PAN_PAUSE_SECONDS:
+            self._velocity = (0.0, 0.0)
+            return
+        dt = now - sample[0]
+        if dt <= 0:
+            return
+        vx = (center[0] - sample[2]) / dt
+        vy = (center[1] - sample[3]) / dt
+        a = VELOCITY_SMOOTHING
+        self._velocity = (self._velocity[0] * (1 - a) + vx * a, self._velocity[1] * (1 - a) + vy * a)
+
+    @staticmethod
+    def _direction_key(vx: float, vy: float):
+        if math.hypot(vx, vy) < MIN_PAN_SPEED:
+            return None
+        return round(math.degrees(math.atan2(vy, vx)) / 45) % 8
+
+    @staticmethod
+    def _shift(distance: float, limit: int) -> int:
+        if distance == 0:
+            return 0
+        tiles = min(limit, max(1, math.ceil(abs(distance))))
+        return tiles if distance > 0 else -tiles
+
+    @staticmethod
+    def _rect_tiles(zoom: int, x0: int, y0: int, x1: int, y1: int, center) -> List[Tile]:
+        last = 2 ** zoom - 1
+        tiles = [(zoom, x, y) for x in range(max(0, x0), min(last, x1) + 1)
+                 for y in range(max(0, y0), min(last, y1) + 1)]
+        # Ближние к центру - первыми: их увидят раньше
+        tiles.sort(key=lambda t: (t[1] + 0.5 - center[0]) ** 2 + (t[2] + 0.5 - center[1]) ** 2)
+        return tiles
+
+    @staticmethod
+    def _vehicle_tile(vehicle, zoom: int) -> Tuple[int, int]:
+        x, y = decimal_to_osm(vehicle[1], vehicle[2], zoom)
+        return int(x), int(y)
+
+    @staticmethod
+    def _vehicle_tiles(vehicle, zoom: int) -> Iterable[Tile]:
+        """Полоса в три тайла шириной по курсу аппарата на LOOKAHEAD_SECONDS полёта вперёд"""
+        _, lat, lon, heading, speed = vehicle
+        x, y = decimal_to_osm(lat, lon, zoom)
+        tile_meters = EARTH_CIRCUMFERENCE * math.cos(math.radians(lat)) / 2 ** zoom
+        ahead = max(VEHICLE_AHEAD_TILES, speed * LOOKAHEAD_SECONDS / tile_meters)
+        angle = math.radians(heading)
+        dx, dy = math.sin(angle), -math.cos(angle)      # Курс 0 - север, ось y тайлов - на юг
+        last = 2 ** zoom - 1
+        step = 0.5
+        distance = 0.0
+        while distance <= ahead:
+            cx, cy = int(x + dx * distance), int(y + dy * distance)
+            for ox in (-1, 0, 1):
+                for oy in (-1, 0, 1):
+                    if 0 <= cx + ox <= last and 0 <= cy + oy <= last:
+                        yield zoom, cx + ox, cy + oy
+            distance += step
+
+    # --- потоки загрузки ---
+
+    def _worker(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                generation, tile = self._pending.popleft()
+                if generation != self._generation:
+                    self.dropped += 1
+                    continue
+
+            view = self.map_view
+            if not getattr(view, "running", True):
+                return
+            # Видимые тайлы важнее: пока у карты своя очередь, ждём
+            while view.image_load_queue_tasks and self._running and generation == self._generation:
+                time.sleep(IDLE_SLEEP)
+            if generation != self._generation:
+                with self._condition:
+                    self.dropped += 1
+                continue
+
+            zoom, x, y = tile
+            if (view.tile_server, zoom, x, y) in view.tile_cache:
+                continue
+            self.requested += 1
+            try:
+                view.request_image(zoom, x, y)
+            except Exception:
+                continue
+            if (view.tile_server, zoom, x, y) in view.tile_cache:
+                self.loaded += 1
+
+    def __str__(self):
+        return (f"предзагрузка: запрошено {self.requested}, в кэше {self.loaded}, "
+                f"отброшено {self.dropped}, в очереди {len(self._pending)}")
+
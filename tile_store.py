@@ -0,0 +1,254 @@
+# tile_store.py
+
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+from typing import Iterable, Optional, Sequence, Tuple
+
+MMAP_SIZE = 256 * 2 ** 20       # Отображение файла базы в память для чтения (0 - выключено)
+CACHE_SIZE_KB = 64 * 1024       # Кэш страниц SQLite на одно соединение
+BUSY_TIMEOUT = 30               # Ожидание блокировки базы другим процессом (секунды)
+CACHED_STATEMENTS = 64          # Подготовленные запросы, которые соединение держит готовыми
+
+# Схема tkintermapview.OfflineLoader: базу можно по-прежнему открывать TkinterMapView(database_path=...)
+OFFLINE_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS server (
+            url VARCHAR(300) PRIMARY KEY NOT NULL,
+            max_zoom INTEGER NOT NULL);""",
+    """CREATE TABLE IF NOT EXISTS tiles (
+            zoom INTEGER NOT NULL,
+            x INTEGER NOT NULL,
+            y INTEGER NOT NULL,
+            server VARCHAR(300) NOT NULL,
+            tile_image BLOB NOT NULL,
+            CONSTRAINT fk_server FOREIGN KEY (server) REFERENCES server (url),
+            CONSTRAINT pk_tiles PRIMARY KEY (zoom, x, y, server));""",
+    """CREATE TABLE IF NOT EXISTS sections (
+            position_a VARCHAR(100) NOT NULL,
+            position_b VARCHAR(100) NOT NULL,
+            zoom_a INTEGER NOT NULL,
+            zoom_b INTEGER NOT NULL,
+            server VARCHAR(300) NOT NULL,
+            CONSTRAINT fk_server FOREIGN KEY (server) REFERENCES server (url),
+            CONSTRAINT pk_tiles PRIMARY KEY (position_a, position_b, zoom_a, zoom_b, server));""",
+)
+
+# Покрывающий индекс для поиска по серверу и зуму (докачка, проверка наличия):
+# первичный ключ начинается с zoom, x и сервер в нём последний.
+# В сжатой базе (tile_dedup) tiles - представление, там такой ключ уже у tile_refs
+OFFLINE_INDEX = """CREATE INDEX IF NOT EXISTS idx_tiles_server ON tiles (server, zoom, x, y);"""
+
+# Стандарт MBTiles 1.3: одна карта на файл, строки тайлов в схеме TMS (ось y снизу вверх)
+MBTILES_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);""",
+    """CREATE UNIQUE INDEX IF NOT EXISTS metadata_name ON metadata (name);""",
+    """CREATE TABLE IF NOT EXISTS tiles (
+            zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);""",
+    """CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);""",
+)
+
+Bounds = Tuple[int, int, int, int]      # x0, y0, x1, y1 (номера тайлов, включительно)
+
+
+class TileStore:
+    """
+    Хранилище тайлов в SQLite с настроенными соединениями.
+
+    - У каждого потока своё соединение, оно создаётся один раз и переиспользуется
+      (потоки загрузки карты и pre_cache не открывают базу на каждый запрос);
+    - WAL: чтение тайлов не блокируется записью загрузчика;
+    - mmap_size: страницы базы читаются через отображение файла, без копирования в кэш SQLite;
+    - запросы - постоянные строки, sqlite3 держит их подготовленными (cached_statements).
+
+    read_only=True - только чтение (карта): файл открывается с mode=ro и не меняется,
+    ни режим журнала, ни схема, ни индексы. Так можно читать базу с носителя только для чтения.
+    WAL и индексы включают только программы, которые пишут (загрузчик тайлов).
+    """
+
+    schema: Sequence[str] = ()
+
+    def __init__(self, path: str, mmap_size: int = MMAP_SIZE, wal: bool = True, read_only: bool = False):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.read_only = read_only
+        self.wal = wal and not read_only
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._init_schema()
+
+    def connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self.read_only:
+                connection = sqlite3.connect(f"file:{quote(os.path.abspath(self.path))}?mode=ro", uri=True,
+                                             timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS,
+                                             check_same_thread=False)
+            else:
+                connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS,
+                                             check_same_thread=False)
+            connection.execute(f"PRAGMA mmap_size={int(self.mmap_size)};")
+            connection.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB};")
+            connection.execute("PRAGMA temp_store=MEMORY;")
+            # В WAL полная синхронизация на каждую транзакцию не нужна для целостности
+            connection.execute("PRAGMA synchronous=NORMAL;")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _init_schema(self) -> None:
+        if self.read_only:
+            return
+        connection = self.connection()
+        if self.wal:
+            # Режим WAL сохраняется в файле базы - достаточно включить один раз
+            connection.execute("PRAGMA journal_mode=WAL;")
+        with connection:
+            for statement in self.schema:
+                connection.execute(statement)
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    # --- интерфейс хранилища ---
+
+    def get(self, server: str, zoom: int, x: int, y: int) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def existing(self, server: str, zoom: int, bounds: Bounds) -> set:
+        """Множество (x, y) уже сохранённых тайлов в прямоугольнике bounds"""
+        raise NotImplementedError
+
+    def put_many(self, server: str, rows: Iterable[Tuple[int, int, int, bytes]]) -> None:
+        """Запись тайлов (zoom, x, y, данные) одной транзакцией"""
+        raise NotImplementedError
+
+    def add_server(self, server: str, max_zoom: int) -> None:
+        pass
+
+    def add_section(self, server: str, position_a, position_b, zoom_a: int, zoom_b: int) -> None:
+        """Отметка о полностью загруженной области"""
+        pass
+
+
+class OfflineTileStore(TileStore):
+    """Файл offline_tiles.db в схеме tkintermapview (тайлы нескольких серверов в одной базе)"""
+
+    schema = OFFLINE_SCHEMA
+
+    def _init_schema(self) -> None:
+        super()._init_schema()
+        if self.read_only:
+            return
+        connection = self.connection()
+        row = connection.execute("SELECT type FROM sqlite_master WHERE name='tiles';").fetchone()
+        if row is not None and row[0] == "table":
+            with connection:
+                connection.execute(OFFLINE_INDEX)
+
+    def get(self, server: str, zoom: int, x: int, y: int) -> Optional[bytes]:
+        row = self.connection().execute(
+            "SELECT tile_image FROM tiles WHERE zoom=? AND x=? AND y=? AND server=?;",
+            (zoom, x, y, server)).fetchone()
+        return row[0] if row is not None else None
+
+    def existing(self, server: str, zoom: int, bounds: Bounds) -> set:
+        x0, y0, x1, y1 = bounds
+        return set(self.connection().execute(
+            "SELECT x, y FROM tiles WHERE server=? AND zoom=? AND x BETWEEN ? AND ? AND y BETWEEN ? AND ?;",
+            (server, zoom, x0, x1, y0, y1)))
+
+    def put_many(self, server: str, rows: Iterable[Tuple[int, int, int, bytes]]) -> None:
+        connection = self.connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO tiles (zoom, x, y, server, tile_image) VALUES (?, ?, ?, ?, ?);",
+                ((zoom, x, y, server, data) for zoom, x, y, data in rows))
+
+    def add_server(self, server: str, max_zoom: int) -> None:
+        connection = self.connection()
+        with connection:
+            connection.execute("INSERT OR IGNORE INTO server (url, max_zoom) VALUES (?, ?);", (server, max_zoom))
+
+    def add_section(self, server: str, position_a, position_b, zoom_a: int, zoom_b: int) -> None:
+        connection = self.connection()
+        with connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO sections (position_a, position_b, zoom_a, zoom_b, server) "
+                "VALUES (?, ?, ?, ?, ?);",
+                (str(tuple(position_a)), str(tuple(position_b)), zoom_a, zoom_b, server))
+
+
+class MBTilesStore(TileStore):
+    """
+    Файл MBTiles (карты из других программ). В файле одна карта, поэтому сервер не учитывается.
+    tile_row хранится в схеме TMS: y_tms = 2^zoom - 1 - y.
+    """
+
+    schema = MBTILES_SCHEMA
+
+    def get(self, server: str, zoom: int, x: int, y: int) -> Optional[bytes]:
+        row = self.connection().execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?;",
+            (zoom, x, (1 << zoom) - 1 - y)).fetchone()
+        return row[0] if row is not None else None
+
+    def existing(self, server: str, zoom: int, bounds: Bounds) -> set:
+        x0, y0, x1, y1 = bounds
+        flip = (1 << zoom) - 1
+        rows = self.connection().execute(
+            "SELECT tile_column, tile_row FROM tiles "
+            "WHERE zoom_level=? AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?;",
+            (zoom, x0, x1, flip - y1, flip - y0))
+        return {(x, flip - row) for x, row in rows}
+
+    def put_many(self, server: str, rows: Iterable[Tuple[int, int, int, bytes]]) -> None:
+        connection = self.connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?);",
+                ((zoom, x, (1 << zoom) - 1 - y, data) for zoom, x, y, data in rows))
+
+    def metadata(self) -> dict:
+        return dict(self.connection().execute("SELECT name, value FROM metadata;"))
+
+    def set_metadata(self, **values) -> None:
+        connection = self.connection()
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?);",
+                                   [(name, str(value)) for name, value in values.items()])
+
+    def add_server(self, server: str, max_zoom: int) -> None:
+        # Обязательные поля метаданных MBTiles, если файл создаём мы
+        current = self.metadata()
+        defaults = {"name": os.path.splitext(os.path.basename(self.path))[0], "format": "png",
+                    "type": "baselayer", "version": "1.0", "description": server}
+        missing = {name: value for name, value in defaults.items() if name not in current}
+        if missing:
+            self.set_metadata(**missing)
+
+    def add_section(self, server: str, position_a, position_b, zoom_a: int, zoom_b: int) -> None:
+        current = self.metadata()
+        lats = (position_a[0], position_b[0])
+        lons = (position_a[1], position_b[1])
+        values = {"bounds": f"{min(lons)},{min(lats)},{max(lons)},{max(lats)}"}
+        if "bounds" in current:
+            west, south, east, north = (float(v) for v in current["bounds"].split(","))
+            values["bounds"] = f"{min(west, *lons)},{min(south, *lats)},{max(east, *lons)},{max(north, *lats)}"
+        values["minzoom"] = min(zoom_a, int(current.get("minzoom", zoom_a)))
+        values["maxzoom"] = max(zoom_b, int(current.get("maxzoom", zoom_b)))
+        self.set_metadata(**values)
+
+
+def open_tile_store(path: str, **kwargs) -> TileStore:
+    """Хранилище по расширению файла: .mbtiles - MBTiles, иначе - схема tkintermapview"""
+    if os.path.splitext(path)[1].lower() == ".mbtiles":
+        return MBTilesStore(path, **kwargs)
+    return OfflineTileStore(path, **kwargs)
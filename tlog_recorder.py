@@ -0,0 +1,387 @@
+# tlog_recorder.py
+
+import mmap
+import os
+import struct
+import threading
+import time
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import Dict, Iterator, Optional, Tuple
+
+from pymavlink import mavutil
+
+from mavlink_reader import get_reader
+
+TLOG_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+TLOG_PREFIX = "flight"
+TLOG_MAX_BYTES = 256 * 2 ** 20  # Новый файл после стольких байт ...
+TLOG_MAX_SECONDS = 60 * 60      # ... или стольких секунд записи
+FLUSH_SECONDS = 0.5             # Поток записи сбрасывает накопленное не реже этого
+FLUSH_BYTES = 256 * 1024        # ... или как только накопилось столько
+FILE_BUFFER = 1024 * 1024       # Буфер файла: на диск уходят крупные куски
+MAX_PENDING = 200000            # Сообщений в очереди записи; при отставании диска теряются самые старые
+INDEX_INTERVAL_US = 1000000     # Шаг индекса по времени (микросекунды)
+
+# Формат tlog (Mission Planner, pymavlink mavlogfile): 8 байт времени в микросекундах от эпохи (big-endian)
+# и следом MAVLink-кадр как есть
+TLOG_TIME = struct.Struct(">Q")
+
+# Индекс рядом с логом (.tlog.idx): заголовок и записи (msgid, время мкс, смещение в .tlog).
+# msgid = -1 - начало блока времени (раз в INDEX_INTERVAL_US), иначе - первое сообщение этого типа в блоке.
+# Записи только дописываются, поэтому индекс прерванной записи остаётся пригодным
+INDEX_MAGIC = b"MGTIDX1\0"
+INDEX_RECORD = struct.Struct("<iQQ")
+INDEX_SUFFIX = ".idx"
+BLOCK_ID = -1
+
+MAVLINK_V1_MAGIC = 0xFE
+MAVLINK_V2_MAGIC = 0xFD
+MAVLINK_SIGNED = 0x01
+
+
+def frame_info(buffer, start: int) -> Optional[Tuple[int, int]]:
+    """(msgid, длина кадра) MAVLink-кадра с позиции start или None, если там не кадр или он обрезан"""
+    size = len(buffer)
+    if start + 2 > size:
+        return None
+    magic = buffer[start]
+    payload = buffer[start + 1]
+    if magic == MAVLINK_V2_MAGIC:
+        if start + 10 > size:
+            return None
+        length = 12 + payload + (13 if buffer[start + 2] & MAVLINK_SIGNED else 0)
+        msgid = buffer[start + 7] | buffer[start + 8] << 8 | buffer[start + 9] << 16
+    elif magic == MAVLINK_V1_MAGIC:
+        if start + 6 > size:
+            return None
+        length = 8 + payload
+        msgid = buffer[start + 5]
+    else:
+        return None
+    if start + length > size:
+        return None
+    return msgid, length
+
+
+def iter_records(buffer, offset: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, int, int, int]]:
+    """
+    Записи tlog из bytes/mmap: (смещение записи, время мкс, msgid, длина кадра).
+    Останавливается на первой испорченной или обрезанной записи (хвост лога после сбоя).
+    """
+    end = len(buffer) if end is None else end
+    while offset + TLOG_TIME.size < end:
+        time_us, = TLOG_TIME.unpack_from(buffer, offset)
+        info = frame_info(buffer, offset + TLOG_TIME.size)
+        if info is None:
+            return
+        msgid, length = info
+        yield offset, time_us, msgid, length
+        offset += TLOG_TIME.size + length
+
+
+def message_id(msg_type: str) -> int:
+    """Номер сообщения MAVLink по имени ("GLOBAL_POSITION_INT" -> 33)"""
+    return getattr(mavutil.mavlink, f"MAVLINK_MSG_ID_{msg_type.upper()}")
+
+
+class TlogIndex:
+    """
+    Индекс tlog в памяти: время -> смещение блока, тип -> блоки, где он встречается.
+    Поиск по времени - бинарный, без чтения самого лога.
+    """
+
+    def __init__(self):
+        self.times = array("Q")
+        self.offsets = array("Q")
+        self.types: Dict[int, Tuple[array, array]] = {}     # msgid -> (времена, смещения)
+
+    @classmethod
+    def load(cls, tlog_path: str, buffer=None) -> "TlogIndex":
+        """
+        Индекс из .tlog.idx; если его нет - строится проходом по логу и сохраняется.
+        buffer - уже открытое отображение лога (mmap), иначе лог отображается здесь:
+        логи чужих программ без индекса в память целиком не читаются.
+        """
+        index_path = tlog_path + INDEX_SUFFIX
+        index = cls()
+        has_index = os.path.exists(index_path)
+        if has_index:
+            with open(index_path, "rb") as f:
+                data = f.read()
+            if data.startswith(INDEX_MAGIC):
+                body = memoryview(data)[len(INDEX_MAGIC):]
+                body = body[:len(body) - len(body) % INDEX_RECORD.size]
+                for msgid, time_us, offset in INDEX_RECORD.iter_unpack(body):
+                    index.add(msgid, time_us, offset)
+        # Хвост, который не попал в индекс (запись прервали), дочитываем из лога
+        size = os.path.getsize(tlog_path)
+        start = index.offsets[-1] if len(index.offsets) else 0
+        if start < size:
+            if buffer is not None:
+                index._scan(buffer, start)
+            else:
+                with open(tlog_path, "rb") as f, mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mapped:
+                    index._scan(mapped, start)
+        if not has_index:
+            index.save(index_path)
+        return index
+
+    def save(self, index_path: str) -> None:
+        records = [(offset, BLOCK_ID, time_us) for time_us, offset in zip(self.times, self.offsets)]
+        for msgid, (times, offsets) in self.types.items():
+            records.extend((offset, msgid, time_us) for time_us, offset in zip(times, offsets))
+        records.sort()
+        with open(index_path, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(b"".join(INDEX_RECORD.pack(msgid, time_us, offset) for offset, msgid, time_us in records))
+
+    def add(self, msgid: int, time_us: int, offset: int) -> None:
+        if msgid == BLOCK_ID:
+            self.times.append(time_us)
+            self.offsets.append(offset)
+        else:
+            entry = self.types.get(msgid)
+            if entry is None:
+                entry = self.types[msgid] = (array("Q"), array("Q"))
+            entry[0].append(time_us)
+            entry[1].append(offset)
+
+    def _scan(self, buffer, start: int) -> None:
+        builder = _IndexBuilder(self.add)
+        if len(self.times):
+            # Продолжаем последний блок, не дублируя его начало
+            builder.block_start = self.times[-1]
+            builder.seen = {msgid for msgid, (times, _) in self.types.items() if times[-1] >= self.times[-1]}
+        for offset, time_us, msgid, length in iter_records(buffer, start):
+            builder.record(time_us, msgid, offset)
+
+    @property
+    def start_time(self) -> Optional[int]:
+        return self.times[0] if len(self.times) else None
+
+    def seek_time(self, time_us: int) -> int:
+        """Смещение блока, с которого надо читать, чтобы не пропустить сообщения после time_us"""
+        i = bisect_right(self.times, time_us) - 1
+        return self.offsets[i] if i >= 0 else 0
+
+    def seek_type(self, msg_type, time_us: int = 0) -> Optional[int]:
+        """
+        Смещение, с которого читать, чтобы найти первое сообщение типа msg_type (имя или номер)
+        не раньше time_us: первое появление типа в блоке с time_us или позже. None - дальше типа нет.
+        """
+        msgid = message_id(msg_type) if isinstance(msg_type, str) else msg_type
+        entry = self.types.get(msgid)
+        if entry is None:
+            return None
+        offsets = entry[1]
+        i = bisect_left(offsets, self.seek_time(time_us))
+        return offsets[i] if i < len(offsets) else None
+
+
+class _IndexBuilder:
+    """Решает, какие записи попадают в индекс: начало блока и первое сообщение типа в блоке"""
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.block_start = None
+        self.seen = set()
+
+    def record(self, time_us: int, msgid: int, offset: int) -> None:
+        # Время блоков только растёт: отправленные и принятые сообщения могут идти чуть не по порядку
+        if self.block_start is None or time_us >= self.block_start + INDEX_INTERVAL_US:
+            self.block_start = time_us
+            self.seen.clear()
+            self.emit(BLOCK_ID, time_us, offset)
+        if msgid not in self.seen:
+            self.seen.add(msgid)
+            self.emit(msgid, time_us, offset)
+
+
+class TlogRecorder:
+    """
+    Запись всех сообщений соединения (принятых и отправленных) в .tlog с индексом.
+
+    Поток чтения MAVLink только кладёт (время, кадр) в очередь - без работы с диском.
+    Отдельный поток раз в FLUSH_SECONDS пишет накопленное одним куском через большой буфер файла,
+    заодно строит индекс. Файл меняется по размеру (max_bytes) или времени (max_seconds).
+    """
+
+    def __init__(self, master: mavutil.mavlink_connection, directory: str = TLOG_DIRECTORY,
+                 prefix: str = TLOG_PREFIX, max_bytes: int = TLOG_MAX_BYTES, max_seconds: float = TLOG_MAX_SECONDS):
+        self.master = master
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+
+        self.path = None            # Текущий файл
+        self.files = []             # Все записанные файлы
+        self.messages = 0
+        self.bytes = 0
+        self.dropped = 0
+
+        self._pending = deque(maxlen=MAX_PENDING)
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread = None
+        self._file = None
+        self._index_file = None
+        self._index = None
+        self._file_size = 0
+        self._file_started = 0.0
+        self._reader = None
+
+    # --- поток чтения / отправки ---
+
+    def _on_message(self, msg) -> None:
+        pending = self._pending
+        if len(pending) == MAX_PENDING:
+            self.dropped += 1
+        # _timestamp ставит mavutil при приёме - время прихода, а не записи
+        pending.append((int(getattr(msg, "_timestamp", 0) * 1e6) or int(time.time() * 1e6),
+                        msg.get_msgbuf(), msg.get_msgId()))
+
+    def _on_send(self, msg) -> None:
+        pending = self._pending
+        if len(pending) == MAX_PENDING:
+            self.dropped += 1
+        pending.append((int(time.time() * 1e6), msg.get_msgbuf(), msg.get_msgId()))
+
+    # --- управление ---
+
+    def start(self) -> None:
+        if self._running:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._running = True
+        self._open_file()
+        self._thread = threading.Thread(target=self._run, name="TlogRecorder", daemon=True)
+        self._thread.start()
+        self._reader = get_reader(self.master)
+        self._reader.add_callback(self._on_message)
+        mav = self.master.mav
+        if getattr(mav, "send_callback", None) is None:
+            mav.set_send_callback(self._on_send)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if not self._running:
+            return
+        if self._reader is not None:
+            self._reader.remove_callback(self._on_message)
+        mav = self.master.mav
+        if getattr(mav, "send_callback", None) == self._on_send:
+            mav.send_callback = None
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # --- поток записи ---
+
+    def _run(self) -> None:
+        try:
+            while self._running:
+                self._wakeup.wait(FLUSH_SECONDS)
+                self._wakeup.clear()
+                self._write_pending()
+            self._write_pending()
+        finally:
+            self._close_file()
+
+    def _write_pending(self) -> None:
+        pending = self._pending
+        chunks = []
+        chunk_bytes = 0
+        while pending:
+            time_us, frame, msgid = pending.popleft()
+            if self._needs_rotation(chunk_bytes):
+                self._flush(chunks)
+                chunks, chunk_bytes = [], 0
+                self._close_file()
+                self._open_file()
+            offset = self._file_size + chunk_bytes
+            self._index.record(time_us, msgid, offset)
+            chunks.append(TLOG_TIME.pack(time_us))
+            chunks.append(frame)
+            chunk_bytes += TLOG_TIME.size + len(frame)
+            self.messages += 1
+            if chunk_bytes >= FLUSH_BYTES:
+                self._flush(chunks)
+                chunks, chunk_bytes = [], 0
+        self._flush(chunks)
+
+    def _needs_rotation(self, chunk_bytes: int) -> bool:
+        if self._file_size + chunk_bytes == 0:
+            return False
+        return (self._file_size + chunk_bytes >= self.max_bytes
+                or time.monotonic() - self._file_started >= self.max_seconds)
+
+    def _flush(self, chunks) -> None:
+        if not chunks:
+            return
+        data = b"".join(chunks)
+        self._file.write(data)
+        self._file.flush()
+        self._file_size += len(data)
+        self.bytes += len(data)
+        # Индекс - после данных: он никогда не ссылается дальше того, что уже в логе
+        self._index_file.flush()
+
+    def _open_file(self) -> None:
+        stamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+        path = os.path.join(self.directory, f"{self.prefix}_{stamp}.tlog")
+        number = 1
+        while os.path.exists(path):
+            number += 1
+            path = os.path.join(self.directory, f"{self.prefix}_{stamp}_{number}.tlog")
+        self.path = path
+        self.files.append(path)
+        self._file = open(path, "wb", buffering=FILE_BUFFER)
+        self._index_file = open(path + INDEX_SUFFIX, "wb", buffering=FILE_BUFFER)
+        self._index_file.write(INDEX_MAGIC)
+        self._index = _IndexBuilder(lambda msgid, time_us, offset:
+                                    self._index_file.write(INDEX_RECORD.pack(msgid, time_us, offset)))
+        self._file_size = 0
+        self._file_started = time.monotonic()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._index_file.close()
+            self._file = self._index_file = None
+
+    def __str__(self):
+        return (f"{os.path.basename(self.path or '')}: {self.messages} сообщений, "
+                f"{self.bytes / 2 ** 20:.1f} МБ, файлов {len(self.files)}, потеряно {self.dropped}")
+
+
+# Одна запись на соединение
+_recorders = weakref.WeakKeyDictionary()
+_recorders_lock = threading.Lock()
+
+
+def start_recording(master: mavutil.mavlink_connection, **kwargs) -> TlogRecorder:
+    """Запускает (или возвращает уже запущенную) запись соединения в tlog"""
+    with _recorders_lock:
+        recorder = _recorders.get(master)
+        if recorder is None:
+            recorder = TlogRecorder(master, **kwargs)
+            _recorders[master] = recorder
+        recorder.start()
+        return recorder
+
+
+def find_recorder(master: mavutil.mavlink_connection) -> Optional[TlogRecorder]:
+    return _recorders.get(master)
+
+
+def stop_recording(master: mavutil.mavlink_connection) -> None:
+    with _recorders_lock:
+        recorder = _recorders.pop(master, None)
+    if recorder is not None:
+        recorder.stop()
+        print(f"Запись телеметрии: {recorder}")
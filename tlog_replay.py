@@ -0,0 +1,216 @@
+# tlog_replay.py
+
+import mmap
+import os
+import threading
+import time
+
+from pymavlink import mavutil
+
+from tlog_recorder import TLOG_TIME, TlogIndex, frame_info, iter_records
+
+REPLAY_PREFIX = "replay:"       # Строка подключения: replay:путь.tlog[@скорость], скорость 0 или max - без пауз
+MAX_WAIT = 0.5                  # Дольше select() не спит, чтобы пауза и перемотка срабатывали сразу
+
+MAVLINK_V1_MAGIC = 0xFE
+
+
+class TlogReplay(mavutil.mavfile):
+    """
+    Соединение, которое вместо сокета читает записанный .tlog - для MavlinkReader, телеметрии,
+    карты и статус-бара это обычный mavlink_connection.
+
+    - Файл отображается в память (mmap): лог любого размера не загружается в RAM целиком;
+    - сообщения выдаются по времени лога: speed=1 - как в полёте, N - в N раз быстрее,
+      0 - без пауз (нагрузочный прогон);
+    - перемотка seek() по индексу .tlog.idx (TlogIndex), без чтения лога с начала;
+    - свои же сообщения наземной станции (source_system) из лога не выдаются,
+      а всё, что отправляется в соединение, отбрасывается.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, source_system: int = 255, source_component: int = 0,
+                 loop: bool = False, skip_own: bool = True):
+        self.path = path
+        self.loop = loop
+        self.skip_own = skip_own
+        self._file = open(path, "rb")
+        size = os.path.getsize(path)
+        self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ) if size else b""
+        self.index = TlogIndex.load(path, self._map)
+        super().__init__(None, path, source_system=source_system, source_component=source_component)
+
+        self.log_start = self.index.start_time or 0
+        self.log_end = self._find_end_time()
+        self.finished = False
+        self.messages_sent = 0          # Отброшенные отправки (команды, HEARTBEAT станции)
+
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._offset = 0
+        self._speed = speed
+        self._paused = False
+        self._anchor_log = self.log_start
+        self._anchor_wall = time.monotonic()
+        self._next_due = None
+
+    # --- управление воспроизведением (из любого потока) ---
+
+    @property
+    def speed(self) -> float:
+        return self._speed
+
+    @speed.setter
+    def speed(self, value: float) -> None:
+        with self._lock:
+            self._reanchor()
+            self._speed = value
+        self._wakeup.set()
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    def pause(self) -> None:
+        with self._lock:
+            self._reanchor()
+            self._paused = True
+
+    def resume(self) -> None:
+        with self._lock:
+            if self._paused:
+                # Продолжаем с того же места лога: отсчёт времени - с момента возобновления
+                self._paused = False
+                self._anchor_wall = time.monotonic()
+                self._next_due = None
+        self._wakeup.set()
+
+    @property
+    def position(self) -> float:
+        """Текущее место воспроизведения, секунды от начала лога"""
+        now = self._anchor_log if self._paused else self._log_time_now()
+        return min(max(0, now - self.log_start), self.log_end - self.log_start) / 1e6
+
+    @property
+    def duration(self) -> float:
+        return (self.log_end - self.log_start) / 1e6
+
+    def seek(self, seconds: float) -> None:
+        """Перемотка на seconds от начала лога: блок по индексу, дальше - только заголовки записей"""
+        target = self.log_start + int(max(0.0, seconds) * 1e6)
+        with self._lock:
+            offset = self.index.seek_time(target)
+            for offset, time_us, msgid, length in iter_records(self._map, offset):
+                if time_us >= target:
+                    break
+            else:
+                offset = len(self._map)
+            self._offset = offset
+            self.finished = False
+            self._anchor_log = target
+            self._anchor_wall = time.monotonic()
+            self._next_due = None
+        self._wakeup.set()
+
+    # --- интерфейс mavfile ---
+
+    def recv_msg(self):
+        with self._lock:
+            while True:
+                if self._paused:
+                    return None
+                info = frame_info(self._map, self._offset + TLOG_TIME.size)
+                if info is None:
+                    if self.loop and self._offset > 0:
+                        self.seek(0)
+                        continue
+                    self.finished = True
+                    return None
+                time_us, = TLOG_TIME.unpack_from(self._map, self._offset)
+                if self._speed > 0:
+                    due = self._anchor_wall + (time_us - self._anchor_log) / 1e6 / self._speed
+                    if due > time.monotonic():
+                        self._next_due = due
+                        return None
+                msgid, length = info
+                start = self._offset + TLOG_TIME.size
+                self._offset = start + length
+                if self.skip_own and self._source_of(start) == self.source_system:
+                    continue
+                try:
+                    msg = self.mav.decode(bytearray(self._map[start:start + length]))
+                except mavutil.mavlink.MAVError:
+                    continue
+                # Время сообщения - время лога (как у mavlogfile), а не момент воспроизведения
+                self._timestamp = time_us / 1e6
+                self.post_message(msg)
+                return msg
+
+    def select(self, timeout):
+        """Ждёт до времени следующего сообщения (или timeout); пауза и перемотка будят сразу"""
+        wait = min(timeout, MAX_WAIT)
+        due = self._next_due
+        if due is not None and not self._paused and not self.finished:
+            wait = max(0.0, min(wait, due - time.monotonic()))
+        self._wakeup.wait(wait)
+        self._wakeup.clear()
+        return not self.finished
+
+    def recv(self, n=None):
+        return b""
+
+    def write(self, buf):
+        self.messages_sent += 1
+
+    def close(self):
+        self._wakeup.set()
+        with self._lock:
+            if isinstance(self._map, mmap.mmap):
+                self._map.close()
+            self._map = b""
+            self._file.close()
+
+    # --- внутреннее ---
+
+    def _source_of(self, start: int) -> int:
+        return self._map[start + 3] if self._map[start] == MAVLINK_V1_MAGIC else self._map[start + 5]
+
+    def _log_time_now(self) -> int:
+        if self._speed <= 0:
+            # Без пауз "сейчас" - время последнего выданного сообщения
+            return int(self._timestamp * 1e6) if self._timestamp else self._anchor_log
+        return self._anchor_log + int((time.monotonic() - self._anchor_wall) * self._speed * 1e6)
+
+    def _reanchor(self) -> None:
+        # Новая точка отсчёта: с неё считаются паузы при другой скорости или после паузы
+        if not self._paused:
+            self._anchor_log = self._log_time_now()
+        self._anchor_wall = time.monotonic()
+        self._next_due = None
+
+    def _find_end_time(self) -> int:
+        end = self.log_start
+        for _, time_us, _, _ in iter_records(self._map, self.index.offsets[-1] if len(self.index.offsets) else 0):
+            end = time_us
+        return end
+
+
+def parse_replay(connection_string: str):
+    """'replay:путь[@скорость]' -> (путь, скорость) или None, если это не воспроизведение"""
+    if not connection_string.startswith(REPLAY_PREFIX):
+        return None
+    path, speed = connection_string[len(REPLAY_PREFIX):], 1.0
+    if "@" in path:
+        path, value = path.rsplit("@", 1)
+        speed = 0.0 if value.lower() in ("0", "max", "inf") else float(value.rstrip("xх"))
+    return path, speed
+
+
+def open_connection(connection_string: str, source_system: int = 255, source_component: int = 0):
+    """mavutil.mavlink_connection, который дополнительно понимает replay:лог.tlog[@скорость]"""
+    replay = parse_replay(connection_string)
+    if replay is not None:
+        path, speed = replay
+        return TlogReplay(path, speed, source_system=source_system, source_component=source_component)
+    return mavutil.mavlink_connection(connection_string,
+                                      source_system=source_system, source_component=source_component)
+
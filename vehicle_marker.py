@@ -0,0 +1,161 @@
+# vehicle_marker.py
+
+import math
+from typing import Callable, Optional
+
+from extended_mapview import OVERLAY_TAG
+
+FRAME_MS = 50               # Не чаще одной перерисовки за кадр (20 кадров/с)
+
+VEHICLE_COLOR = 'cyan'
+VEHICLE_OUTLINE = 'black'
+VEHICLE_TEXT_COLOR = 'cyan'
+VEHICLE_TEXT_FONT = ("Tahoma", 10, "bold")
+
+# Стрелка аппарата в пикселях относительно его позиции (нос вверх = курс 0)
+ARROW_SHAPE = ((0, -16), (10, 11), (0, 5), (-10, 11))
+
+# Смещения меньше этих не перерисовываем (пиксели и градусы)
+MIN_MOVE_PX = 0.5
+MIN_TURN_DEG = 1.0
+
+
+class VehicleMarker:
+    """
+    Текущее положение аппарата на ExtendedMapView: стрелка по курсу и подпись.
+    Телеметрия может приходить с частотой 10-50 Гц, но canvas обновляется
+    не чаще одного раза за FRAME_MS: новые данные только запоминаются,
+    а рисуется последнее состояние на момент кадра.
+    Элементы canvas создаются один раз и дальше только сдвигаются (coords).
+    Все методы вызываются из потока Tkinter.
+    """
+
+    def __init__(self, map_widget, text: Optional[str] = None, color: str = VEHICLE_COLOR,
+                 outline: str = VEHICLE_OUTLINE, text_color: str = VEHICLE_TEXT_COLOR):
+        self.map_widget = map_widget
+        self.canvas = map_widget.canvas
+        self.text = text
+        self.color = color
+        self.outline = outline
+        self.text_color = text_color
+
+        self.position = None        # (lat, lon)
+        self.heading = None         # градусы, 0 - север
+
+        self._arrow = None
+        self._label = None
+        self._drawn = None          # (x, y, heading) последней отрисовки
+        self._frame_id = None
+        self._get_state = None
+        self._last_update = None
+
+        map_widget.add_overlay(self)
+
+    # --- данные ---
+
+    def set_position(self, lat: float, lon: float, heading: Optional[float] = None) -> None:
+        """Новое положение; сама перерисовка - в ближайшем кадре"""
+        self.position = (lat, lon)
+        if heading is not None:
+            self.heading = heading
+        self._request_frame()
+
+    def track(self, get_state: Callable) -> None:
+        """
+        Следить за состоянием аппарата: get_state() возвращает DroneState (или None).
+        Состояние читается раз в кадр, поэтому частота телеметрии на GUI не влияет.
+        """
+        self._get_state = get_state
+        self._last_update = None
+        self._request_frame()
+
+    def stop_tracking(self) -> None:
+        self._get_state = None
+        if self._frame_id is not None:
+            self.map_widget.after_cancel(self._frame_id)
+            self._frame_id = None
+
+    def hide(self) -> None:
+        self.position = None
+        self._delete_items()
+
+    def delete(self) -> None:
+        self.stop_tracking()
+        self._delete_items()
+        self.map_widget.remove_overlay(self)
+
+    # --- кадры ---
+
+    def _request_frame(self) -> None:
+        if self._frame_id is None:
+            self._frame_id = self.map_widget.after(FRAME_MS, self._on_frame)
+
+    def _on_frame(self) -> None:
+        self._frame_id = None
+        if self._get_state is not None:
+            state = self._get_state()
+            # updates меняется на каждое сообщение - без изменений ничего не читаем и не рисуем
+            if state is not None and state.updates != self._last_update and state.lat is not None:
+                self._last_update = state.updates
+                self.position = (state.lat, state.lon)
+                self.heading = state.heading
+                # Карта заранее подгружает тайлы впереди по курсу
+                hint = getattr(self.map_widget, 'set_vehicle_hint', None)
+                if hint is not None:
+                    hint(state.lat, state.lon, state.heading, state.groundspeed)
+            # Пока следим за аппаратом, кадры идут постоянно (опрос O(1))
+            self._request_frame()
+        self.draw()
+
+    # --- отрисовка (вызывается и картой при сдвиге/зуме) ---
+
+    def draw(self) -> None:
+        if self.position is None:
+            return
+        x, y = self.map_widget.canvas_coords(*self.position)
+        heading = self.heading or 0.0
+
+        if self._arrow is not None and self._drawn is not None:
+            last_x, last_y, last_heading = self._drawn
+            if (abs(x - last_x) < MIN_MOVE_PX and abs(y - last_y) < MIN_MOVE_PX
+                    and abs(heading - last_heading) < MIN_TURN_DEG):
+                return
+
+        points = self._arrow_points(x, y, heading)
+        if self._arrow is None:
+            self._arrow = self.canvas.create_polygon(*points, fill=self.color, outline=self.outline,
+                                                     width=2, tag=(OVERLAY_TAG, "vehicle"))
+        else:
+            self.canvas.coords(self._arrow, *points)
+
+        if self.text:
+            if self._label is None:
+                self._label = self.canvas.create_text(x, y - 22, text=self.text, fill=self.text_color,
+                                                      font=VEHICLE_TEXT_FONT, tag=(OVERLAY_TAG, "vehicle"))
+            else:
+                self.canvas.coords(self._label, x, y - 22)
+
+        if self._drawn is None:
+            self.map_widget.manage_z_order()
+        self._drawn = (x, y, heading)
+
+    @staticmethod
+    def _arrow_points(x: float, y: float, heading: float) -> list:
+        # Поворот по часовой стрелке (ось y на canvas направлена вниз)
+        angle = math.radians(heading)
+        cos_a = math.cos(angle)
+        sin_a = math.sin(angle)
+        points = []
+        for px, py in ARROW_SHAPE:
+            points.append(x + px * cos_a - py * sin_a)
+            points.append(y + px * sin_a + py * cos_a)
+        return points
+
+    def _delete_items(self) -> None:
+        if self._arrow is not None:
+            self.canvas.delete(self._arrow)
+        if self._label is not None:
+            self.canvas.delete(self._label)
+        self._arrow = None
+        self._label = None
+        self._drawn = None